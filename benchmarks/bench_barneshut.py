@@ -0,0 +1,63 @@
+"""
+Barnes-Hut accuracy and speed against the exact vector engine.
+
+For each body count and opening angle print the force step time and the
+relative force error per body compared with the all pairs result.
+
+   python3 benchmarks/bench_barneshut.py [bodyCount ...]
+"""
+
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forces
+import gravity
+
+
+THETAS = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+def timeForces(engine, positions, masses, G, out, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine.sumForces(positions, masses, G, out)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(bodyCounts):
+    numpy.random.seed(1)
+    G = gravity.G * 2.0e7
+    print(f"{'bodies':>8} {'engine':>10} {'theta':>6} {'step s':>9}"
+          f" {'median err':>11} {'max err':>9}")
+    for bodyCount in bodyCounts:
+        positions = numpy.random.rand(bodyCount, 3) * 400.0 - 200.0
+        masses = numpy.random.rand(bodyCount) * 500.0 + 4500.0
+        exact = numpy.empty((bodyCount, 3))
+        vecTime = timeForces(forces.VectorForces(), positions, masses, G,
+                             exact, repeat=1)
+        print(f"{bodyCount:8d} {'vector':>10} {'':>6} {vecTime:9.4f}")
+
+        approx = numpy.empty((bodyCount, 3))
+        for theta in THETAS:
+            if theta == 0.0 and bodyCount > 5000:
+                continue    # exact tree walk, too slow to be interesting
+            engine = forces.BarnesHutForces()
+            engine.setOptions({ "openingAngle": theta })
+            bhTime = timeForces(engine, positions, masses, G, approx)
+            errs = (numpy.linalg.norm(approx - exact, axis=1) /
+                    numpy.linalg.norm(exact, axis=1))
+            print(f"{bodyCount:8d} {'barneshut':>10} {theta:6.2f}"
+                  f" {bhTime:9.4f} {numpy.median(errs):11.2e}"
+                  f" {errs.max():9.2e}")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 4000, 10000]
+    main(counts)
@@ -0,0 +1,269 @@
+"""
+Benchmark suite for the Gravity hot path.
+
+Times Gravity.createRandomBodies, sumForces, jumpOneSecond and mergeBodies
+for each body count with every force engine, recording operations per
+second, the peak resident set size and the force error against exact
+all pairs forces for a sample of bodies.  Each engine and body count runs
+in a fresh Python process so its peak memory is its own.  Body creation
+and merging do not use the force engine, they are timed once per count as
+engine "model".
+
+Results can be written as JSON and compared with a results file saved from
+a known good tree.  Operations that got slower than the baseline by more
+than the tolerance, or less accurate, are reported and the exit status is
+1, so a release script can stop on them.  Operations under TIME_FLOOR in
+both runs are too noisy for their speeds to be compared, only their
+errors are.
+
+   python3 benchmarks/bench_gravity.py --output base.json
+   python3 benchmarks/bench_gravity.py --baseline base.json
+
+baseline.json beside this script holds the results of the committed tree
+on a single core machine, timings are only comparable on that machine.
+
+Engines are skipped for body counts over their limit in LIMITS, unless
+--no-limits is given.  Peak RSS comes from resource.getrusage, which is not
+available on Windows.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forces
+import gravity
+
+
+BODY_COUNTS = (3, 100, 1000, 10000, 100000)
+LIMITS = { "loop"      : 1000,
+           "vector"    : 10000,
+           "tiled"     : 30000,
+           "threads"   : 30000,
+           "processes" : 30000,
+           "barneshut" : 100000,
+           "mesh"      : 100000 }
+MODEL = "model"          # engine name for the engine independent operations
+ERROR_SAMPLE = 256       # bodies checked against exact forces
+TIME_BUDGET = 2.0        # seconds of repeats per operation
+MIN_DURATION = 0.5       # seconds of repeats measured at least
+TIME_FLOOR = 1.0e-3      # seconds per operation too short to compare
+
+
+def peakRSSMB():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)     # bytes on macOS
+    return peak / 1024.0                    # kilobytes on Linux
+
+
+def timeOp(func, repeat, most=None):
+    """Median time of repeat calls, more until MIN_DURATION is measured and
+    fewer once TIME_BUDGET is spent, never over most calls"""
+    times = [ ]
+    spent = 0.0
+    while len(times) < repeat or spent < MIN_DURATION:
+        if most is not None and len(times) >= most:
+            break
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        spent += elapsed
+        if spent > TIME_BUDGET:
+            break
+    return float(numpy.median(times))
+
+
+def forceErrors(grav):
+    """Median and max relative force error of a sample of bodies against
+    exact all pairs sums for just those bodies"""
+    positions = grav.bodyPositions()
+    masses = grav.bodyMasses()
+    bodyCount = positions.shape[0]
+    rng = numpy.random.default_rng(2)
+    sample = numpy.sort(rng.choice(bodyCount, min(bodyCount, ERROR_SAMPLE),
+                                   replace=False))
+    exact = numpy.empty((sample.shape[0], 3))
+    forces.TiledForces().sumForces(positions, masses, grav.gravitation(),
+                                   exact, sample)
+    errs = (numpy.linalg.norm(grav._massForces[sample] - exact, axis=1) /
+            numpy.linalg.norm(exact, axis=1))
+    return float(numpy.median(errs)), float(errs.max())
+
+
+def newModel(engineName, bodyCount):
+    grav = gravity.Gravity()
+    if engineName != MODEL:
+        grav.setForceEngine(engineName)
+    grav.setBodyCount(bodyCount)
+    grav.setSeed(1)
+    grav.createRandomBodies()
+    return grav
+
+
+def runOne(engineName, bodyCount, repeat):
+    """Time the operations of one engine and body count in this process"""
+    grav = newModel(engineName, bodyCount)
+    results = [ ]
+
+    def addResult(op, seconds, errors=(None, None)):
+        results.append({ "engine"    : engineName,
+                         "bodies"    : bodyCount,
+                         "op"        : op,
+                         "seconds"   : seconds,
+                         "opsPerSec" : 1.0 / seconds if seconds else None,
+                         "medianErr" : errors[0],
+                         "maxErr"    : errors[1] })
+
+    try:
+        if engineName == MODEL:
+            addResult("createRandomBodies",
+                      timeOp(grav.createRandomBodies, repeat))
+            merges = min(repeat, bodyCount - 1)
+            if merges > 0:
+                addResult("mergeBodies",
+                          timeOp(lambda: grav.mergeBodies(0, 1), merges,
+                                 merges))
+        else:
+            # First sum outside the timing, it starts workers and buffers
+            grav.sumForces()
+            seconds = timeOp(grav.sumForces, repeat)
+            addResult("sumForces", seconds, forceErrors(grav))
+            addResult("jumpOneSecond", timeOp(grav.jumpOneSecond, repeat))
+    finally:
+        grav.close()
+
+    peakMB = peakRSSMB()
+    for result in results:
+        result["peakMB"] = peakMB
+    return results
+
+
+def runChild(engineName, bodyCount, repeat):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child",
+           engineName, str(bodyCount), str(repeat)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr.strip(), file=sys.stderr)
+        return None
+    return json.loads(proc.stdout)
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of each result slower or less accurate than the
+    matching baseline result.  Speeds are only compared when either time
+    reaches TIME_FLOOR, shorter calls vary by more than the tolerance from
+    run to run."""
+    baseResults = { (res["engine"], res["bodies"], res["op"]): res
+                    for res in baseline["results"] }
+    regressions = [ ]
+    for res in results:
+        base = baseResults.get((res["engine"], res["bodies"], res["op"]))
+        if base is None:
+            continue
+        name = f"{res['op']} {res['engine']} {res['bodies']} bodies"
+        timed = max(base["seconds"] or 0.0, res["seconds"] or 0.0)
+        if base["opsPerSec"] and res["opsPerSec"] and \
+           timed >= TIME_FLOOR and \
+           res["opsPerSec"] < base["opsPerSec"] * (1.0 - tolerance):
+            regressions.append(f"{name}: {res['opsPerSec']:.4g} ops/s, "
+                               f"baseline {base['opsPerSec']:.4g}")
+        if base["maxErr"] is not None and res["maxErr"] is not None and \
+           res["maxErr"] > max(2.0 * base["maxErr"], 1.0e-12):
+            regressions.append(f"{name}: max error {res['maxErr']:.3g}, "
+                               f"baseline {base['maxErr']:.3g}")
+    return regressions
+
+
+def printResult(res):
+    peak = "-" if res["peakMB"] is None else f"{res['peakMB']:.1f}"
+    medErr = "-" if res["medianErr"] is None else f"{res['medianErr']:.2e}"
+    maxErr = "-" if res["maxErr"] is None else f"{res['maxErr']:.2e}"
+    print(f"{res['bodies']:8d} {res['engine']:>10} {res['op']:>18}"
+          f" {res['opsPerSec']:11.4g} {peak:>9} {medErr:>10} {maxErr:>10}")
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the GUTS gravity hot path")
+    parser.add_argument("-b", "--bodies", type=int, nargs="+",
+                        default=list(BODY_COUNTS),
+                        help="body counts (default %(default)s)")
+    parser.add_argument("-e", "--engines", nargs="+",
+                        default=sorted(forces.ENGINES),
+                        choices=sorted(forces.ENGINES),
+                        help="force engines (default all)")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="least timed calls per operation, the median "
+                             "is kept (default 5)")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="run every engine at every body count")
+    parser.add_argument("-o", "--output", default=None,
+                        help="write results to this JSON file")
+    parser.add_argument("--baseline", default=None,
+                        help="compare with results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown fraction reported as a regression "
+                             "(default 0.25)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+
+    print(f"{'bodies':>8} {'engine':>10} {'op':>18} {'ops/s':>11}"
+          f" {'peak MB':>9} {'median err':>10} {'max err':>10}")
+    results = [ ]
+    for bodyCount in args.bodies:
+        for engineName in [MODEL] + args.engines:
+            limit = LIMITS.get(engineName)
+            if not args.no_limits and limit and bodyCount > limit:
+                continue
+            childResults = runChild(engineName, bodyCount, args.repeat)
+            if childResults is None:
+                print(f"{bodyCount:8d} {engineName:>10}    failed")
+                continue
+            for res in childResults:
+                printResult(res)
+            results.extend(childResults)
+
+    report = { "python"  : platform.python_version(),
+               "numpy"   : numpy.__version__,
+               "machine" : platform.machine(),
+               "cpus"    : os.cpu_count(),
+               "date"    : time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "results" : results }
+    if args.output:
+        with open(args.output, "w") as outFP:
+            json.dump(report, outFP, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseFP:
+            baseline = json.load(baseFP)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        result = runOne(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        print(json.dumps(result))
+    else:
+        sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Energy drift against force evaluations for each integrator.
+
+Each integrator runs the same random bodies for the same simulated time at
+several step sizes (tolerances for the adaptive and block integrators).  The
+relative change in total energy is reported with the number of force sums it
+took, so integrators can be compared at equal cost.  Block steps sum forces
+for some bodies at a time, counted as fractions of a full sum.
+
+With a binaries count the bodies are spread out into a quiet cloud and
+that many of them are paired into tight circular binaries, separation
+apart, the case the block integrator is for.
+
+   python3 benchmarks/bench_integrators.py [bodyCount [seconds [binaries
+       [separation]]]]
+"""
+
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gravity
+import integrators
+
+
+def totalEnergy(grav):
+    """Kinetic plus potential energy.  The pairwise force G*m1*m2/d has
+    potential G*m1*m2*ln(d)."""
+    masses = grav._masses
+    positions = grav.bodyPositions()
+    velocities = grav._velocities
+    kinetic = 0.5 * numpy.sum(masses * numpy.einsum("ij,ij->i", velocities,
+                                                     velocities))
+    diffs = positions[:, numpy.newaxis, :] - positions[numpy.newaxis, :, :]
+    dists = numpy.sqrt(numpy.einsum("ijk,ijk->ij", diffs, diffs))
+    upper = numpy.triu_indices(masses.shape[0], 1)
+    potential = grav.gravitation() * numpy.sum(
+        (masses[:, numpy.newaxis] * masses)[upper] * numpy.log(dists[upper]))
+    return kinetic + potential
+
+
+def makeBinaries(grav, binaries, separation=4.0):
+    """Pair the first 2 * binaries bodies into circular binaries.  Under
+    the G*m1*m2/d force the orbital speed is sqrt(G * (m1 + m2)) at any
+    separation."""
+    positions = grav.bodyPositions()
+    velocities = grav.bodyVelocities()
+    masses = grav.bodyMasses()
+    for bdx in range(binaries):
+        b1, b2 = 2 * bdx, 2 * bdx + 1
+        total = masses[b1] + masses[b2]
+        speed = numpy.sqrt(grav.gravitation() * total)
+        positions[b2] = positions[b1] + [separation, 0.0, 0.0]
+        drift = velocities[b1].copy()
+        velocities[b1] = drift + [0.0, speed * masses[b2] / total, 0.0]
+        velocities[b2] = drift - [0.0, speed * masses[b1] / total, 0.0]
+
+
+def runOnce(name, bodyCount, seconds, substeps, tolerance=None, binaries=0,
+            separation=4.0):
+    grav = gravity.Gravity()
+    grav.setSeed(1)
+    grav.setBodyCount(bodyCount)
+    grav.setIntegrator(name)
+    if tolerance is not None:
+        grav._integrator.tolerance = tolerance
+    if binaries:
+        grav.setPositionRange(-2000.0, 2000.0)
+        grav.setVelocityRange(-0.05, 0.05)
+    grav.createRandomBodies()
+    makeBinaries(grav, binaries, separation)
+
+    startEnergy = totalEnergy(grav)
+    start = time.perf_counter()
+    grav.advance(seconds, substeps)
+    elapsed = time.perf_counter() - start
+    drift = abs(totalEnergy(grav) - startEnergy) / abs(startEnergy)
+    return grav.forceEvaluations(), drift, elapsed
+
+
+def main(bodyCount, seconds, binaries=0, separation=4.0):
+    print(f"{bodyCount} bodies, {binaries} binaries, {seconds} simulated"
+          " seconds")
+    print(f"{'integrator':>10} {'dt':>8} {'tol':>8} {'forces':>8}"
+          f" {'per sec':>8} {'drift':>10} {'wall s':>8}")
+    for name in integrators.INTEGRATORS:
+        if name == integrators.AdaptiveIntegrator.name:
+            runs = [ (1, tol) for tol in (1.0e-4, 1.0e-6, 1.0e-8) ]
+        elif name == integrators.BlockIntegrator.name:
+            runs = [ (1, tol) for tol in (0.05, 0.02, 0.005, 0.001) ]
+        else:
+            runs = [ (substeps, None) for substeps in (1, 2, 4, 8) ]
+        for substeps, tol in runs:
+            evals, drift, elapsed = runOnce(name, bodyCount, seconds,
+                                            substeps, tol, binaries,
+                                            separation)
+            tolText = "-" if tol is None else f"{tol:.0e}"
+            print(f"{name:>10} {1.0 / substeps:8.3f} {tolText:>8} {evals:8.0f}"
+                  f" {evals / seconds:8.2f} {drift:10.2e} {elapsed:8.3f}")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    secs = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    pairs = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    apart = float(sys.argv[4]) if len(sys.argv) > 4 else 4.0
+    main(count, secs, pairs, apart)
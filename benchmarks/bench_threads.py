@@ -0,0 +1,59 @@
+"""
+Scaling of the threads force engine from one thread up to the core count.
+
+   python3 benchmarks/bench_threads.py [bodyCount [maxThreads]]
+"""
+
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forces
+import gravity
+
+
+def timeEngine(engine, positions, masses, out, repeat=3):
+    engine.sumForces(positions, masses, gravity.G, out)     # warm up pool
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        engine.sumForces(positions, masses, gravity.G, out)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(bodyCount, maxThreads):
+    numpy.random.seed(1)
+    positions = numpy.random.rand(bodyCount, 3) * 400.0 - 200.0
+    masses = numpy.random.rand(bodyCount) * 500.0 + 4500.0
+    out = numpy.empty((bodyCount, 3))
+
+    tiled = forces.TiledForces()
+    baseTime = timeEngine(tiled, positions, masses, out)
+    print(f"{bodyCount} bodies, {os.cpu_count()} cores")
+    print(f"{'engine':>8} {'threads':>8} {'step s':>9} {'speedup':>8}"
+          f" {'efficiency':>10}")
+    print(f"{'tiled':>8} {1:8d} {baseTime:9.4f} {1.0:8.2f} {1.0:10.2f}")
+
+    threadCount = 1
+    while threadCount <= maxThreads:
+        engine = forces.ThreadForces()
+        engine.setOptions({ "workers": threadCount })
+        elapsed = timeEngine(engine, positions, masses, out)
+        engine.close()
+        speedup = baseTime / elapsed
+        print(f"{'threads':>8} {threadCount:8d} {elapsed:9.4f}"
+              f" {speedup:8.2f} {speedup / threadCount:10.2f}")
+        if threadCount == maxThreads:
+            break
+        threadCount = min(threadCount * 2, maxThreads)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    main(count, threads)
@@ -0,0 +1,91 @@
+"""
+Peak memory and step time of the tiled force engine against tile size.
+
+Every configuration runs in a fresh Python process so its peak resident set
+size is its own.  The vector engine is included for reference while its
+(N x N) buffers fit in memory.
+
+   python3 benchmarks/bench_tiled.py [bodyCount [tileSize ...]]
+
+Peak RSS comes from resource.getrusage, which is not available on Windows.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import forces
+import gravity
+
+
+TILE_SIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+VECTOR_LIMIT = 12000     # largest body count to try the (N x N) engine
+
+
+def peakRSSMB():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024.0 * 1024.0)     # bytes on macOS
+    return peak / 1024.0                    # kilobytes on Linux
+
+
+def runOne(bodyCount, engineName, tileSize, steps=3):
+    """Time the force step for one configuration in this process"""
+    numpy.random.seed(1)
+    positions = numpy.random.rand(bodyCount, 3) * 400.0 - 200.0
+    masses = numpy.random.rand(bodyCount) * 500.0 + 4500.0
+    out = numpy.empty((bodyCount, 3))
+    baseRSS = peakRSSMB()
+
+    engine = forces.newForceEngine(engineName)
+    engine.setOptions({ "tileSize": tileSize })
+    best = None
+    for _ in range(steps):
+        start = time.perf_counter()
+        engine.sumForces(positions, masses, gravity.G, out)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return { "bodies": bodyCount, "engine": engineName, "tile": tileSize,
+             "step": best, "peakMB": peakRSSMB(), "baseMB": baseRSS }
+
+
+def runChild(bodyCount, engineName, tileSize):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child",
+           str(bodyCount), engineName, str(tileSize)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return json.loads(proc.stdout)
+
+
+def main(bodyCount, tileSizes):
+    print(f"{'engine':>8} {'tile':>6} {'step s':>9} {'pairs/s':>10}"
+          f" {'peak MB':>9} {'added MB':>9}")
+    runs = [("tiled", tile) for tile in tileSizes]
+    if bodyCount <= VECTOR_LIMIT:
+        runs.append(("vector", 0))
+    for engineName, tileSize in runs:
+        result = runChild(bodyCount, engineName, tileSize)
+        if result is None:
+            print(f"{engineName:>8} {tileSize:6d}    failed")
+            continue
+        pairRate = bodyCount * bodyCount / result["step"]
+        extraMB = result["peakMB"] - result["baseMB"]
+        print(f"{engineName:>8} {tileSize:6d} {result['step']:9.4f}"
+              f" {pairRate:10.3e} {result['peakMB']:9.1f} {extraMB:9.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        result = runOne(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+        print(json.dumps(result))
+    else:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+        tiles = [int(arg) for arg in sys.argv[2:]] or TILE_SIZES
+        main(count, tiles)
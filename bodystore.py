@@ -0,0 +1,124 @@
+"""
+Structure of arrays storage for gravity bodies.
+
+Each body field lives in one preallocated array with room for more bodies
+than are live.  Live bodies are always packed at the front, so every field
+accessor returns a plain view of the first count rows.  Removing bodies
+moves the last live bodies into the holes, so nothing is reallocated until
+the store outgrows its capacity.
+"""
+
+import numpy
+
+
+class BodyStore(object):
+
+    # Field name: columns per body, 0 for a flat array
+    FIELDS = { "positions":  3,
+               "velocities": 3,
+               "masses":     0,
+               "sizes":      0,
+               "colors":     3,
+               "forces":     3,
+               "accels":     3 }
+
+    def __init__(self, capacity=0):
+        super().__init__()
+
+        self._count    = 0
+        self._capacity = 0
+        self._arrays   = { }
+        self.reserve(capacity)
+
+    def adopt(self, fields, count):
+        """Use the supplied (count x ...) field arrays, such as memory maps,
+        as the store's arrays without copying.  Fields not supplied are
+        zero filled.  The store is at capacity, so adding bodies copies."""
+        arrays = { }
+        for name, cols in self.FIELDS.items():
+            array = fields.get(name)
+            if array is None:
+                shape = (count, cols) if cols else (count,)
+                array = numpy.zeros(shape)
+            arrays[name] = array
+        self._arrays = arrays
+        self._capacity = int(count)
+        self._count = int(count)
+
+    def activeMask(self):
+        """Boolean mask over the whole capacity, True for live bodies"""
+        mask = numpy.zeros(self._capacity, dtype=bool)
+        mask[:self._count] = True
+        return mask
+
+    def capacity(self):
+        return self._capacity
+
+    def count(self):
+        return self._count
+
+    def field(self, name):
+        """View of the named field for the live bodies"""
+        return self._arrays[name][:self._count]
+
+    def remove(self, indexes):
+        """Swap remove the bodies at indexes.  The last live bodies are
+        moved into the freed slots, so the order of surviving bodies
+        changes.  Returns the number of bodies removed."""
+        indexes = numpy.unique(indexes)
+        if indexes.shape[0] == 0:
+            return 0
+        newCount = self._count - indexes.shape[0]
+
+        # Slots below the new count that must be refilled, and the live
+        # bodies at or above it that can refill them
+        holes = indexes[indexes < newCount]
+        tail = numpy.ones(self._count - newCount, dtype=bool)
+        tail[indexes[indexes >= newCount] - newCount] = False
+        movers = numpy.nonzero(tail)[0] + newCount
+        for array in self._arrays.values():
+            array[holes] = array[movers]
+
+        self._count = newCount
+        return indexes.shape[0]
+
+    def reserve(self, capacity):
+        """Grow capacity to at least capacity bodies, keeping live data"""
+        if capacity <= self._capacity:
+            return
+        capacity = max(int(capacity), 2 * self._capacity)
+        for name, cols in self.FIELDS.items():
+            shape = (capacity, cols) if cols else (capacity,)
+            array = numpy.zeros(shape)
+            old = self._arrays.get(name)
+            if old is not None:
+                array[:self._count] = old[:self._count]
+            self._arrays[name] = array
+        self._capacity = capacity
+
+    def resize(self, count):
+        """Set the live body count, growing capacity as needed.  Bodies
+        added past the old count hold stale data until assigned."""
+        self.reserve(count)
+        self._count = int(count)
+
+    def positions(self):
+        return self.field("positions")
+
+    def velocities(self):
+        return self.field("velocities")
+
+    def masses(self):
+        return self.field("masses")
+
+    def sizes(self):
+        return self.field("sizes")
+
+    def colors(self):
+        return self.field("colors")
+
+    def forces(self):
+        return self.field("forces")
+
+    def accels(self):
+        return self.field("accels")
@@ -0,0 +1,77 @@
+"""
+Broad phase collision detection with a uniform grid.
+
+Bodies are binned into cubic cells at least one collision distance wide, so
+any pair closer than the collision distance lies in the same or neighbouring
+cells.  Only those candidate pairs have their distances checked, which keeps
+the cost near O(N) for any force engine.
+"""
+
+import itertools
+
+import numpy
+
+
+MAX_AXIS_CELLS = 1 << 20    # keeps linear cell keys well inside int64
+
+# The body's own cell plus the half of its 26 neighbours that come after it,
+# the other half find the same pairs from the neighbouring cell's side
+_NEIGHBOURS = [ off for off in itertools.product((-1, 0, 1), repeat=3)
+                if off > (0, 0, 0) ]
+
+
+def findCollisionPairs(positions, collDist):
+    """Return a (K x 2) array of every pair of body indexes (i < j) closer
+    than collDist, sorted by i then j.
+    """
+    bodyCount = positions.shape[0]
+    noPairs = numpy.empty((0, 2), dtype=numpy.int64)
+    if bodyCount < 2 or collDist <= 0.0:
+        return noPairs
+
+    # Cells are collDist wide unless the bodies are spread so far that
+    # the grid would be too big to number
+    lo = positions.min(axis=0)
+    extent = float((positions.max(axis=0) - lo).max())
+    cellSize = max(collDist, extent / (MAX_AXIS_CELLS - 1))
+
+    # Linear cell keys with a one cell border, so a neighbouring cell's key
+    # is the body's key plus a constant
+    cells = numpy.floor((positions - lo) / cellSize).astype(numpy.int64) + 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = numpy.argsort(keys, kind="stable")
+    sortedKeys = keys[order]
+    collDist2 = collDist * collDist
+
+    found = [ ]
+    for offset in [ (0, 0, 0) ] + _NEIGHBOURS:
+        delta = (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+        needles = sortedKeys + delta
+        ends = numpy.searchsorted(sortedKeys, needles, "right")
+        if delta == 0:
+            # Pair each body with the bodies after it in its own cell
+            starts = numpy.arange(1, bodyCount + 1)
+        else:
+            starts = numpy.searchsorted(sortedKeys, needles, "left")
+        counts = ends - starts
+        if not counts.any():
+            continue
+
+        # Every body paired with every body in the offset cell
+        total = int(counts.sum())
+        runStarts = numpy.cumsum(counts) - counts
+        firsts = order[numpy.repeat(numpy.arange(bodyCount), counts)]
+        seconds = order[numpy.repeat(starts, counts) + numpy.arange(total) -
+                        numpy.repeat(runStarts, counts)]
+
+        disps = positions[seconds] - positions[firsts]
+        close = numpy.einsum("ij,ij->i", disps, disps) < collDist2
+        if close.any():
+            found.append(numpy.column_stack((firsts[close], seconds[close])))
+
+    if not found:
+        return noPairs
+
+    pairs = numpy.sort(numpy.concatenate(found), axis=1)
+    return pairs[numpy.lexsort((pairs[:, 1], pairs[:, 0]))]
@@ -0,0 +1,765 @@
+"""
+Force engines used by gravity.Gravity to sum the gravitational force on every
+body.  Each engine fills a caller supplied (N x 3) force array, or when given
+an array of target body indexes, a (K x 3) array with the force on just those
+K bodies from every body.  Given a potentials array, (N) or (K), engines
+also fill it with each body's potential energy G * mi * sum(mj * ln(Dij)),
+from the same distances as the forces, so the total potential energy is half
+its sum.  Collisions are found separately, see collisions.py.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+import octree
+import pmesh
+
+# Engine specific options accepted by Gravity.setOptions, with defaults
+ENGINE_OPTIONS = { "openingAngle" : 0.5,    # Barnes-Hut theta
+                   "tileSize"     : 0,      # tile side, 0 from tileMemory
+                   "tileMemory"   : 32,     # tile buffer budget in MB
+                   "workers"      : 0,      # worker count, 0 for all cores
+                   "meshSize"     : 64,     # particle-mesh cells per side
+                   "meshPadding"  : 2.0 }   # mesh padding, 2.0 non periodic
+
+
+class ForceEngine(object):
+
+    name = None
+
+    def __init__(self):
+        super().__init__()
+
+    def close(self):
+        """Release any resources held by the engine"""
+        pass
+
+    def setOptions(self, engineOpts):
+        """Assign engine specific options from supplied dict, see
+        ENGINE_OPTIONS for the option names"""
+        pass
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        raise NotImplementedError
+
+
+class LoopForces(ForceEngine):
+    """Original per body force loop, kept as the accuracy reference"""
+
+    name = "loop"
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        """
+        Sum forces for each body.  For each body in make it m2 [v2x, v2y, v2z].
+        Then create lists of other masses and positions [m1, m3, m4, ...]
+        [ [x1, y1, z1], [x3, y3, z3], [x4, y4, z4], ...].  Then calculate
+        distances between current body and other bodies [d1, d3, d4, ...].
+        Then build a list of vector normals between current body and all other
+        bodies [ [n1x, n1y, n1z], [n3x, n3y, n3z], [n4x, n4y, n4z], ...].
+        Then calculate the 3D gravitational force between this mass and other
+        bodies.
+          m2 * other masses:
+            [[m2m1x,m2m1y,m2m1z],[m2m3x,m2m3y,m2m3z],[m2m4x,m2m4y,m2m4z] ...]
+          m2 * other masses / other distances
+            [[m2m1x,m2m1y,m2m1z]/m2m1d,[m2m3x,m2m3y,m2m3z]/m2m3d,
+             [m2m4x,m2m4y,m2m4z]/m2m3d ...]
+        Then calculate pull of other masses on current mass
+          m2 * other masses / other distances * -G
+            [[m2m1x,m2m1y,m2m1z]/m2m1d,[m2m3x,m2m3y,m2m3z]/m2m3d,
+             [m2m4x,m2m4y,m2m4z]/m2m3d ...] * -G
+        Lastly sum 3D force vectors of all ther bodies
+            [m2m1x,m2m1y,m2m1z]/m2m1d] + [m2m3x,m2m3y,m2m3z]/m2m3d] +
+            [m2m4x,m2m4y,m2m4z]/m2m3d ...] * -G
+        End result list of forceSums for each body
+           [ [F1x,F1y,F1z], [F2x,F2y,F2z], [F3x,F3y,F3z], [F4x,F4y,F4z], ...]
+        """
+        # For each body calculate gravitatational force vectors of ather bodies
+        #    F = G * m1 * m2 / d ** 2
+        if targets is None:
+            targets = range(masses.shape[0])
+        for fdx, bdx in enumerate(targets):
+            # Make this body m2
+            mass2 = masses[bdx]
+            m2Pos = positions[bdx]
+
+            # Lists of other masses and other position vectors
+            otherMasses = numpy.delete(masses, bdx)
+            otherPoses  = numpy.delete(positions, bdx, axis=0)
+
+            # Get normalized vectors from current body to other bodies
+            m21Vecs = m2Pos - otherPoses
+            m21Dists = numpy.linalg.norm(m21Vecs, axis=1)
+            m21Norms = m21Vecs / m21Dists[:, numpy.newaxis]
+
+            # Get vector forces between current mass and other masses
+            m2m1s = mass2 * otherMasses
+            #GRAV A m2m1r1s = m2m1s / m21Dists
+            # GRAV C Should really be  m2m1r1s = m2m1s / (m21Dists ** 2)
+            m2m1r1s = m2m1s / m21Dists
+            m2fxyz = m2m1r1s[:, numpy.newaxis] * m21Norms
+
+            # Sum the list of force vectors, multiply by gravitational
+            # constant to get forces in Newtons
+            forces[fdx] = numpy.sum(m2fxyz, axis=0) * -G
+            if potentials is not None:
+                potentials[fdx] = G * mass2 * numpy.sum(
+                    otherMasses * numpy.log(m21Dists))
+
+
+class VectorForces(ForceEngine):
+    """
+    All pairs force engine.  Displacements, distances and forces between every
+    pair of bodies are computed as (N x N) array operations into buffers that
+    are only reallocated when the body count changes.  Sums whose buffers
+    would pass MAX_MEMORY are worked through in tiles, as by TiledForces.
+    """
+
+    name = "vector"
+
+    MAX_MEMORY = 512        # MB of (N x N) buffers, larger sums are tiled
+    BYTES_PER_PAIR = 5 * 8  # displacement xyz, distance, weight
+
+    def __init__(self):
+        super().__init__()
+
+        self._dispBuf  = None   # (N x N x 3) body to body displacements
+        self._dist2Buf = None   # (N x N) squared distances
+        self._wgtBuf   = None   # (N x N) other mass / squared distance
+        self._tileSize = tileSizeFor(ENGINE_OPTIONS)
+        self._kernel   = None   # TileKernel of sums over MAX_MEMORY
+
+    def close(self):
+        self._dispBuf  = None
+        self._dist2Buf = None
+        self._wgtBuf   = None
+        self._kernel   = None
+
+    def setOptions(self, engineOpts):
+        tileSize = tileSizeFor(engineOpts)
+        if tileSize != self._tileSize:
+            self._tileSize = tileSize
+            self._kernel = None
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        """
+        The pull on body i is the same sum as the loop engine
+            Fi = -G * mi * sum(mj * (Pi - Pj) / Dij / Dij)
+        with the self term removed by giving the diagonal an infinite distance.
+        """
+        rows = masses.shape[0] if targets is None else targets.shape[0]
+        if rows * masses.shape[0] * self.BYTES_PER_PAIR > \
+           self.MAX_MEMORY * 1024 * 1024:
+            self._sumTiled(positions, masses, G, forces, targets, potentials)
+            return
+        if targets is not None:
+            self._sumTargets(positions, masses, G, forces, targets,
+                             potentials)
+            return
+
+        bodyCount = masses.shape[0]
+        if self._dist2Buf is None or self._dist2Buf.shape[0] != bodyCount:
+            self._dispBuf  = numpy.empty((bodyCount, bodyCount, 3))
+            self._dist2Buf = numpy.empty((bodyCount, bodyCount))
+            self._wgtBuf   = numpy.empty((bodyCount, bodyCount))
+        disps  = self._dispBuf
+        dist2s = self._dist2Buf
+        wgts   = self._wgtBuf
+
+        numpy.subtract(positions[:, numpy.newaxis, :],
+                       positions[numpy.newaxis, :, :], out=disps)
+        numpy.einsum("ijk,ijk->ij", disps, disps, out=dist2s)
+        numpy.fill_diagonal(dist2s, numpy.inf)
+
+        numpy.divide(masses[numpy.newaxis, :], dist2s, out=wgts)
+        numpy.einsum("ij,ijk->ik", wgts, disps, out=forces)
+        forces *= (masses * -G)[:, numpy.newaxis]
+
+        if potentials is not None:
+            # ln(Dij) is ln(Dij * Dij) / 2, a distance of 1 drops the self term
+            numpy.fill_diagonal(dist2s, 1.0)
+            numpy.log(dist2s, out=wgts)
+            numpy.dot(wgts, masses, out=potentials)
+            potentials *= masses * (0.5 * G)
+
+    def _sumTiled(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        """Tiled sum for body counts too large for the (N x N) buffers"""
+        self._dispBuf = self._dist2Buf = self._wgtBuf = None
+        if self._kernel is None:
+            self._kernel = TileKernel(self._tileSize)
+        if targets is None:
+            targets = numpy.arange(masses.shape[0])
+        self._kernel.sumTargets(positions, masses, targets, forces,
+                                potentials)
+        forces *= (masses[targets] * G)[:, numpy.newaxis]
+        if potentials is not None:
+            potentials *= masses[targets] * G
+
+    def _sumTargets(self, positions, masses, G, forces, targets,
+                    potentials=None):
+        """(K x N) version of the all pairs sum for K target bodies"""
+        disps = positions[targets, numpy.newaxis, :] - \
+            positions[numpy.newaxis, :, :]
+        dist2s = numpy.einsum("ijk,ijk->ij", disps, disps)
+        dist2s[numpy.arange(targets.shape[0]), targets] = numpy.inf
+        wgts = masses[numpy.newaxis, :] / dist2s
+        numpy.einsum("ij,ijk->ik", wgts, disps, out=forces)
+        forces *= (masses[targets] * -G)[:, numpy.newaxis]
+
+        if potentials is not None:
+            dist2s[numpy.arange(targets.shape[0]), targets] = 1.0
+            numpy.dot(numpy.log(dist2s), masses, out=potentials)
+            potentials *= masses[targets] * (0.5 * G)
+
+
+class TileKernel(object):
+    """
+    Sums the pull per unit mass on a set of target bodies from every body,
+    one (target tile x source tile) block of the interaction matrix at a
+    time, so temporary memory is set by the tile size and not the body
+    count.  Tile buffers are kept between calls.
+    """
+
+    # bytes of tile buffers per interaction: displacement xyz, distance, weight
+    BYTES_PER_PAIR = 5 * 8
+
+    def __init__(self, tileSize):
+        super().__init__()
+
+        self.tileSize  = tileSize
+        self._dispBuf  = numpy.empty((tileSize, tileSize, 3))
+        self._dist2Buf = numpy.empty((tileSize, tileSize))
+        self._wgtBuf   = numpy.empty((tileSize, tileSize))
+        self._sumBuf   = numpy.empty((tileSize, 3))
+
+    def sumRange(self, positions, masses, tStart, tEnd, accels,
+                 potentials=None):
+        """Fill accels with sum(mj * (Pj - Pi) / Dij / Dij) for targets
+        tStart to tEnd"""
+        self.sumTargets(positions, masses, numpy.arange(tStart, tEnd), accels,
+                        potentials)
+
+    def sumTargets(self, positions, masses, targets, accels, potentials=None):
+        """Fill accels with sum(mj * (Pj - Pi) / Dij / Dij) for each body
+        index in targets, and potentials, if given, with sum(mj * ln(Dij))"""
+        bodyCount = masses.shape[0]
+        tile = self.tileSize
+        accels[:] = 0.0
+        if potentials is not None:
+            potentials[:] = 0.0
+
+        for t0 in range(0, targets.shape[0], tile):
+            t1 = min(t0 + tile, targets.shape[0])
+            tIndexes = targets[t0:t1]
+            tPos = positions[tIndexes, numpy.newaxis, :]
+            rows = numpy.arange(t1 - t0)
+            for s0 in range(0, bodyCount, tile):
+                s1 = min(s0 + tile, bodyCount)
+                disps  = self._dispBuf[:t1-t0, :s1-s0]
+                dist2s = self._dist2Buf[:t1-t0, :s1-s0]
+                wgts   = self._wgtBuf[:t1-t0, :s1-s0]
+                sums   = self._sumBuf[:t1-t0]
+
+                numpy.subtract(positions[numpy.newaxis, s0:s1, :], tPos,
+                               out=disps)
+                numpy.einsum("ijk,ijk->ij", disps, disps, out=dist2s)
+
+                # Remove the self term of targets in this source tile
+                selfs = (s0 <= tIndexes) & (tIndexes < s1)
+                if selfs.any():
+                    dist2s[rows[selfs], tIndexes[selfs] - s0] = numpy.inf
+
+                numpy.divide(masses[numpy.newaxis, s0:s1], dist2s, out=wgts)
+                numpy.einsum("ij,ijk->ik", wgts, disps, out=sums)
+                accels[t0:t1] += sums
+
+                if potentials is not None:
+                    # Weights are free again, ln(Dij) is ln(Dij * Dij) / 2
+                    if selfs.any():
+                        dist2s[rows[selfs], tIndexes[selfs] - s0] = 1.0
+                    numpy.log(dist2s, out=wgts)
+                    potentials[t0:t1] += wgts @ masses[s0:s1]
+
+        if potentials is not None:
+            potentials *= 0.5
+
+
+def tileSizeFor(engineOpts):
+    """Tile side length from the tileSize option, or from the tileMemory
+    budget when tileSize is 0"""
+    tileSize = engineOpts.get("tileSize")
+    if tileSize:
+        return max(int(tileSize), 1)
+    budget = engineOpts.get("tileMemory") or ENGINE_OPTIONS["tileMemory"]
+    pairs = budget * 1024 * 1024 / TileKernel.BYTES_PER_PAIR
+    return max(int(numpy.sqrt(pairs)), 16)
+
+
+class TiledForces(ForceEngine):
+    """
+    Exact all pairs engine that works through the interaction matrix in
+    fixed size tiles, for body counts where (N x N) buffers will not fit.
+    """
+
+    name = "tiled"
+
+    def __init__(self):
+        super().__init__()
+
+        self._tileSize = tileSizeFor(ENGINE_OPTIONS)
+        self._kernel   = None
+
+    def close(self):
+        self._kernel = None
+
+    def setOptions(self, engineOpts):
+        tileSize = tileSizeFor(engineOpts)
+        if tileSize != self._tileSize:
+            self._tileSize = tileSize
+            self._kernel = None
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        if self._kernel is None:
+            self._kernel = TileKernel(self._tileSize)
+        if targets is None:
+            targets = numpy.arange(masses.shape[0])
+        self._kernel.sumTargets(positions, masses, targets, forces,
+                                potentials)
+        forces *= (masses[targets] * G)[:, numpy.newaxis]
+        if potentials is not None:
+            potentials *= masses[targets] * G
+
+
+def workerCountFor(engineOpts):
+    workers = engineOpts.get("workers")
+    if workers:
+        return max(int(workers), 1)
+    return os.cpu_count() or 1
+
+
+def _attachShared(name):
+    """Attach to an existing shared memory block, the creating process owns
+    it and unlinks it.  Before Python 3.13 the attach registers the block
+    again with the resource tracker shared with the parent, which is
+    harmless."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# Per worker process state for ProcessForces
+_workerShm    = None
+_workerKernel = None
+
+
+def _sharedArrays(buf, capacity, bodyCount):
+    """Positions, masses, forces and potentials views of a ProcessForces
+    shared block"""
+    positions = numpy.ndarray((capacity, 3), buffer=buf)
+    masses = numpy.ndarray((capacity,), buffer=buf, offset=capacity * 3 * 8)
+    forces = numpy.ndarray((capacity, 3), buffer=buf, offset=capacity * 4 * 8)
+    potentials = numpy.ndarray((capacity,), buffer=buf,
+                               offset=capacity * 7 * 8)
+    return positions[:bodyCount], masses[:bodyCount], forces[:bodyCount], \
+        potentials[:bodyCount]
+
+
+def _workerSumForces(task):
+    """Sum one range of target bodies straight into the shared force array.
+    With a targets array the range is of rows of targets."""
+    global _workerShm, _workerKernel
+    shmName, capacity, bodyCount, tStart, tEnd, tileSize, targets, \
+        withPotentials = task
+
+    if _workerShm is None or _workerShm.name != shmName:
+        if _workerShm is not None:
+            _workerShm.close()
+        _workerShm = _attachShared(shmName)
+    if _workerKernel is None or _workerKernel.tileSize != tileSize:
+        _workerKernel = TileKernel(tileSize)
+
+    positions, masses, accels, potentials = _sharedArrays(_workerShm.buf,
+                                                          capacity, bodyCount)
+    potentials = potentials[tStart:tEnd] if withPotentials else None
+    if targets is None:
+        _workerKernel.sumRange(positions, masses, tStart, tEnd,
+                               accels[tStart:tEnd], potentials)
+    else:
+        _workerKernel.sumTargets(positions, masses, targets,
+                                 accels[tStart:tEnd], potentials)
+
+
+class ProcessForces(ForceEngine):
+    """
+    Exact all pairs engine spread over a pool of worker processes.  Body
+    positions and masses are placed in a shared memory block and each worker
+    sums a range of target bodies, writing straight into a force array in
+    the same block, so only range bounds are sent to the workers.  close()
+    stops the workers and frees the shared memory.
+    """
+
+    name = "processes"
+
+    CHUNKS_PER_WORKER = 4   # smaller ranges even out the worker load
+
+    def __init__(self):
+        super().__init__()
+
+        self._workers  = workerCountFor(ENGINE_OPTIONS)
+        self._tileSize = tileSizeFor(ENGINE_OPTIONS)
+        self._pool     = None
+        self._shm      = None
+        self._capacity = 0
+
+    def close(self):
+        # Closed engines need no exit clean up, nor to be kept alive by it
+        atexit.unregister(self.close)
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+            self._capacity = 0
+
+    def setOptions(self, engineOpts):
+        self._tileSize = tileSizeFor(engineOpts)
+        workers = workerCountFor(engineOpts)
+        if workers != self._workers and self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._workers = workers
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        bodyCount = masses.shape[0]
+        if bodyCount > self._capacity:
+            self._allocShared(bodyCount)
+        if self._pool is None:
+            mpContext = multiprocessing.get_context("spawn")
+            self._pool = mpContext.Pool(self._workers)
+
+        shPositions, shMasses, shAccels, shPotentials = _sharedArrays(
+            self._shm.buf, self._capacity, bodyCount)
+        shPositions[:] = positions
+        shMasses[:] = masses
+
+        targetCount = bodyCount if targets is None else targets.shape[0]
+        chunks = min(self._workers * self.CHUNKS_PER_WORKER, targetCount)
+        bounds = numpy.linspace(0, targetCount, chunks + 1).astype(int)
+        tasks = [ (self._shm.name, self._capacity, bodyCount,
+                   int(bounds[cdx]), int(bounds[cdx+1]), self._tileSize,
+                   None if targets is None else
+                   targets[bounds[cdx]:bounds[cdx+1]],
+                   potentials is not None)
+                  for cdx in range(chunks) ]
+        self._pool.map(_workerSumForces, tasks)
+
+        targetMasses = masses if targets is None else masses[targets]
+        numpy.multiply(shAccels[:targetCount],
+                       (targetMasses * G)[:, numpy.newaxis], out=forces)
+        if potentials is not None:
+            numpy.multiply(shPotentials[:targetCount], targetMasses * G,
+                           out=potentials)
+
+    def _allocShared(self, bodyCount):
+        """(Re)allocate the shared block with room to grow, workers attach
+        to the new block by name on their next task"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+        else:
+            # Free the block and stop the pool at exit if not closed
+            atexit.register(self.close)
+        capacity = max(bodyCount, 2 * self._capacity, 64)
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=capacity * 8 * 8)
+        self._capacity = capacity
+
+
+class ThreadForces(ForceEngine):
+    """
+    Exact all pairs engine spread over a pool of threads.  Target bodies are
+    split into chunks summed with a TileKernel per thread.  The tile
+    arithmetic runs in NumPy with the GIL released, and threads share the
+    body arrays directly, so there is no process start up or copying.
+    """
+
+    name = "threads"
+
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self):
+        super().__init__()
+
+        self._workers  = workerCountFor(ENGINE_OPTIONS)
+        self._tileSize = tileSizeFor(ENGINE_OPTIONS)
+        self._pool     = None
+        self._local    = threading.local()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def setOptions(self, engineOpts):
+        self._tileSize = tileSizeFor(engineOpts)
+        workers = workerCountFor(engineOpts)
+        if workers != self._workers:
+            self.close()
+        self._workers = workers
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self._workers,
+                                            thread_name_prefix="forces")
+        if targets is None:
+            targets = numpy.arange(masses.shape[0])
+
+        targetCount = targets.shape[0]
+        chunks = min(self._workers * self.CHUNKS_PER_WORKER, targetCount)
+        bounds = numpy.linspace(0, targetCount, chunks + 1).astype(int)
+        futures = [ self._pool.submit(self._sumChunk, positions, masses,
+                                      targets[bounds[cdx]:bounds[cdx+1]],
+                                      forces[bounds[cdx]:bounds[cdx+1]],
+                                      None if potentials is None else
+                                      potentials[bounds[cdx]:bounds[cdx+1]])
+                    for cdx in range(chunks) ]
+        for fut in futures:
+            fut.result()
+
+        forces *= (masses[targets] * G)[:, numpy.newaxis]
+        if potentials is not None:
+            potentials *= masses[targets] * G
+
+    def _sumChunk(self, positions, masses, targets, accels, potentials):
+        kernel = getattr(self._local, "kernel", None)
+        if kernel is None or kernel.tileSize != self._tileSize:
+            kernel = self._local.kernel = TileKernel(self._tileSize)
+        kernel.sumTargets(positions, masses, targets, accels, potentials)
+
+
+class BarnesHutForces(ForceEngine):
+    """
+    Barnes-Hut approximation.  An octree is built over the bodies each step
+    and a node whose side length over its distance from a body is below the
+    opening angle theta pulls on the body as one mass at its center of mass.
+    Nearer nodes are opened, and leaf nodes are summed body by body.  Theta
+    of 0.0 opens every node and gives the exact all pairs result.
+
+    The tree walk advances a frontier of (body, node) pairs one level at a
+    time for a batch of bodies, which keeps the work in array operations
+    and the frontier memory bounded.
+    """
+
+    name = "barneshut"
+
+    BATCH_SIZE = 4096   # bodies walked through the tree together
+
+    def __init__(self):
+        super().__init__()
+
+        self._theta    = ENGINE_OPTIONS["openingAngle"]
+        self._leafSize = 8
+        self._tree     = None
+
+    def close(self):
+        self._tree = None
+
+    def setOptions(self, engineOpts):
+        val = engineOpts.get("openingAngle")
+        self._theta = float(val) if val is not None else 0.5
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        tree = octree.Octree(positions, masses, self._leafSize)
+        self._tree = tree
+        bodyCount = masses.shape[0]
+
+        # Walk the targets in tree order, which keeps neighbouring bodies
+        # in a batch and the frontier small
+        if targets is None:
+            walkBodies = numpy.arange(bodyCount)
+        else:
+            treeIndexes = numpy.empty(bodyCount, dtype=numpy.int64)
+            treeIndexes[tree.order] = numpy.arange(bodyCount)
+            walkBodies = numpy.sort(treeIndexes[targets])
+        accels = numpy.empty((walkBodies.shape[0], 3))
+        pots = None
+        if potentials is not None:
+            pots = numpy.empty(walkBodies.shape[0])
+
+        for bStart in range(0, walkBodies.shape[0], self.BATCH_SIZE):
+            bEnd = min(bStart + self.BATCH_SIZE, walkBodies.shape[0])
+            self._walk(tree, walkBodies[bStart:bEnd], accels[bStart:bEnd],
+                       None if pots is None else pots[bStart:bEnd])
+
+        # Pull per unit mass back to caller order, then into forces
+        if targets is None:
+            forces[tree.order] = accels
+            forces *= (masses * G)[:, numpy.newaxis]
+            if potentials is not None:
+                potentials[tree.order] = pots
+                potentials *= masses * (0.5 * G)
+        else:
+            rows = numpy.empty(bodyCount, dtype=numpy.int64)
+            rows[tree.order[walkBodies]] = numpy.arange(walkBodies.shape[0])
+            forces[:] = accels[rows[targets]]
+            forces *= (masses[targets] * G)[:, numpy.newaxis]
+            if potentials is not None:
+                potentials[:] = pots[rows[targets]]
+                potentials *= masses[targets] * (0.5 * G)
+
+    def _walk(self, tree, bodies, accels, pots=None):
+        """Sum the pull per unit mass on the sorted bodies indexes in bodies
+        into accels, and sum(mj * ln(Dij * Dij)) into pots if given"""
+        bodyPos = tree.bodyPositions
+        theta2  = self._theta * self._theta
+        batchLen = bodies.shape[0]
+        accels[:] = 0.0
+        if pots is not None:
+            pots[:] = 0.0
+
+        # Frontier of (accels row, node) pairs, starting at the root node
+        pRow  = numpy.arange(batchLen)
+        pNode = numpy.zeros(batchLen, dtype=numpy.int64)
+
+        while pRow.shape[0] > 0:
+            pBody = bodies[pRow]
+            pPos  = bodyPos[pBody]
+            disps = tree.coms[pNode] - pPos
+            dist2 = numpy.einsum("ij,ij->i", disps, disps)
+            sizes = tree.sizes[pNode]
+
+            # A node may stand in for its bodies when it is small enough
+            # from far enough away, and never for a node holding the body
+            inside = (tree.starts[pNode] <= pBody) & (pBody < tree.ends[pNode])
+            far = ~inside & (sizes * sizes < theta2 * dist2)
+
+            if far.any():
+                farMasses = tree.masses[pNode[far]]
+                self._accumulate(accels, pRow[far], farMasses / dist2[far],
+                                 disps[far], batchLen)
+                if pots is not None:
+                    pots += numpy.bincount(
+                        pRow[far], weights=farMasses * numpy.log(dist2[far]),
+                        minlength=batchLen)
+
+            opened = ~far
+            leaf = opened & tree.isLeaf[pNode]
+            if leaf.any():
+                self._leafSums(tree, accels, pots, pRow[leaf], pBody[leaf],
+                               pNode[leaf], batchLen)
+
+            # Replace opened internal nodes with their children
+            inner = opened & ~tree.isLeaf[pNode]
+            pRow  = pRow[inner]
+            pNode = pNode[inner]
+            kidCounts = tree.kidCounts[pNode]
+            pRow  = numpy.repeat(pRow, kidCounts)
+            pNode = numpy.repeat(tree.firstKids[pNode], kidCounts) + \
+                _runOffsets(kidCounts)
+
+    def _leafSums(self, tree, accels, pots, lRow, lBody, lNode, batchLen):
+        """Sum the pull of every body in each opened leaf node"""
+        counts = tree.ends[lNode] - tree.starts[lNode]
+        tRow  = numpy.repeat(lRow, counts)
+        tBody = numpy.repeat(lBody, counts)
+        sBody = numpy.repeat(tree.starts[lNode], counts) + _runOffsets(counts)
+        others = sBody != tBody
+        tRow  = tRow[others]
+        tBody = tBody[others]
+        sBody = sBody[others]
+
+        disps = tree.bodyPositions[sBody] - tree.bodyPositions[tBody]
+        dist2 = numpy.einsum("ij,ij->i", disps, disps)
+        wgts = tree.bodyMasses[sBody] / dist2
+        self._accumulate(accels, tRow, wgts, disps, batchLen)
+        if pots is not None:
+            pots += numpy.bincount(
+                tRow, weights=tree.bodyMasses[sBody] * numpy.log(dist2),
+                minlength=batchLen)
+
+    def _accumulate(self, accels, rows, wgts, disps, batchLen):
+        for axis in range(3):
+            accels[:, axis] += numpy.bincount(rows,
+                                              weights=wgts * disps[:, axis],
+                                              minlength=batchLen)
+
+
+class MeshForces(ForceEngine):
+    """
+    Particle-mesh approximation for very large, roughly uniform clouds.
+    Pulls closer than a few mesh cells are smoothed out.
+    """
+
+    name = "mesh"
+
+    def __init__(self):
+        super().__init__()
+
+        self._mesh = pmesh.ParticleMesh(ENGINE_OPTIONS["meshSize"],
+                                        ENGINE_OPTIONS["meshPadding"])
+
+    def close(self):
+        self._mesh = None
+
+    def setOptions(self, engineOpts):
+        meshSize = engineOpts.get("meshSize") or ENGINE_OPTIONS["meshSize"]
+        padding = engineOpts.get("meshPadding") or \
+            ENGINE_OPTIONS["meshPadding"]
+        mesh = self._mesh
+        if mesh is None or mesh.meshSize != int(meshSize) or \
+           mesh.padding != float(padding):
+            self._mesh = pmesh.ParticleMesh(meshSize, padding)
+
+    def sumForces(self, positions, masses, G, forces, targets=None,
+                  potentials=None):
+        if self._mesh is None:
+            self.setOptions(ENGINE_OPTIONS)
+        self._mesh.accelerations(positions, masses, forces, targets,
+                                 potentials)
+        if targets is not None:
+            masses = masses[targets]
+        forces *= (masses * G)[:, numpy.newaxis]
+        if potentials is not None:
+            potentials *= masses * G
+
+
+def _runOffsets(counts):
+    """For runs of the supplied lengths return each element's offset within
+    its run, e.g. [2, 3] -> [0, 1, 0, 1, 2]"""
+    total = int(counts.sum())
+    runStarts = numpy.cumsum(counts) - counts
+    return numpy.arange(total) - numpy.repeat(runStarts, counts)
+
+
+ENGINES = { LoopForces.name      : LoopForces,
+            VectorForces.name    : VectorForces,
+            TiledForces.name     : TiledForces,
+            ThreadForces.name    : ThreadForces,
+            ProcessForces.name   : ProcessForces,
+            BarnesHutForces.name : BarnesHutForces,
+            MeshForces.name      : MeshForces }
+
+
+def newForceEngine(name):
+    engineClass = ENGINES.get(name)
+    if engineClass is None:
+        raise ValueError(f"Unknown force engine: {name}")
+    return engineClass()
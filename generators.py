@@ -0,0 +1,150 @@
+"""
+Starting body generators for Gravity.createRandomBodies.
+
+Each generator fills the (N x 3) positions and velocities arrays in place
+from a numpy.random.Generator, with NumPy array operations only, so a
+million bodies take a fraction of a second.  Masses are already set, the
+Plummer and disk generators use them to find speeds that roughly balance
+gravity.  Shapes are centered in the position range, with radius half its
+width.
+
+With the 1/d force law of this simulator the force on a body from an
+enclosed mass M is about G*M*m/r, so a circular orbit has speed sqrt(G*M) at
+any radius, and a bound cluster has mean squared speed G*M/2 (virial
+theorem, 2K = G * sum of mi*mj).
+"""
+
+import numpy
+
+
+def boxBodies(rng, positions, velocities, masses, posRange, velRange, G):
+    """Positions uniform in the position range cube, each velocity
+    component uniform in the velocity range"""
+    count = positions.shape[0]
+    positions[:] = rng.random((count, 3))
+    positions *= (posRange[1] - posRange[0])
+    positions += posRange[0]
+    _uniformVelocities(rng, velocities, velRange)
+
+
+def sphereBodies(rng, positions, velocities, masses, posRange, velRange, G):
+    """Positions on a sphere shell, velocities as for box"""
+    center, radius = _centerRadius(posRange)
+    positions[:] = _unitVectors(rng, positions.shape[0]) * radius + center
+    _uniformVelocities(rng, velocities, velRange)
+
+
+def bangBodies(rng, positions, velocities, masses, posRange, velRange, G):
+    """Positions on a small shell, a tenth of the range, all moving out from
+    the center at between half and all of the largest velocity"""
+    center, radius = _centerRadius(posRange)
+    count = positions.shape[0]
+    norms = _unitVectors(rng, count)
+    positions[:] = norms * (0.1 * radius) + center
+    speedMax = max(abs(velRange[0]), abs(velRange[1]))
+    speeds = speedMax * (0.5 + 0.5 * rng.random(count))
+    velocities[:] = norms * speeds[:, numpy.newaxis]
+
+
+def plummerBodies(rng, positions, velocities, masses, posRange, velRange,
+                  G):
+    """Plummer sphere with a scale radius of a quarter of the range,
+    truncated at the range.  Velocities are isotropic, with the spread at
+    each radius from the Jeans equation, so the sphere starts near
+    equilibrium."""
+    center, radius = _centerRadius(posRange)
+    count = positions.shape[0]
+    scale = 0.25 * radius
+
+    # Inverse of the Plummer cumulative mass, u = r^3 / (r^2 + a^2)^(3/2),
+    # drawn below the mass fraction inside the truncation radius
+    uMax = (radius / numpy.hypot(radius, scale)) ** 3
+    u = rng.random(count) * uMax
+    u = numpy.maximum(u, 1.0e-12)
+    radii = scale / numpy.sqrt(u ** (-2.0 / 3.0) - 1.0)
+    positions[:] = _unitVectors(rng, count) * radii[:, numpy.newaxis]
+    positions += center
+
+    # Isotropic Jeans equation, rho * sigma^2 at r is the integral from r
+    # to the edge of rho * G * M(r) / r, on a radial grid
+    grid = numpy.linspace(0.0, radius, 1025)
+    density = (1.0 + (grid / scale) ** 2) ** -2.5
+    inside = masses.sum() / uMax * grid / (grid * grid + scale * scale) ** 1.5
+    pull = density * G * inside * grid
+    tail = 0.5 * (pull[1:] + pull[:-1]) * numpy.diff(grid)
+    pressure = numpy.append(numpy.cumsum(tail[::-1])[::-1], 0.0)
+    sigma = numpy.sqrt(numpy.interp(radii, grid, pressure / density))
+    velocities[:] = rng.standard_normal((count, 3))
+    velocities *= sigma[:, numpy.newaxis]
+    _removeDrift(velocities, masses)
+
+
+def diskBodies(rng, positions, velocities, masses, posRange, velRange, G):
+    """Thin disk in the XY plane rotating about Z.  Bodies are spread evenly
+    over an annulus from a twentieth of the range out to the range, moving
+    at the circular speed of the mass inside their radius plus velocities
+    as for box."""
+    center, radius = _centerRadius(posRange)
+    count = positions.shape[0]
+    inner = 0.05 * radius
+    radii = numpy.sqrt(inner * inner +
+                       rng.random(count) * (radius * radius - inner * inner))
+    angles = rng.random(count) * (2.0 * numpy.pi)
+    cosA = numpy.cos(angles)
+    sinA = numpy.sin(angles)
+    positions[:, 0] = radii * cosA
+    positions[:, 1] = radii * sinA
+    positions[:, 2] = rng.standard_normal(count) * (0.02 * radius)
+    positions += center
+
+    _uniformVelocities(rng, velocities, velRange)
+    speeds = numpy.sqrt(G * _enclosedMasses(radii, masses))
+    velocities[:, 0] -= speeds * sinA
+    velocities[:, 1] += speeds * cosA
+    _removeDrift(velocities, masses)
+
+
+GENERATORS = { "box"     : boxBodies,
+               "sphere"  : sphereBodies,
+               "bang"    : bangBodies,
+               "plummer" : plummerBodies,
+               "disk"    : diskBodies }
+
+
+def generateBodies(name, rng, positions, velocities, masses, posRange,
+                   velRange, G):
+    generator = GENERATORS.get(name)
+    if generator is None:
+        raise ValueError(f"Unknown body generator: {name}")
+    generator(rng, positions, velocities, masses, posRange, velRange, G)
+
+
+def _centerRadius(posRange):
+    center = 0.5 * (posRange[0] + posRange[1])
+    return center, 0.5 * (posRange[1] - posRange[0])
+
+
+def _enclosedMasses(radii, masses):
+    """Mass of the bodies at or inside each body's radius"""
+    order = numpy.argsort(radii)
+    enclosed = numpy.empty_like(masses)
+    enclosed[order] = numpy.cumsum(masses[order])
+    return enclosed
+
+
+def _removeDrift(velocities, masses):
+    """Zero the total momentum, so the bodies stay centered"""
+    velocities -= masses @ velocities / masses.sum()
+
+
+def _uniformVelocities(rng, velocities, velRange):
+    velocities[:] = rng.random(velocities.shape)
+    velocities *= (velRange[1] - velRange[0])
+    velocities += velRange[0]
+
+
+def _unitVectors(rng, count):
+    """Directions uniform over the sphere"""
+    vecs = rng.standard_normal((count, 3))
+    vecs /= numpy.linalg.norm(vecs, axis=1)[:, numpy.newaxis]
+    return vecs
@@ -2,6 +2,13 @@ import math
 
 import numpy
 
+import bodystore
+import collisions
+import forces
+import generators
+import integrators
+import snapshot
+
 # Gravitation Constant
 G = 6.672e-11    # N * m^2 / kg^2
 
@@ -15,134 +22,235 @@ class Gravity(object):
 
         self._bodyCount = 0
 
+        # Body fields are views of the live bodies in the store, set by
+        # _bindBodies whenever the live count changes
+        self._bodies     = bodystore.BodyStore()
         self._positions  = None
         self._velocities = None
         self._masses     = None
+        self._sizes      = None
+        self._colors     = None
 
         self._posRange = (-200.0, 200.0)   # Body XYZ position rand range (m)
         self._velRange = (-0.2, 0.2)       # Body XYZ velocity rand range (m/s)
         self._massRange = (4500.0, 5000.0) # Body mass rand range (Kg)
+        self._seed      = None             # Generator seed, None for random
+        self._generator = "box"            # generators preset name
+        self._initCache = None             # iccache of seeded bodies
 
         self._time = 0    # seconds
 
         self._collisionDist = 5.0          # Distance threshold for collision
         self._collisionIndexes = None      # Indexes of colliding bodies
+        self._collisionPairs   = None      # (K x 2) all colliding pairs
         self._collisionDetect  = False     # Whether to look for collisions
 
+        self._massForces  = None           # (N x 3) force sums on each body
+        self._accels      = None           # (N x 3) accelerations
+        self._forceEngine = forces.newForceEngine("vector")
+        self._engineOpts  = dict(forces.ENGINE_OPTIONS)
+        self._integrator  = integrators.newIntegrator("euler")
+        self._forceEvals  = 0              # force sums since bodies created
+
+        # With diagnostics on every full force sum also fills _potentials,
+        # and _passPositions keeps the positions it was summed at, so a
+        # step or diagnostics() at the same positions need not sum again
+        self._diagnostics   = False
+        self._potentials    = None         # (N) potential energy of each body
+        self._passPositions = None
+
+    def advance(self, steps, substeps=1, sampleStride=0):
+        """Advance the simulation steps seconds in one call, each second
+        split into substeps equal time steps.  With collision detection on,
+        stops before the first step that starts with colliding bodies, so
+        the steps completed are always whole seconds.  Every sampleStride
+        steps the body positions are copied into a (samples x N x 3) array.
+        Returns the steps completed, the first colliding pair or None, and
+        the samples array or None.
+        """
+        bodyCount = self._positions.shape[0]
+        samples = None
+        if sampleStride > 0:
+            samples = numpy.empty((steps // sampleStride, bodyCount, 3))
+        sampleCount = 0
+        dt = 1.0 / substeps
+
+        for step in range(steps):
+            if self._collisionDetect:
+                self.findCollisions()
+            if not self._collisionIndexes is None:
+                cdx = self._collisionIndexes
+                self._collisionIndexes = None
+                if samples is not None:
+                    samples = samples[:sampleCount]
+                return step, cdx, samples
+            for sub in range(substeps):
+                self._step(dt)
+
+            if sampleStride > 0 and (step + 1) % sampleStride == 0:
+                samples[sampleCount] = self._positions
+                sampleCount += 1
+
+        return steps, None, samples
+
     def bodyColors(self):
         return self._colors
 
     def bodyCount(self):
         return self._bodyCount
     
+    def bodyMasses(self):
+        return self._masses
+
     def bodyPositions(self):
         return self._positions
     
     def bodySizes(self):
         return self._sizes
+
+    def bodyVelocities(self):
+        return self._velocities
     
+    def close(self):
+        """Release force engine resources such as worker processes"""
+        self._forceEngine.close()
+
     def collisionDistance(self):
         return self._collisionDist
 
-    def createRandomBodies(self, mode='box'):
-        self._massForces = None
-        
-        if mode == "sphere":
-            # positions on sphere surface, random velocities
-
-            # Create 3D random body positions on sphere surface
-            randPos = numpy.random.rand(pntCount,3) * 2.0 - 1.0
-            randMags = numpy.linalg.norm(vecs, axis=1)
-            randNorms = randPos / randMags[:, numpy.newaxis]
-            self._positions = randNorms * (self._posRange[1] - self._posRange[0])
-
-            # Create 3D random body velocity vectors (Xm/s, Ym/s, Zm/s)
-            self._velocities = numpy.random.rand(self._bodyCount, 3)
-            self._velocities *= (self._velRange[1] - self._velRange[0])
-            self._velocities += self._velRange[0]
- 
-        elif mode == "bang":
-            # positions on sphere surface, velocities from center
-
-            # Create 3D random body positions on sphere surface
-            randPos = numpy.random.rand(pntCount,3) * 2.0 - 1.0
-            randMags = numpy.linalg.norm(vecs, axis=1)
-            randNorms = vecs / mags[:, numpy.newaxis]
-            self._positions = randNorms * (self._posRange[1] - self._posRange[0])
-            surface = norms * 20.0
-
-            # Create 3D velocity vectors all moving from origin
-            vmags = numpy.random.rand(pntCount,1) * 5.0 #(velRange[1]-velRange[0])
-            velVecs = norms * (15.0 + vmags)
-            print("VELVECS:\n", velVecs)
-            velVecsCore = numpy.hstack([velVecs,core]).reshape(pntCount*2,3)
-            
-        else:
-            # Create 3D random body positions (Xm, Ym, Zm)
-            self._positions = numpy.random.rand(self._bodyCount, 3)
-            self._positions *= (self._posRange[1] - self._posRange[0])
-            self._positions += self._posRange[0]
-
-            # Create 3D random body velocity vectors (Xm/s, Ym/s, Zm/s)
-            self._velocities = numpy.random.rand(self._bodyCount, 3)
-            self._velocities *= (self._velRange[1] - self._velRange[0])
-            self._velocities += self._velRange[0]
- 
-        # Create random body masses (Kg)
-        self._masses = numpy.random.rand(self._bodyCount)
+    def collisionPairs(self):
+        """Every pair of colliding body indexes (i < j) found by the last
+        jumpOneSecond, as a (K x 2) array sorted by i then j"""
+        return self._collisionPairs
+
+    def findCollisions(self):
+        """Broad phase search for all bodies closer than the collision
+        distance, independent of the force engine.  The first pair is saved
+        for jumpOneSecond."""
+        self._collisionPairs = collisions.findCollisionPairs(
+            self._positions, self._collisionDist)
+        if self._collisionPairs.shape[0] > 0:
+            first = self._collisionPairs[0]
+            self._collisionIndexes = int(first[0]), int(first[1])
+        return self._collisionPairs
+
+    def createRandomBodies(self, mode=None):
+        """Generate bodies with the named generators preset, the generator
+        option when None.  Bodies come from the seed, or fresh entropy if it
+        is None.  Seeded bodies come from the initial conditions cache when
+        set."""
+        if mode is None:
+            mode = self._generator
+        self._integrator.reset()
+        self._forceEvals = 0
+        self._time = 0
+
+        cacheParams = None
+        if self._initCache is not None and self._seed is not None:
+            cacheParams = { "bodies"        : self._bodyCount,
+                            "massRange"     : self._massRange,
+                            "positionRange" : self._posRange,
+                            "velocityRange" : self._velRange,
+                            "mode"          : mode,
+                            "seed"          : self._seed,
+                            "G"             : self._G }
+            arrays = self._initCache.load(cacheParams)
+            if arrays is not None:
+                self._bodies.adopt(arrays, self._bodyCount)
+                self._bindBodies()
+                return
+
+        self._bodies.resize(self._bodyCount)
+        self._bindBodies()
+        rng = numpy.random.default_rng(self._seed)
+
+        # Create random body masses (Kg), some generators use them to set
+        # velocities
+        self._masses[:] = rng.random(self._bodyCount)
         self._masses *= (self._massRange[1] - self._massRange[0])
         self._masses += self._massRange[0]
 
+        # Create 3D body positions (Xm, Ym, Zm) and velocities (Xm/s, ...)
+        generators.generateBodies(mode, rng, self._positions,
+                                  self._velocities, self._masses,
+                                  self._posRange, self._velRange, self._G)
+
         # Create colors and sizes body visuals
-        mSizer = numpy.vectorize(self.massToSize)
-        self._sizes = mSizer(self._masses)
-        self._colors = numpy.random.rand(self._bodyCount, 3)
+        self._sizes[:] = self.massToSize(self._masses)
+        self._colors[:] = rng.random((self._bodyCount, 3))
 
-        # Set centroid mass
-#        self._positions[0]  *= 0.0
-#        self._velocities[0] *= 0.0
+        if cacheParams is not None:
+            self._initCache.store(cacheParams,
+                                  { "positions"  : self._positions,
+                                    "velocities" : self._velocities,
+                                    "masses"     : self._masses,
+                                    "sizes"      : self._sizes,
+                                    "colors"     : self._colors })
 
     def detectCollisions(self, value):
         self._collisionDetect = value
 
+    def diagnostics(self):
+        """Return a dict of the total kinetic, potential and total energy,
+        linear and angular momentum (about the origin) and center of mass
+        of the bodies at the current time.  The potential energy is a by
+        product of the force sum at the current positions, which the last
+        step has already done when diagnostics are on, otherwise one force
+        sum is done here and reused by the next step."""
+        positions = self._positions
+        if not self._forcesAt(positions):
+            self._sumForces(positions, True)
+        masses = self._masses
+        velocities = self._velocities
+        kinetic = 0.5 * float(numpy.einsum("i,ij,ij->", masses, velocities,
+                                           velocities))
+        potential = 0.5 * float(self._potentials.sum())
+        return { "time"            : self._time,
+                 "kinetic"         : kinetic,
+                 "potential"       : potential,
+                 "energy"          : kinetic + potential,
+                 "momentum"        : masses @ velocities,
+                 "angularMomentum" : masses @ numpy.cross(positions,
+                                                          velocities),
+                 "centerOfMass"    : masses @ positions / masses.sum() }
+
+    def diagnosticsEnabled(self):
+        return self._diagnostics
+
+    def engineOption(self, optKey):
+        return self._engineOpts.get(optKey)
+
+    def forceEngine(self):
+        return self._forceEngine.name
+
+    def forceEvaluations(self):
+        """Number of force sums since the bodies were created.  A sum for
+        some of the bodies counts as that fraction of a full sum."""
+        return self._forceEvals
+
+    def generator(self):
+        return self._generator
+
     def gravitation(self):
         return self._G
 
     def jumpOneSecond(self):
         """Sum 3D forces on mass bodies, then update each body position and
-        velocities.
+        velocities.  With collision detection on, bodies are not moved when
+        any are colliding, and the first colliding pair is returned.
         """
-        self.sumForces()
-        if not self._collisionIndexes is None:
-            cdx = self._collisionIndexes
-            self._collisionIndexes = None
-#            self._collisionDetect  = False
-            return cdx
+        stepsDone, cdx, samples = self.advance(1)
+        return cdx
 
-        # [[f0X, f0Y, f0Z],[f1X, f1Y, f1Z], ...] / [[m0], [m1], ...]
-        #
-        accel3D = self._massForces / self._masses[:, numpy.newaxis]
-
-        # Determine new mass positions
-        # posXYZ + velXYZ + (accelXYZ / 2.0)
-        # GRAV A: accel3D2 = accel3D / 2.0
-        # GRAV B: accel3D2 = accel3D 
-        accel3D2 = accel3D
-        newPos3D = self._positions + self._velocities + accel3D2
-
-        # final velocity = initial velocity + acceleration * time(=1)
-        newVel3D = self._velocities + accel3D
+    def initialCache(self):
+        return self._initCache
 
-        # set updated positions
-        self._positions  = newPos3D
-
-        # set updated velocities
-        self._velocities = newVel3D
-
-        self._time += 1
+    def integrator(self):
+        return self._integrator.name
 
     def massToSize(self, mass):
-        """Mass marker size kept in range from 10 - 60"""
+        """Mass marker size kept in range from 10 - 60, for a mass or an
+        array of masses"""
         mMin, mMax = self._massRange
         return 10.0 + (mass-mMin) / ((mMax-mMin) / 50.0)
     
@@ -153,67 +261,180 @@ class Gravity(object):
         """Merge two colliding bodies.  Add masses, combine velocities with
         each bodies momentum, add volumes to determine new size, combine
         colors"""
-        mass1 = self._masses[b1Index]
-        mass2 = self._masses[b2Index]
-        newMass = mass1 + mass2
-        
-        vel1 = self._velocities[b1Index]
-        vel2 = self._velocities[b2Index]
-        newVel = (mass1 * vel1 + mass2 * vel2) / newMass
-        
-        size1 = self._sizes[b1Index]
-        size2 = self._sizes[b2Index]
-        newSize = math.pow(size1,3) + math.pow(size2,3) 
-        newSize = math.pow(newSize, 1.0/3.0)
-
-        color1 = self._colors[b1Index]
-        color2 = self._colors[b2Index]
-        newColor  = (color1 + color2) / 2.0
-
-        if mass1 > mass2:
-            updIndex, delIndex = b1Index, b2Index
-        else:
-            updIndex, delIndex = b2Index, b1Index
-        self._masses[updIndex] = newMass
-        self._masses = numpy.delete(self._masses, delIndex)
-        self._velocities[updIndex] = newVel
-        self._velocities = numpy.delete(self._velocities, delIndex, axis=0)
-        self._sizes[updIndex] = newSize
-        self._sizes = numpy.delete(self._sizes, delIndex)
-        self._colors[updIndex] = newColor
-        self._colors = numpy.delete(self._colors, delIndex, axis=0)
-        self._positions = numpy.delete(self._positions, delIndex, axis=0)
-        self._bodyCount -= 1
-        
+        self.mergeCollisions(numpy.array([[b1Index, b2Index]]))
+
+    def mergeCollisions(self, pairs=None):
+        """Merge every group of colliding bodies, by default the pairs found
+        by the last jumpOneSecond.  Chained collisions (A-B, B-C) merge into
+        one body.  Each group adds masses, momentum and volumes, averages
+        colors and takes the position of its heaviest body.  Merged away
+        bodies are swap removed from the body store, so surviving bodies may
+        change index.  Returns the number of bodies removed.
+        """
+        if pairs is None:
+            pairs = self._collisionPairs
+        self._collisionPairs = None
+        if pairs is None or len(pairs) == 0:
+            return 0
+
+        bodyCount = self._masses.shape[0]
+        groups = _groupLabels(numpy.asarray(pairs), bodyCount)
+        counts = numpy.bincount(groups, minlength=bodyCount)
+
+        # Keep the heaviest body of each group, sorted by group then mass
+        byMass = numpy.lexsort((-self._masses, groups))
+        firstOfGroup = numpy.ones(bodyCount, dtype=bool)
+        firstOfGroup[1:] = groups[byMass][1:] != groups[byMass][:-1]
+        keepers = byMass[firstOfGroup]
+        keepers = keepers[counts[groups[keepers]] > 1]
+        keptGroups = groups[keepers]
+
+        masses = self._masses
+        groupMass = numpy.bincount(groups, weights=masses,
+                                   minlength=bodyCount)[keptGroups]
+        momentum = masses[:, numpy.newaxis] * self._velocities
+        groupMomentum = numpy.column_stack(
+            [ numpy.bincount(groups, weights=momentum[:, axis],
+                             minlength=bodyCount)[keptGroups]
+              for axis in range(3) ])
+        groupVolume = numpy.bincount(groups, weights=self._sizes ** 3,
+                                     minlength=bodyCount)[keptGroups]
+        groupColor = numpy.column_stack(
+            [ numpy.bincount(groups, weights=self._colors[:, chan],
+                             minlength=bodyCount)[keptGroups]
+              for chan in range(self._colors.shape[1]) ])
+        groupColor /= counts[keptGroups][:, numpy.newaxis]
+
+        self._masses[keepers] = groupMass
+        self._velocities[keepers] = groupMomentum / groupMass[:, numpy.newaxis]
+        self._sizes[keepers] = numpy.cbrt(groupVolume)
+        self._colors[keepers] = groupColor
+
+        # Swap remove the merged away bodies from the store in one pass
+        alive = counts[groups] == 1
+        alive[keepers] = True
+        removed = self._bodies.remove(numpy.nonzero(~alive)[0])
+        self._bindBodies()
+        self._integrator.reset()
+        self._bodyCount -= removed
+        return removed
+
     def printState(self):
         print(f"TIME = {self._time}")
         print(f"POSITIONS:\n", self._positions)
         print(f"VELOCITIES: {self._velocities}")
         print(f"MASSES: {self._masses}")
         print(f"FORCES: {self._massForces}")
+        if self._diagnostics:
+            diag = self.diagnostics()
+            print(f"ENERGY: {diag['energy']:.9g} KINETIC: {diag['kinetic']:.9g}"
+                  f" POTENTIAL: {diag['potential']:.9g}")
+            print(f"MOMENTUM: {diag['momentum']}")
+            print(f"ANGULAR MOMENTUM: {diag['angularMomentum']}")
+            print(f"CENTER OF MASS: {diag['centerOfMass']}")
 
     def options(self):
         """Return all gravity options in a dict"""
-        return {
+        opts = {
             "bodies"            : self._bodyCount,
             "G"                 : self._G,
             "massRange"         : self._massRange,
             "positionRange"     : self._posRange,
             "velocityRange"     : self._velRange,
-            "collisionDistance" : self._collisionDist
+            "collisionDistance" : self._collisionDist,
+            "forceEngine"       : self._forceEngine.name,
+            "integrator"        : self._integrator.name,
+            "generator"         : self._generator,
+            "seed"              : self._seed
             }
+        opts.update(self._engineOpts)
+        return opts
 
     def positionRange(self):
         return self._posRange
 
+    def seed(self):
+        return self._seed
+
     def setCollisiionDistance(self, dist):
         self._collisionDist = float(dist)
 
+    def restoreSnapshot(self, path):
+        """Restore bodies, time, options and integrator state saved by
+        saveSnapshot.  The body arrays are copy-on-write maps of an
+        uncompressed snapshot file, so restoring does not read them until
+        they are used."""
+        meta, arrays = snapshot.readSnapshot(path)
+        self.setOptions(meta["options"])
+        bodyCount = arrays["masses"].shape[0]
+        self._bodies.adopt(arrays, bodyCount)
+        self._bindBodies()
+        self._bodyCount = bodyCount
+        self._time = meta["time"]
+        self._collisionIndexes = None
+        self._collisionPairs = None
+        self._integrator.reset()
+        prefix = "integrator."
+        self._integrator.setState({ name[len(prefix):]: array
+                                    for name, array in arrays.items()
+                                    if name.startswith(prefix) })
+        self._forceEvals = meta.get("forceEvaluations", 0)
+
+    def saveSnapshot(self, path, compress=False):
+        """Save bodies, time and options to a snapshot file that
+        restoreSnapshot can resume from"""
+        arrays = { "positions"  : self._positions,
+                   "velocities" : self._velocities,
+                   "masses"     : self._masses,
+                   "sizes"      : self._sizes,
+                   "colors"     : self._colors }
+        for name, array in self._integrator.state().items():
+            arrays["integrator." + name] = array
+        meta = { "time"             : self._time,
+                 "forceEvaluations" : self._forceEvals,
+                 "options"          : self.options() }
+        snapshot.writeSnapshot(path, arrays, meta, compress)
+
     def setBodyCount(self, count):
         self._bodyCount = count
 
+    def setEngineOption(self, optKey, optValue):
+        self._engineOpts[optKey] = optValue
+        self._forceEngine.setOptions(self._engineOpts)
+        self._integrator.reset()
+        self._passPositions = None
+
+    def setForceEngine(self, name):
+        if name == self._forceEngine.name:
+            return
+        engine = forces.newForceEngine(name)
+        engine.setOptions(self._engineOpts)
+        self._forceEngine.close()
+        self._forceEngine = engine
+        self._integrator.reset()
+        self._passPositions = None
+
+    def setGenerator(self, name):
+        if name not in generators.GENERATORS:
+            raise ValueError(f"Unknown body generator: {name}")
+        self._generator = name
+
+    def setDiagnostics(self, value):
+        """Collect body potential energies in every full force sum, so
+        diagnostics() costs no extra force sums.  Off, force sums skip
+        them."""
+        self._diagnostics = bool(value)
+        self._passPositions = None
+
     def setGravitation(self, grav):
         self._G = grav
+        self._integrator.reset()
+        self._passPositions = None
+
+    def setIntegrator(self, name):
+        if name == self._integrator.name:
+            return
+        self._integrator = integrators.newIntegrator(name)
 
     def setMassRange(self, massMin, massMax):
         self._massRange = (massMin, massMax)
@@ -230,104 +451,143 @@ class Gravity(object):
         self._posRange = val if val is not None else (-200.0, 200.0)
         val = gravOpts.get("velocityRange")
         self._velRange = val if val is not None else (-0.2, 0.2)
+        self._seed = gravOpts.get("seed")
+        val = gravOpts.get("generator")
+        self._generator = val if val is not None else "box"
         val = gravOpts.get("collisionDistance")
         self._collisionDist = val if val is not None else 5.0
+        for optKey, default in forces.ENGINE_OPTIONS.items():
+            val = gravOpts.get(optKey)
+            self._engineOpts[optKey] = val if val is not None else default
+        self._forceEngine.setOptions(self._engineOpts)
+        val = gravOpts.get("forceEngine")
+        self.setForceEngine(val if val is not None else "vector")
+        val = gravOpts.get("integrator")
+        self.setIntegrator(val if val is not None else "euler")
+        self._integrator.reset()
+        self._passPositions = None
+
+    def setInitialCache(self, cache):
+        """Cache seeded bodies in an iccache.InitialConditionsCache, None
+        to always generate them"""
+        self._initCache = cache
 
     def setPositionRange(self, posMin, posMax):
         self._posRange = (posMin, posMax)
 
+    def setSeed(self, seed):
+        """Seed for createRandomBodies, None for different bodies each time"""
+        self._seed = None if seed is None else int(seed)
+
     def setVelocityRange(self, velMin, velMax):
         self._velRange = (velMin, velMax)
 
-    def sumForces(self):
-        """
-        Sum forces for each body.  For each body in make it m2 [v2x, v2y, v2z].
-        Then create lists of other masses and positions [m1, m3, m4, ...]
-        [ [x1, y1, z1], [x3, y3, z3], [x4, y4, z4], ...].  Then calculate
-        distances between current body and other bodies [d1, d3, d4, ...].
-        Then build a list of vector normals between current body and all other
-        bodies [ [n1x, n1y, n1z], [n3x, n3y, n3z], [n4x, n4y, n4z], ...].
-        Then calculate the 3D gravitational force between this mass and other
-        bodies.
-          m2 * other masses:
-            [[m2m1x,m2m1y,m2m1z],[m2m3x,m2m3y,m2m3z],[m2m4x,m2m4y,m2m4z] ...]
-          m2 * other masses / other distances
-            [[m2m1x,m2m1y,m2m1z]/m2m1d,[m2m3x,m2m3y,m2m3z]/m2m3d,
-             [m2m4x,m2m4y,m2m4z]/m2m3d ...]
-        Then calculate pull of other masses on current mass
-          m2 * other masses / other distances * -G
-            [[m2m1x,m2m1y,m2m1z]/m2m1d,[m2m3x,m2m3y,m2m3z]/m2m3d,
-             [m2m4x,m2m4y,m2m4z]/m2m3d ...] * -G
-        Lastly sum 3D force vectors of all ther bodies
-            [m2m1x,m2m1y,m2m1z]/m2m1d] + [m2m3x,m2m3y,m2m3z]/m2m3d] +
-            [m2m4x,m2m4y,m2m4z]/m2m3d ...] * -G
-        End result list of forceSums for each body
-           [ [F1x,F1y,F1z], [F2x,F2y,F2z], [F3x,F3y,F3z], [F4x,F4y,F4z], ...] 
+    def simulationTime(self):
+        """Simulated seconds since the bodies were created"""
+        return self._time
+
+    def sumForces(self, positions=None):
+        """Sum the 3D gravitational force on each body with the current force
+        engine into the body store's force buffer.  Forces are found for the
+        current body positions unless other positions are given.
         """
-        self._massForces = numpy.array([])
-        detectCollision = self._collisionDetect
-
-        # For each body calculate gravitatational force vectors of ather bodies
-        #    F = G * m1 * m2 / d ** 2
-        for bdx, mass2 in enumerate(self._masses):
-            # Make this body m2 and v2
-            m2Pos = self._positions[bdx]
-            m2Vel = self._velocities[bdx]
-            #print(f"MASS2 {mass2}  m2Pos={m2Pos}  m2Vel={m2Vel}")
-
-            # Lists of other masses and other velocity vectors
-            otherMasses = numpy.delete(self._masses, bdx)
-            otherPoses  = numpy.delete(self._positions, bdx, axis=0)
-            #print(f"OTHER MASSES = {otherMasses}  OTHER POSES = {otherPoses}")
-
-            # Get normalized vectors from current body to other bodies
-            m21Vecs = m2Pos - otherPoses
-            #print(f"m21Vecs {m21Vecs}")
-            m21Dists = numpy.linalg.norm(m21Vecs, axis=1)
-            #print(f"m21Dists = {m21Dists}  {m21Dists[:, numpy.newaxis]}")
-            m21Norms = m21Vecs / m21Dists[:, numpy.newaxis]
-            #print(f"m21Norms = {m21Norms}")
-
-            # if collision detection enabled, check distances
-            if detectCollision:
-                cds = numpy.where(m21Dists < self._collisionDist)
-                if cds[0].shape[0] > 0:
-                    cdx = cds[0][0]
-                    if cdx >= bdx:
-                        cdx += 1
-                    self._collisionIndexes = bdx, cdx
-                    detectCollision = False
-
-            # Get vector forces between current mass and other masses 
-            m2m1s = mass2 * otherMasses
-            #print(f"m2m1s = {m2m1s}")
-            #GRAV A m2m1r1s = m2m1s / m21Dists
-            # GRAV C Should really be  m2m1r1s = m2m1s / (m21Dists ** 2)
-            m2m1r1s = m2m1s / m21Dists
-            #print(f"m2m1r1s = {m2m1r1s}")
-            m2fxyz = m2m1r1s[:, numpy.newaxis] * m21Norms
-            #print(f"m2fxyz = {m2fxyz}")
-
-            # Sum the list of force vectors
-            m2fsum = numpy.sum(m2fxyz, axis=0)
-            #print(f"m2fsum = {m2fsum}")
-
-            # Multiply force sums by gravitational constants to get
-            # forces in Newtons
-            m2GravVec = m2fsum * -self._G
-            #print(f"m2GravVec = {m2GravVec}")
-            self._massForces = numpy.append(self._massForces, m2GravVec)
-            # for qdx
-
-        # Rearrange force sums to list of 3D force vectors for each body
-        #   [ [F1x, F1y, F1z], [F2x, F2y, F2z], ... ]
-        self._massForces = self._massForces.reshape(-1,3)
+        if positions is None:
+            positions = self._positions
+        self._sumForces(positions, self._diagnostics)
 
     def velocityRange(self):
         return self._velRange
 
+    def _bindBodies(self):
+        """Point the body fields at the store's live bodies"""
+        bodies = self._bodies
+        self._positions  = bodies.positions()
+        self._velocities = bodies.velocities()
+        self._masses     = bodies.masses()
+        self._sizes      = bodies.sizes()
+        self._colors     = bodies.colors()
+        self._massForces = bodies.forces()
+        self._accels     = bodies.accels()
+        self._passPositions = None
+
+    def _sumForces(self, positions, withPotentials):
+        """Sum forces into the force buffer, and the body potential
+        energies at the same time if withPotentials"""
+        if not withPotentials:
+            self._forceEngine.sumForces(positions, self._masses, self._G,
+                                        self._massForces)
+            self._passPositions = None
+        else:
+            if self._potentials is None or \
+               self._potentials.shape != self._masses.shape:
+                self._potentials = numpy.empty_like(self._masses)
+            self._forceEngine.sumForces(positions, self._masses, self._G,
+                                        self._massForces,
+                                        potentials=self._potentials)
+            self._passPositions = numpy.array(positions)
+        self._forceEvals += 1
+
+    def _accelerations(self, positions, accels, targets=None):
+        """Fill accels with the acceleration of each body at positions,
+        passed to the integrator.  With an array of target body indexes,
+        accels holds the accelerations of just those bodies."""
+        if targets is not None:
+            targetForces = numpy.empty((targets.shape[0], 3))
+            self._forceEngine.sumForces(positions, self._masses, self._G,
+                                        targetForces, targets)
+            self._forceEvals += targets.shape[0] / self._masses.shape[0]
+            numpy.divide(targetForces, self._masses[targets, numpy.newaxis],
+                         out=accels)
+            return
+
+        if not self._forcesAt(positions):
+            self.sumForces(positions)
+
+        # [[f0X, f0Y, f0Z],[f1X, f1Y, f1Z], ...] / [[m0], [m1], ...]
+        #
+        numpy.divide(self._massForces, self._masses[:, numpy.newaxis],
+                     out=accels)
+
+    def _forcesAt(self, positions):
+        """Whether the force buffer and potentials hold the sums for
+        positions"""
+        return self._passPositions is not None and \
+            numpy.array_equal(positions, self._passPositions)
+
+    def _step(self, dt):
+        """Move every body forward dt seconds with the current integrator"""
+        self._integrator.step(self._positions, self._velocities,
+                              self._accels, self._accelerations, dt)
+        self._time += dt
+
     
 
+def _groupLabels(pairs, bodyCount):
+    """Union-find over body index pairs with array operations.  Returns
+    each body's group label, the lowest body index in its group.
+    """
+    labels = numpy.arange(bodyCount)
+    while True:
+        # Hook the root of each pair's higher label onto the lower one
+        firsts = labels[pairs[:, 0]]
+        seconds = labels[pairs[:, 1]]
+        lows = numpy.minimum(firsts, seconds)
+        hooked = labels.copy()
+        numpy.minimum.at(hooked, firsts, lows)
+        numpy.minimum.at(hooked, seconds, lows)
+
+        # Pointer jumping until every body points at its root
+        while True:
+            jumped = hooked[hooked]
+            if numpy.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+
+        if numpy.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
 def normalize(v):
     norm = numpy.linalg.norm(v)
     if norm == 0:
@@ -1,6 +1,7 @@
 """
 """
 
+import multiprocessing
 import time
 
 import gravity
@@ -83,6 +84,9 @@ class GutsMainWin(QWidget):
                 self._optWidget.raise_()
                 self._optWidget.setVisible(True)
 
+        elif event.key == "d":
+            self._optWidget.toggleDiagnostics()
+
         elif event.key == "m":
             if self.isMaximized():
                 self.showNormal()
@@ -92,6 +96,9 @@ class GutsMainWin(QWidget):
         elif event.key == "n":
             self._optWidget.newSimulation()
 
+        elif event.key == "p":
+            self._optWidget.toggleProfiling()
+
         elif event.key == "s":
             self._optWidget._startStopCB()
             
@@ -115,6 +122,9 @@ class GutsMainWin(QWidget):
 
 
 if __name__ == "__main__":
+    # Force engine worker processes in frozen app bundles
+    multiprocessing.freeze_support()
+
     app = QApplication([])
     
     mainWin = GutsMainWin()
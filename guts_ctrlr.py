@@ -1,8 +1,17 @@
 import math
 import sys
+import threading
+import time
 
 import gravity
+import guts_tubes
+import iccache
 import optstore
+import pacing
+import perfstats
+import simworker
+import trails
+import trajectory
 
 import numpy
 from vispy import app   as vispyApp
@@ -14,6 +23,11 @@ import vispy
 import vispy.scene.visuals# .Markers
 #import vispy.scene.visuals.Line
 
+
+BODY_LIMIT         = 16      # most bodies of a new simulation
+CLOUD_BODY_LIMIT   = 1000    # most in Cloud mode, 100 cloud bodies each
+EXACT_CLOUD_BODIES = 1600    # larger clouds use mesh on the background
+
 class GutsController(object):
 
     def __init__(self):
@@ -54,9 +68,39 @@ class GutsController(object):
 
         self._bodyCount = 3
         self._trailMax  = 1000
-        self._trailVis  = None
+        self._trailBuf  = None    # trails.TrailBuffer of the track trails
+        self._trackVis  = None    # one Line visual drawing every track
+        self._trackColors = None  # trail point colors, in ring order
+        self._tubeBuf   = None    # trails.TubeBuffer of the Tubular tubes
+        self._tubeVis   = None    # one TubeMesh visual drawing every tube
+        self._snakeBuf  = None    # trails.SnakeBuffer of the Snakes markers
+        self._snakeVis  = None    # one Markers visual drawing every snake
+        self._snakeFade = False   # fade older snake markers out
+
+        self._recording   = False    # record new simulations to trajPath
+        self._trajPath    = "guts.gtr"
+        self._recorder    = None     # TrajectoryWriter while recording
+        self._replay      = None     # TrajectoryReader in Replay mode
+        self._replayFrame = 0
 
         self._t2Marker = None
+
+        self._diagEnergy = None    # first energy shown, for the drift
+
+        self._profiling  = False   # time frames into _frameStats
+        self._frameStats = None    # perfstats.FrameStats once profiled
+        self._statsPath  = "guts-frames.csv"   # frame times saved on quit
+        self._statsHUD   = None    # frame times Text on the canvas
+
+        self._background = False   # step physics on a background thread
+        self._simWorker  = None    # simworker.SimulationWorker while running
+        self._modelLock  = threading.RLock()   # held by the worker's steps
+        self._syncFrame  = simworker.Frame()   # frame stepped by the timer
+        self._shownFrame = None    # frame shown by the last frame action
+
+        self._pacer = pacing.FramePacer(frameInterval=self._frameRate)
+        self._pacingBehind = False # pacer was behind at the last frame
+        self._framePhysics = 0.0   # seconds stepping in the current frame
         
     def actionAddMarker(self):
         newPos   = numpy.random.normal(size=(1, 3), loc=0, scale=100)
@@ -94,74 +138,68 @@ class GutsController(object):
             return
          
         self.clearScene()
+        self._closeTrajectory()
+        if self._frameMode == "Replay":
+            self._startReplay()
+            return
+
         self._gravity.setBodyCount(self._bodyCount)
         self._gravity.detectCollisions(self._frameMode == "Merge")
 
         self._orbStore = self._mainWin.orbStore()
 
-        self._radiiVis = None
-        self._trails = None
-        self._trailLen = 0
-        self._trailVis = None
-        self._tubeColors = None
-        self._tubeSizes  = None
-        
         if self._frameMode == "Cloud":
+            self._setLargeCloudEngine(self._bodyCount*100)
             self._gravity.setBodyCount(self._bodyCount*100)
         else:
             self._gravity.setBodyCount(self._bodyCount)
             
         self._gravity.createRandomBodies()
         #self._gravity.printState()
+        self._startFrameMode()
 
-        bodyPoses = self._gravity.bodyPositions()
-        self._makeBodyMarkers()
-
-        if self._frameMode == "Cloud":
-            self._frameAction = self._frameActionCloud
-            
-        elif self._frameMode == "Move":
-            self._frameAction = self._frameActionMove
-            
-        elif self._frameMode == "Merge":
-            self._frameAction = self._frameActionMerge
-            
-        elif self._frameMode == "Radii":
-            self._frameAction = self._frameActionRadii
-            self._radiiVis = [ ]
-            for pos in bodyPoses:
-                radii = numpy.array([self._sceneOrigin, pos])
-                line = vispyScene.visuals.Line(pos=radii, color=(1.0, 1.0, 0.0),
-                                               parent=self._vpView.scene,
-                                               width=0.5, method="gl",
-                                               antialias=True)
-                self._radiiVis.append(line)
-
-        elif self._frameMode == "Snakes":
-            self._frameAction = self._frameActionSnakes
-
-        elif self._frameMode == "Spheres":
-            self._frameAction = self._frameActionSpheres
+    def actionQuit(self):
+        self.actionStopSimulation()
+        self._closeTrajectory()
+        if self._frameStats is not None and self._frameStats.frameCount():
+            try:
+                self._frameStats.writeCSV(self._statsPath)
+            except OSError as osx:
+                print(f"GUTS ERROR: Can't write frame times: {osx}")
+        if self._gravity:
+            self._gravity.close()
+        if self._vpApp:
+            self._vpApp.quit()
 
-        elif self._frameMode == "SphereTrails":
-            self._frameAction = self._frameActionSpheresWithTrails
+    def actionRestoreSnapshot(self, path):
+        """Replace the bodies with a saved snapshot and show them in the
+        current frame mode, ready to continue"""
+        if self._running:
+            return
+        if self._frameMode == "Replay":
+            print("GUTS ERROR: Can't restore a snapshot in Replay mode")
+            return
 
-        elif self._frameMode == "Trails":
-            self._frameAction = self._frameActionTrails
-            self._trails = numpy.array(self._gravity.bodyPositions())
-        
-        elif self._frameMode == "Tubular":
-            self._frameAction = self._frameActionTubular
-            self._trails = numpy.array(self._gravity.bodyPositions())
-        
-        self._optionsUI.setRunning(False)
+        try:
+            self._gravity.restoreSnapshot(path)
+        except (OSError, ValueError, KeyError) as snpx:
+            print(f"GUTS ERROR: Can't restore snapshot: {snpx}")
+            return
+        self.clearScene()
+        self._closeTrajectory()
+        self._gravity.detectCollisions(self._frameMode == "Merge")
+        self._orbStore = self._mainWin.orbStore()
 
-        self._mainWin.setWindowTitle("GUTS - %s(%s)" %
-                                     (self._frameMode, bodyPoses.shape[0]))
+        # Show the restored options, they stay with the current frame mode
+        self._stashOptions(self._frameMode)
+        self._restoreOptions(self._frameMode)
+        self._startFrameMode()
 
-    def actionQuit(self):
-        if self._vpApp:
-            self._vpApp.quit()
+    def actionSaveSnapshot(self, path):
+        try:
+            self._gravity.saveSnapshot(path)
+        except OSError as osx:
+            print(f"GUTS ERROR: Can't save snapshot: {osx}")
 
     def actionSaveOptions(self):
         self._stashOptions(self._frameMode)
@@ -183,10 +221,19 @@ class GutsController(object):
             spinBTN.setText("Spin On")
         
     def actionStartSimulation(self):
-        if self._gravity.bodyPositions() is None:
+        if self._frameMode == "Replay":
+            if self._replay is None:
+                return  # No trajectory open
+        elif self._gravity.bodyPositions() is None:
             return  # No simulation ready
         if self._frameMode == "Merge":
             self._gravity.detectCollisions(True)
+        self._pacer.reset()
+        if self._background and self._frameMode != "Replay":
+            self._simWorker = simworker.SimulationWorker(
+                self._gravity, self._modelLock, self._frameMode == "Merge",
+                self._recorder, self._pacer)
+            self._simWorker.start()
         self._running = True
         if self._optionsUI:
             self._optionsUI.setRunning(self._running)
@@ -196,144 +243,173 @@ class GutsController(object):
         if self._running:
             self._vpAppTimer.stop()
             self._running = False
+            if self._simWorker is not None:
+                self._stopWorker()
+            if self._frameStats is not None:
+                self._frameStats.pause()
             if self._optionsUI:
                 self._optionsUI.setRunning(self._running)
              
     def advanceOneFrame(self, mode="add"):
+        if self._profiling:
+            self._frameStats.beginFrame()
+        frameStart = time.perf_counter()
+        self._framePhysics = 0.0
+        self._shownFrame = None
         self._frameAction()
+        frame = self._shownFrame
+        if frame is not None:
+            if self._simWorker is not None:
+                self._pacer.frameStepCount = frame.steps
+            if frame.diagnostics is not None:
+                self._showDiagnostics(frame.diagnostics)
+            self._pacer.rendered(time.perf_counter() - frameStart -
+                                 self._framePhysics)
+            self._reportPacing()
+        if self._profiling:
+            self._frameStats.endFrame(self._gravity.bodyCount())
+            self._statsHUD.text = "%s\n%s" % (self._frameStats.summary(),
+                                              self._pacer.status())
 
     def _frameActionCloud(self):
-        coll = self._gravity.jumpOneSecond()
-        newPos = self._gravity.bodyPositions()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._firstMarkers.set_data(pos=newPos,
+        self._firstMarkers.set_data(pos=frame.positions,
                                     size=5.0,
                                     face_color=self._cloudRGBA,
                                     edge_color=None)
 
     def _frameActionMerge(self):
-        coll       = self._gravity.jumpOneSecond()
-        newPos     = self._gravity.bodyPositions()
-        bodySizes  = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
+        coll = frame.collision
         if coll:
-            self._gravity.mergeBodies(coll[0], coll[1])
-            self._makeBodyMarkers()
-            title = f"GUTS - Merge({self._gravity.bodyCount()}) :"
-            title = f"{title} Mass {coll[0]} collided with mass {coll[1]}"
+            title = f"GUTS - Merge({frame.bodyCount}) :"
+            if frame.pairCount == 1:
+                title = f"{title} Mass {coll[0]} collided with mass {coll[1]}"
+            else:
+                title = (f"{title} {frame.pairCount} collisions merged"
+                         f" {frame.merged} masses")
             self._mainWin.setWindowTitle(title)
-#            self._gravity.detectCollisions(self._frameMode == "Merge")
-                
-        self._firstMarkers.set_data(pos=newPos, size=bodySizes,
+
+        self._firstMarkers.set_data(pos=frame.positions, size=frame.sizes,
                                     edge_width=0.0,
                                     edge_width_rel=None,
                                     edge_color='white',
-                                    face_color=bodyColors,
+                                    face_color=frame.colors,
                                     symbol='o')
 
     def _frameActionMove(self):
-        coll = self._gravity.jumpOneSecond()
-        newPos = self._gravity.bodyPositions()
-        bodySizes = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._firstMarkers.set_data(pos=newPos, size=bodySizes,
+        self._firstMarkers.set_data(pos=frame.positions, size=frame.sizes,
                                     edge_width=0.0,
                                     edge_width_rel=None,
                                     edge_color='white',
-                                    face_color=bodyColors,
+                                    face_color=frame.colors,
                                     symbol='o')
 
     def _frameModeNull(self):
         pass
     
     def _frameActionRadii(self):
-        coll = self._gravity.jumpOneSecond()
-        newPos = self._gravity.bodyPositions()
-        bodySizes = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._firstMarkers.set_data(pos=newPos, size=bodySizes,
+        self._firstMarkers.set_data(pos=frame.positions, size=frame.sizes,
                                     edge_width=0.0,
                                     edge_width_rel=None,
                                     edge_color='white',
-                                    face_color=bodyColors,
+                                    face_color=frame.colors,
                                     symbol='o')
         
-        for pos, rVis in zip(newPos, self._radiiVis):
+        for pos, rVis in zip(frame.positions, self._radiiVis):
             pnts = numpy.array([ self._sceneOrigin, pos ])
             rVis.set_data(pos=pnts)
 
-    def _frameActionSnakes(self):
-        coll       = self._gravity.jumpOneSecond()
-        newPos     = self._gravity.bodyPositions()
-        bodySizes  = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+    def _frameActionReplay(self):
+        if self._replayFrame + 1 >= self._replay.frameCount():
+            # Pick up frames recorded since the file was opened
+            self._replay.refresh()
+            self._optionsUI.setReplayRange(self._replay.frameCount())
+            if self._replayFrame + 1 >= self._replay.frameCount():
+                self.actionStopSimulation()
+                return
+        self._showReplayFrame(self._replayFrame + 1)
 
-        newVis = vispyScene.visuals.Markers(pos=newPos,
-                                            size=bodySizes,
-                                            antialias=0,
-                                            face_color=bodyColors,
-                                            edge_color='white',
-                                            edge_width=0,
-                                            scaling=True,
-                                            spherical=True)
-        newVis.parent = self._vpView.scene
+    def _frameActionSnakes(self):
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._trailLen += 1
-        if self._trailLen > self._trailMax:
-            subSceneKids = self._vpView.children[0].children
-            if len(subSceneKids) > 2:
-                subSceneKids[2].parent = None
+        self._makeSnakes(frame.positions, frame.colors, frame.sizes)
 
     def _frameActionSpheres(self):
-        coll       = self._gravity.jumpOneSecond()
-        newPos     = self._gravity.bodyPositions()
-        self._orbStore.moveSpheres(newPos)
+        frame = self._nextFrame()
+        if frame is None:
+            return
+        self._orbStore.moveSpheres(frame.positions)
 
     def _frameActionSpheresWithTrails(self):
-        coll       = self._gravity.jumpOneSecond()
-        newPos     = self._gravity.bodyPositions()
-        self._orbStore.moveSpheres(newPos)
-        bodySizes = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
+        self._orbStore.moveSpheres(frame.positions)
 
-        self._makeTracks(newPos, bodyColors, bodySizes)
+        self._makeTracks(frame.positions, frame.colors, frame.sizes)
         
     def _frameActionTrails(self):
-        coll = self._gravity.jumpOneSecond()
-        newPos = self._gravity.bodyPositions()
-        bodySizes = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._firstMarkers.set_data(pos=newPos, size=bodySizes,
+        self._firstMarkers.set_data(pos=frame.positions, size=frame.sizes,
                                     edge_width=0.0,
                                     edge_width_rel=None,
                                     edge_color='white',
-                                    face_color=bodyColors,
+                                    face_color=frame.colors,
                                     symbol='o')
-        self._makeTracks(newPos, bodyColors, bodySizes)
+        self._makeTracks(frame.positions, frame.colors, frame.sizes)
 
     def _frameActionTubular(self):
-        coll = self._gravity.jumpOneSecond()
-        newPos = self._gravity.bodyPositions()
-        bodySizes = self._gravity.bodySizes()
-        bodyColors = self._gravity.bodyColors()
+        frame = self._nextFrame()
+        if frame is None:
+            return
 
-        self._firstMarkers.set_data(pos=newPos, size=bodySizes,
+        self._firstMarkers.set_data(pos=frame.positions, size=frame.sizes,
                                     edge_width=0.0,
                                     edge_width_rel=None,
                                     edge_color='white',
-                                    face_color=bodyColors,
+                                    face_color=frame.colors,
                                     symbol='o')
 
-        self._makeTubes(newPos, bodyColors, bodySizes)
+        self._makeTubes(frame.positions, frame.colors, frame.sizes)
             
+    def backgroundPhysics(self):
+        return self._background
+
+    def backgroundPhysicsChanged(self, value):
+        """Step the bodies on a background thread from the next Start"""
+        self._background = bool(value)
+
     def bodyCountChanged(self, value):
         self._bodyCount = value
         self._gravity.setBodyCount(value)
 
+    def cacheBodies(self):
+        return self._gravity.initialCache() is not None
+
+    def cacheBodiesChanged(self, value):
+        cache = iccache.InitialConditionsCache() if value else None
+        self._gravity.setInitialCache(cache)
+
     def clearScene(self):
         viewKids = self._vpView.children
         subSceneKids = viewKids[0].children
@@ -342,36 +418,130 @@ class GutsController(object):
                 if obj.name != "GUTSAxis":
                     subSceneKids[mdx].parent = None
 
+    def diagnostics(self):
+        return self._gravity.diagnosticsEnabled()
+
+    def diagnosticsChanged(self, value):
+        self._changeModel(self._gravity.setDiagnostics, value)
+        self._diagEnergy = None
+        # A running worker shows them with its next frame
+        if value and self._frameMode != "Replay" and \
+           self._simWorker is None and \
+           self._gravity.bodyPositions() is not None:
+            self._showDiagnostics(self._gravity.diagnostics())
+
     def collDistChanged(self, value):
-        self._gravity.setCollisiionDistance(value)
+        self._changeModel(self._gravity.setCollisiionDistance, value)
 
     def collisionDistance(self):
         return self._gravity.collisionDistance()
 
+    def forceEngine(self):
+        return self._gravity.forceEngine()
+
+    def forceEngineChanged(self, value):
+        self._changeModel(self._gravity.setForceEngine,
+                          self._optionsUI.sender().currentText())
+
     def frameModeChanged(self, value):
         self._stashOptions(self._frameMode)
         self._frameMode = self._optionsUI.sender().currentText()
+        self._optionsUI.setBodyLimit(CLOUD_BODY_LIMIT
+                                     if self._frameMode == "Cloud"
+                                     else BODY_LIMIT)
         opts = self._restoreOptions(self._frameMode)
 
     def frameRateChanged(self, value):
         text = self._optionsUI.sender().currentText()
         rates = [1.0, 0.5, 0.25, 0.125, 0.0625, 1.0/60.0]
         self._frameRate = rates[value]
+        self._pacer.frameInterval = self._frameRate
         if self._vpAppTimer:
             self._vpAppTimer.interval = self._frameRate
         
+    def generator(self):
+        return self._gravity.generator()
+
+    def pacing(self):
+        return self._pacer.mode
+
+    def pacingChanged(self, value):
+        self._pacer.setMode(self._optionsUI.sender().currentText())
+
+    def simRate(self):
+        return self._pacer.simRate
+
+    def simRateChanged(self, value):
+        """Simulated seconds per wall clock second of rate pacing"""
+        self._pacer.simRate = value
+        self._pacer.reset()
+
+    def profiling(self):
+        return self._profiling
+
+    def profilingChanged(self, value):
+        """Time each frame's physics and visuals, with the mean times shown
+        on the simulation canvas"""
+        self._profiling = bool(value)
+        if self._profiling:
+            if self._frameStats is None:
+                self._frameStats = perfstats.FrameStats()
+            if self._statsHUD is None:
+                self._statsHUD = vispyScene.visuals.Text(
+                    "", color="white", font_size=8, anchor_x="left",
+                    anchor_y="top", pos=(10, 10),
+                    parent=self._mainWin.vispyCanvas().scene)
+            self._statsHUD.text = self._frameStats.summary()
+        else:
+            self._frameStats.pause()
+        self._statsHUD.visible = self._profiling
+
+    def generatorChanged(self, value):
+        self._gravity.setGenerator(self._optionsUI.sender().currentText())
+
     def gravityConst(self):
         return self._gravity.gravitation()
 
     def gravityConstChanged(self, value):
-        self._gravity.setGravitation(value)
+        self._changeModel(self._gravity.setGravitation, value)
+
+    def integrator(self):
+        return self._gravity.integrator()
+
+    def integratorChanged(self, value):
+        self._changeModel(self._gravity.setIntegrator,
+                          self._optionsUI.sender().currentText())
 
     def massRange(self):
         return self._gravity.massRange()
 
+    def meshPadding(self):
+        return self._gravity.engineOption("meshPadding")
+
+    def meshPaddingChanged(self, value):
+        self._changeModel(self._gravity.setEngineOption, "meshPadding", value)
+
+    def meshSize(self):
+        return self._gravity.engineOption("meshSize")
+
+    def meshSizeChanged(self, value):
+        self._changeModel(self._gravity.setEngineOption, "meshSize", value)
+
+    def openingAngle(self):
+        return self._gravity.engineOption("openingAngle")
+
+    def openingAngleChanged(self, value):
+        self._changeModel(self._gravity.setEngineOption, "openingAngle", value)
+
     def positionRange(self):
         return self._gravity.positionRange()
 
+    def recording(self):
+        return self._recording
+
+    def recordingChanged(self, value):
+        self._recording = bool(value)
+
     def recoverOptions(self):
         if len(sys.argv) > 1:
             optPath = sys.argv[1]
@@ -394,6 +564,24 @@ class GutsController(object):
             self._optStore.setCurrentOptions(opts)
             self._restoreOptions(self._frameMode)
 
+    def replaySeek(self, value):
+        """Show a replay frame without stepping through the frames before
+        it, trails restart at the new frame"""
+        if self._replay is None or value >= self._replay.frameCount():
+            return
+        self._clearTrails()
+        self._showReplayFrame(value)
+
+    def seed(self):
+        return self._gravity.seed()
+
+    def seedChanged(self, text):
+        """Seed for new simulations, blank for different bodies each time"""
+        try:
+            self._gravity.setSeed(int(text) if text.strip() else None)
+        except ValueError:
+            pass
+
     def setMainWin(self, mainWin):
         self._mainWin = mainWin
         self._vpView  = mainWin.vispyView()
@@ -418,16 +606,65 @@ class GutsController(object):
     def setUIView(self, uiView):
         self._optionsUI = uiView
         
+    def snakeFade(self):
+        return self._snakeFade
+
+    def snakeFadeChanged(self, value):
+        """Fade the Snakes markers out with age"""
+        self._snakeFade = bool(value)
+        if self._snakeVis is not None:
+            self._snakeVis.set_data(pos=self._snakeBuf.points(),
+                                    size=self._snakeBuf.sizes(),
+                                    face_color=self._snakeBuf.colors(
+                                        self._snakeFade),
+                                    edge_color='white', edge_width=0)
+
     def spinModeChanged(self, value):
         self._spinMode = self._optionsUI.sender().currentText()
         self._spinDeltas = self._spinModes[self._spinMode]
 
+    def trajectoryPath(self):
+        return self._trajPath
+
+    def trajectoryPathChanged(self, text):
+        self._trajPath = text
+
     def trailLengthChanged(self, value):
         self._trailMax = value
         
     def velocityRange(self):
         return self._gravity.velocityRange()
 
+    def workerCount(self):
+        return self._gravity.engineOption("workers")
+
+    def workersChanged(self, value):
+        self._changeModel(self._gravity.setEngineOption, "workers", value)
+
+    def _clearTrails(self):
+        if self._trackVis is not None:
+            self._trackVis.parent = None
+        if self._tubeVis is not None:
+            self._tubeVis.parent = None
+        if self._snakeVis is not None:
+            self._snakeVis.parent = None
+        self._trailLen = 0
+        self._trailBuf = None
+        self._trackVis = None
+        self._trackColors = None
+        self._tubeBuf  = None
+        self._tubeVis  = None
+        self._snakeBuf = None
+        self._snakeVis = None
+
+    def _closeTrajectory(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        if self._replay is not None:
+            self._replay.close()
+            self._replay = None
+
     def _makeBodyMarkers(self):
         if self._firstMarkers:
             if type(self._firstMarkers) is list:
@@ -464,103 +701,291 @@ class GutsController(object):
                                                 parent=self._vpView.scene)
         self._firstMarkers = newVis
 
+    def _makeSnakes(self, bodyPoses, bodyColors, bodySizes):
+        """Add the body markers to the snake ring buffer and redraw every
+        snake with the one Markers visual"""
+        if self._snakeBuf is None or \
+           self._snakeBuf.bodyCount() != bodyPoses.shape[0]:
+            self._snakeBuf = trails.SnakeBuffer(bodyPoses.shape[0],
+                                                self._trailMax)
+        self._snakeBuf.resize(self._trailMax)
+        self._snakeBuf.append(bodyPoses, bodySizes, bodyColors)
+
+        if self._snakeVis is None:
+            self._snakeVis = vispyScene.visuals.Markers(
+                antialias=0, scaling=True, spherical=True,
+                parent=self._vpView.scene)
+        self._snakeVis.set_data(pos=self._snakeBuf.points(),
+                                size=self._snakeBuf.sizes(),
+                                face_color=self._snakeBuf.colors(
+                                    self._snakeFade),
+                                edge_color='white', edge_width=0)
+
     def _makeTracks(self, bodyPoses, bodyColors, bodySizes):
-        bodyCount = bodyPoses.shape[0]
-        
-        if self._trailLen == 0:
-            self._trails = numpy.array(bodyPoses)
-            newLen    = 1
-            newTrails = self._trails.reshape(bodyCount, newLen*3)
-            newTrails = numpy.concatenate((newTrails,bodyPoses), axis=1)
-            self._trails = newTrails.reshape(bodyCount, newLen+1, 3)
-            self._trailLen += 1
-            self._trailVis = [ ]
-            parentVis = self._vpView.scene
-        
-            for tdx, endPoints in enumerate(self._trails):
-                newVis = vispyScene.visuals.Line(pos=endPoints,
-                                                 color=bodyColors[tdx],
-                                                 width=0.5, method="gl",
-                                                 antialias=True,
-                                                 parent=parentVis)
-                self._trailVis.append(newVis)
+        """Add the body positions to the trail ring buffer and redraw every
+        trail with the one Line visual"""
+        if self._trailBuf is None:
+            self._trailBuf = trails.TrailBuffer(bodyPoses.shape[0],
+                                                self._trailMax)
+        length = self._trailBuf.length
+        self._trailBuf.resize(self._trailMax)
+        if self._trailBuf.length != length:
+            self._trackColors = None
+        self._trailBuf.append(bodyPoses)
+        if self._trailBuf.count() < 2:
+            return
 
+        if self._trackColors is None:
+            self._trackColors = numpy.repeat(bodyColors,
+                                             self._trailBuf.length, axis=0)
+        if self._trackVis is None:
+            self._trackVis = vispyScene.visuals.Line(
+                pos=self._trailBuf.points(), color=self._trackColors,
+                connect=self._trailBuf.segments(), width=0.5, method="gl",
+                antialias=True, parent=self._vpView.scene)
         else:
-            # extending trails one segment, erase oldest segments > max
-            pntCount = self._trailLen + 1    # trailLen to point count
-            # Change bodyCount x pntCount x 3 3D array to 2D
-            newTrails = self._trails.reshape(bodyCount, pntCount*3)
-
-            # extend each 1D x0,y0,z0,x1,y1,z1 array by one xyz point
-            newTrails = numpy.concatenate((newTrails,bodyPoses), axis=1)
-
-            # Reshape extended 2D array back to 3D
-            self._trails = newTrails.reshape(bodyCount, pntCount+1, 3)
-            self._trailLen += 1
-            if self._trailLen > self._trailMax:
-                # Delete first vertex of each trail vertex list
-                self._trails = numpy.delete(self._trails, 0, axis=1)
-                self._trailLen = self._trailMax
-
-            # update each existing trail visual with new 3D line data
-            for tvx, trailVis in enumerate(self._trailVis):
-                trailVis.set_data(pos=self._trails[tvx])
+            self._trackVis.set_data(pos=self._trailBuf.points(),
+                                    color=self._trackColors,
+                                    connect=self._trailBuf.segments())
                 
     def _makeTubes(self, bodyPoses, bodyColors, bodySizes):
-        bodyCount = bodyPoses.shape[0]
-
-        if self._trailLen == 0:
-            # create tube heads
-            newLen = self._trailLen + 1
-            newTrails = self._trails.reshape(bodyCount, newLen*3)
-            newTrails = numpy.concatenate((newTrails,bodyPoses), axis=1)
-            self._trails = newTrails.reshape(bodyCount, newLen+1, 3)
-            self._trailLen += 1
-            self._trailVis = [ ]
-            parentVis = self._vpView.scene
-        
+        """Add a ring at the body positions to the tube buffer every other
+        frame and upload the new rings to the one TubeMesh visual"""
+        self._trailLen += 1
+        if self._trailLen % 2 == 0:
+            return  #only every other position
+        if self._tubeBuf is None:
+            bodyCount = bodyPoses.shape[0]
             # Add alpha to colors for tube colors
             alpha = numpy.ones((bodyCount, 1)) * 0.5
-            self._tubeColors = numpy.hstack( (bodyColors, alpha) )
-            self._tubeSizes  = bodySizes / 4.0
-            
-            for tdx, endPoints in enumerate(self._trails):
-                newVis = vispyScene.visuals.Tube(points=endPoints,
-                                                 color=self._tubeColors[tdx],
-                                                 radius=5.0,
-                                                 parent=parentVis)
-                self._trailVis.append(newVis)
-                
+            self._tubeBuf = trails.TubeBuffer(bodyCount,
+                                              self._trailMax // 2 + 1,
+                                              bodySizes / 4.0,
+                                              numpy.hstack((bodyColors[:, :3],
+                                                            alpha)))
+        self._tubeBuf.resize(self._trailMax // 2 + 1)
+        self._tubeBuf.append(bodyPoses)
+        if self._tubeBuf.count() < 2:
+            return
+
+        if self._tubeVis is None:
+            self._tubeVis = guts_tubes.TubeMesh(self._tubeBuf,
+                                                parent=self._vpView.scene)
+        else:
+            self._tubeVis.updateTubes()
+
+    def _recordFrame(self):
+        grav = self._gravity
+        self._recorder.writeFrame(grav.simulationTime(), grav.bodyPositions(),
+                                  grav.bodySizes(), grav.bodyColors())
+
+    def _changeModel(self, method, *args):
+        """Call a gravity model setter between the steps of a running
+        background worker"""
+        with self._modelLock:
+            method(*args)
+
+    def _nextFrame(self):
+        """Bodies for a frame action to show.  Steps the model one second,
+        or with a background worker takes its latest frame, None when it
+        has not finished a second since the last frame."""
+        worker = self._simWorker
+        if worker is None:
+            frame = self._syncFrame
+            steps = self._pacer.frameSteps() if self._running else 1
+            start = time.perf_counter()
+            simworker.stepFrame(self._gravity, frame,
+                                self._frameMode == "Merge", steps=steps,
+                                recorder=self._recorder)
+            self._framePhysics = time.perf_counter() - start
+            self._pacer.stepped(steps, self._framePhysics)
+            if self._profiling:
+                self._frameStats.addPhysics(self._framePhysics)
+        else:
+            if worker.error is not None and self._running:
+                self.actionStopSimulation()
+                return None
+            frame = worker.latestFrame()
+        self._shownFrame = frame
+        return frame
+
+    def _stopWorker(self):
+        """Stop the background worker and show the last second it
+        stepped"""
+        worker = self._simWorker
+        worker.stop()
+        if worker.error is not None:
+            print(f"GUTS ERROR: Physics step failed: {worker.error!r}")
+        else:
+            self._frameAction()
+            if self._shownFrame is not None and \
+               self._shownFrame.diagnostics is not None:
+                self._showDiagnostics(self._shownFrame.diagnostics)
+        self._simWorker = None
+
+    def _reportPacing(self):
+        """Say when the pacer starts and stops falling behind its target"""
+        behind = self._pacer.behind
+        if behind == self._pacingBehind:
+            return
+        self._pacingBehind = behind
+        if behind:
+            print(f"GUTS WARNING: Falling behind, {self._pacer.status()}")
         else:
-            # extend tubes
-            # Need to create new visuals, then delete previous vis (for now)
-            if self._trailLen % 2 == 0:
-                self._trailLen += 1
-                return  #only every other position
-            pntCount = (self._trailLen+1) // 2 + 1
-            newTrails = self._trails.reshape(bodyCount, pntCount*3)
-            newTrails = numpy.concatenate((newTrails,bodyPoses), axis=1)
-            self._trails = newTrails.reshape(bodyCount, pntCount+1, 3)
-            self._trailLen += 1
-            if self._trailLen > self._trailMax:
-                # Delete first vertex of each trail vertex list
-                self._trails = numpy.delete(self._trails, 0, axis=1)
-                self._trailLen = self._trailMax
-
-            newTrails = []
-            for tvx, trailVis in enumerate(self._trailVis):
-                newVis = vispyScene.visuals.Tube(points=self._trails[tvx],
-                                                 color=self._tubeColors[tvx],
-                                                 radius=self._tubeSizes[tvx],
-                                                 parent=self._vpView.scene)
-                trailVis.parent = None
-                newTrails.append(newVis)
-            self._trailVis = newTrails
+            print(f"GUTS: Back on pace, {self._pacer.status()}")
+
+    def _showDiagnostics(self, diag):
+        """Window title with the time, energy, energy drift since the first
+        shown energy, and the size of the momentum and angular momentum of
+        a Gravity.diagnostics() dict"""
+        energy = diag["energy"]
+        if self._diagEnergy is None:
+            self._diagEnergy = energy
+        drift = 0.0
+        if self._diagEnergy:
+            drift = (energy - self._diagEnergy) / abs(self._diagEnergy)
+        title = f"GUTS - {self._frameMode}({self._gravity.bodyCount()}) :"
+        title = (f"{title} t {diag['time']:g} E {energy:.6g} dE {drift:.2e}"
+                 f" |P| {numpy.linalg.norm(diag['momentum']):.3g}"
+                 f" |L| {numpy.linalg.norm(diag['angularMomentum']):.3g}")
+        self._mainWin.setWindowTitle(title)
+
+    def _showReplayFrame(self, frameNum):
+        time, positions, sizes, colors = self._replay.frame(frameNum)
+        if self._trailBuf is not None and \
+           self._trailBuf.bodyCount() != positions.shape[0]:
+            self._clearTrails()     # bodies merged
+
+        self._firstMarkers.set_data(pos=positions, size=sizes,
+                                    edge_width=0.0,
+                                    edge_width_rel=None,
+                                    edge_color='white',
+                                    face_color=colors,
+                                    symbol='o')
+        self._makeTracks(positions, colors, sizes)
+
+        self._replayFrame = frameNum
+        self._optionsUI.setReplayFrame(frameNum)
+        title = f"GUTS - Replay({positions.shape[0]}) :"
+        title = f"{title} frame {frameNum} time {time:g}"
+        self._mainWin.setWindowTitle(title)
+
+    def _startFrameMode(self):
+        """Set up the visuals and frame action of the current frame mode
+        for the bodies in the model"""
+        self._radiiVis = None
+        self._trailLen = 0
+        self._trailBuf = None
+        self._trackVis = None
+        self._trackColors = None
+        self._tubeBuf  = None
+        self._tubeVis  = None
+        self._snakeBuf = None
+        self._snakeVis = None
+
+        bodyPoses = self._gravity.bodyPositions()
+        self._makeBodyMarkers()
+
+        if self._frameMode == "Cloud":
+            self._frameAction = self._frameActionCloud
+            
+        elif self._frameMode == "Move":
+            self._frameAction = self._frameActionMove
+            
+        elif self._frameMode == "Merge":
+            self._frameAction = self._frameActionMerge
+            
+        elif self._frameMode == "Radii":
+            self._frameAction = self._frameActionRadii
+            self._radiiVis = [ ]
+            for pos in bodyPoses:
+                radii = numpy.array([self._sceneOrigin, pos])
+                line = vispyScene.visuals.Line(pos=radii, color=(1.0, 1.0, 0.0),
+                                               parent=self._vpView.scene,
+                                               width=0.5, method="gl",
+                                               antialias=True)
+                self._radiiVis.append(line)
+
+        elif self._frameMode == "Snakes":
+            self._frameAction = self._frameActionSnakes
+
+        elif self._frameMode == "Spheres":
+            self._frameAction = self._frameActionSpheres
+
+        elif self._frameMode == "SphereTrails":
+            self._frameAction = self._frameActionSpheresWithTrails
+
+        elif self._frameMode == "Trails":
+            self._frameAction = self._frameActionTrails
+            self._trailBuf = trails.TrailBuffer(bodyPoses.shape[0],
+                                                self._trailMax)
+            self._trailBuf.append(bodyPoses)
+        
+        elif self._frameMode == "Tubular":
+            self._frameAction = self._frameActionTubular
+            self._makeTubes(bodyPoses, self._gravity.bodyColors(),
+                            self._gravity.bodySizes())
+        
+        self._optionsUI.setRunning(False)
+
+        self._mainWin.setWindowTitle("GUTS - %s(%s)" %
+                                     (self._frameMode, bodyPoses.shape[0]))
+        self._diagEnergy = None
+        if self._gravity.diagnosticsEnabled():
+            self._showDiagnostics(self._gravity.diagnostics())
+
+        if self._recording:
+            try:
+                self._recorder = trajectory.TrajectoryWriter(self._trajPath)
+            except OSError as osx:
+                print(f"GUTS ERROR: Can't record trajectory: {osx}")
+            else:
+                self._recordFrame()
+
+    def _startReplay(self):
+        try:
+            self._replay = trajectory.TrajectoryReader(self._trajPath)
+        except (OSError, ValueError) as trjx:
+            print(f"GUTS ERROR: Can't replay trajectory: {trjx}")
+            return
+        if self._replay.frameCount() == 0:
+            print(f"GUTS ERROR: No frames in trajectory: {self._trajPath}")
+            self._closeTrajectory()
+            return
+
+        self._radiiVis = None
+        self._clearTrails()
+        self._firstMarkers = vispyScene.visuals.Markers(
+            antialias=0, scaling=True, spherical=True,
+            parent=self._vpView.scene)
+        self._frameAction = self._frameActionReplay
+        self._optionsUI.setReplayRange(self._replay.frameCount())
+        self._showReplayFrame(0)
+        self._optionsUI.setRunning(False)
 
     def _restoreOptions(self, mode):
         opts = self._optStore.options(mode)
         self._optionsUI.applyOptions(opts)
 
+    def _setLargeCloudEngine(self, bodyCount):
+        """Step clouds of more than EXACT_CLOUD_BODIES with the mesh engine
+        on the background thread, exact sums of that many bodies take
+        seconds a step and would stall the view"""
+        if bodyCount <= EXACT_CLOUD_BODIES:
+            return
+        changes = [ ]
+        if self.forceEngine() not in ("barneshut", "mesh"):
+            self._changeModel(self._gravity.setForceEngine, "mesh")
+            changes.append("mesh force engine")
+        if not self._background:
+            self._background = True
+            changes.append("background stepping")
+        if changes:
+            print(f"GUTS WARNING: {bodyCount} Cloud bodies, using "
+                  f"{' and '.join(changes)}")
+            self._stashOptions(self._frameMode)
+            self._restoreOptions(self._frameMode)
+
     def _spinTimerCB(self, event):
 #        print(f"_spinTimerCB: SA={self._spinAngles}")
         sa = self._spinAngles + self._spinDeltas
@@ -580,7 +1005,24 @@ class GutsController(object):
                  optstore.FRAME_RATE: self._frameRate,
                  optstore.SPIN_MODE:  self._spinMode,
                  optstore.TRAIL_LEN:  self._trailMax,
-                 optstore.COLL_DIST:  self.collisionDistance() }
+                 optstore.COLL_DIST:  self.collisionDistance(),
+                 optstore.FORCE_ENGINE: self.forceEngine(),
+                 optstore.OPEN_ANGLE: self.openingAngle(),
+                 optstore.WORKERS:    self.workerCount(),
+                 optstore.MESH_SIZE:  self.meshSize(),
+                 optstore.MESH_PAD:   self.meshPadding(),
+                 optstore.INTEGRATOR: self.integrator(),
+                 optstore.RECORD:     self._recording,
+                 optstore.TRAJ_PATH:  self._trajPath,
+                 optstore.SEED:       self.seed(),
+                 optstore.GENERATOR:  self.generator(),
+                 optstore.CACHE_BODIES: self.cacheBodies(),
+                 optstore.DIAGNOSTICS: self.diagnostics(),
+                 optstore.PROFILE:    self._profiling,
+                 optstore.BACKGROUND: self._background,
+                 optstore.PACING:     self.pacing(),
+                 optstore.SIM_RATE:   self.simRate(),
+                 optstore.SNAKE_FADE: self._snakeFade }
         self._optStore.updateOptions(mode, opts)
         
     def _vpAppTimerCB(self, event):
@@ -0,0 +1,214 @@
+"""
+Headless GUTS simulation runner for machines without a display.
+
+Runs gravity.Gravity without Qt or vispy, only NumPy is needed, and writes
+the final bodies, and optionally sampled positions, to a NumPy .npz file.
+A run can be saved to a snapshot file and resumed from it later.
+
+   python3 guts_headless.py --bodies 2000 --steps 500 --seed 1 \\
+       --engine barneshut --output run.npz
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy
+
+import forces
+import generators
+import gravity
+import iccache
+import integrators
+import trajectory
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a GUTS gravity simulation without a display")
+    parser.add_argument("-b", "--bodies", type=int, default=1000,
+                        help="number of random bodies (default 1000)")
+    parser.add_argument("-n", "--steps", type=int, default=100,
+                        help="simulated seconds to run (default 100)")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="random seed for the starting bodies")
+    parser.add_argument("--cache", nargs="?", const="", default=None,
+                        metavar="DIR",
+                        help="load seeded starting bodies from a cache, "
+                             "saving them on first use (default DIR "
+                             f"{iccache.defaultCacheDir()})")
+    parser.add_argument("-g", "--generator", default="box",
+                        choices=sorted(generators.GENERATORS),
+                        help="starting body preset (default box)")
+    parser.add_argument("-e", "--engine", default="vector",
+                        choices=sorted(forces.ENGINES),
+                        help="force engine (default vector)")
+    parser.add_argument("-i", "--integrator", default="euler",
+                        choices=sorted(integrators.INTEGRATORS),
+                        help="time integrator (default euler)")
+    parser.add_argument("--substeps", type=int, default=1,
+                        help="integration steps per second (default 1)")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="threads/processes engine workers, 0 for one "
+                             "per core")
+    parser.add_argument("-G", "--gravity", type=float, default=None,
+                        help="gravitational constant")
+    parser.add_argument("-m", "--merge", type=float, default=0.0,
+                        metavar="DIST",
+                        help="merge bodies closer than DIST (default off)")
+    parser.add_argument("--sample-stride", type=int, default=0,
+                        metavar="STEPS",
+                        help="save body positions every STEPS steps")
+    parser.add_argument("-o", "--output", default=None,
+                        help="write final state to this .npz file")
+    parser.add_argument("-t", "--trajectory", default=None,
+                        help="record every step to this trajectory file, "
+                             "for the GUI Replay mode")
+    parser.add_argument("--snapshot", default=None, metavar="PATH",
+                        help="save the final state to this snapshot file")
+    parser.add_argument("--compress", action="store_true",
+                        help="compress the --snapshot file")
+    parser.add_argument("--restore", default=None, metavar="PATH",
+                        help="resume from this snapshot file instead of "
+                             "creating random bodies")
+    parser.add_argument("-d", "--diagnostics", action="store_true",
+                        help="report energy, momentum and angular momentum "
+                             "at the start and end of the run")
+    args = parser.parse_args(argv)
+
+    if args.bodies < 1 or args.steps < 0 or args.substeps < 1:
+        parser.error("bodies and substeps must be positive, steps not "
+                     "negative")
+    if args.sample_stride and args.merge > 0.0:
+        parser.error("--sample-stride can not be used with --merge, merges "
+                     "change the body count")
+    if args.sample_stride and args.trajectory:
+        parser.error("--sample-stride can not be used with --trajectory, "
+                     "the trajectory has every step")
+    if args.cache is not None and args.seed is None:
+        parser.error("--cache needs --seed, only seeded bodies are cached")
+    return args
+
+
+def runSimulation(args):
+    """Create bodies and run them for args.steps seconds.  Returns the
+    Gravity model, the steps run, sampled positions or None, the number of
+    merges and the starting diagnostics or None."""
+    grav = gravity.Gravity()
+    if args.restore:
+        # The snapshot holds the options, only the engine workers change
+        grav.restoreSnapshot(args.restore)
+        grav.setEngineOption("workers", args.workers)
+    else:
+        grav.setEngineOption("workers", args.workers)
+        grav.setForceEngine(args.engine)
+        grav.setIntegrator(args.integrator)
+        if args.gravity is not None:
+            grav.setGravitation(args.gravity)
+        grav.setBodyCount(args.bodies)
+        grav.setSeed(args.seed)
+        grav.setGenerator(args.generator)
+        if args.cache is not None:
+            grav.setInitialCache(iccache.InitialConditionsCache(args.cache))
+        grav.createRandomBodies()
+
+    startDiag = None
+    if args.diagnostics:
+        grav.setDiagnostics(True)
+        startDiag = grav.diagnostics()
+
+    merges = 0
+    if args.merge > 0.0:
+        grav.setCollisiionDistance(args.merge)
+        grav.detectCollisions(True)
+
+    recorder = None
+    if args.trajectory:
+        recorder = trajectory.TrajectoryWriter(args.trajectory)
+        recorder.writeFrame(grav.simulationTime(), grav.bodyPositions(),
+                            grav.bodySizes(), grav.bodyColors())
+
+    # Recording needs every step, otherwise run to the next collision
+    stepsDone = 0
+    samples = None
+    try:
+        while stepsDone < args.steps:
+            runSteps = 1 if recorder else args.steps - stepsDone
+            steps, coll, samples = grav.advance(runSteps, args.substeps,
+                                                args.sample_stride)
+            stepsDone += steps
+            if coll is not None:
+                merges += grav.mergeCollisions()
+            elif recorder:
+                recorder.writeFrame(grav.simulationTime(),
+                                    grav.bodyPositions(), grav.bodySizes(),
+                                    grav.bodyColors())
+    finally:
+        if recorder:
+            recorder.close()
+    return grav, stepsDone, samples, merges, startDiag
+
+
+def writeOutput(path, grav, samples):
+    arrays = { "positions"  : grav.bodyPositions(),
+               "velocities" : grav.bodyVelocities(),
+               "masses"     : grav.bodyMasses(),
+               "sizes"      : grav.bodySizes(),
+               "colors"     : grav.bodyColors(),
+               "time"       : numpy.array(grav.simulationTime()) }
+    if samples is not None:
+        arrays["samples"] = samples
+    numpy.savez(path, **arrays)
+
+
+def main(argv=None):
+    startTime = time.perf_counter()
+    args = parseArgs(argv)
+
+    grav = None
+    try:
+        setupTime = time.perf_counter()
+        grav, stepsDone, samples, merges, startDiag = runSimulation(args)
+        runTime = time.perf_counter() - setupTime
+        endDiag = grav.diagnostics() if startDiag else None
+        if args.output:
+            writeOutput(args.output, grav, samples)
+        if args.snapshot:
+            grav.saveSnapshot(args.snapshot, args.compress)
+    finally:
+        if grav is not None:
+            grav.close()
+
+    wallTime = time.perf_counter() - startTime
+    stepRate = stepsDone / runTime if runTime > 0.0 else 0.0
+    opts = grav.options()
+    print(f"{grav.bodyCount()} bodies, {stepsDone} steps,"
+          f" {opts['forceEngine']} engine, {opts['integrator']} integrator,"
+          f" t={grav.simulationTime():g}")
+    if args.merge > 0.0:
+        print(f"{merges} bodies merged, {grav.bodyCount()} remain")
+    print(f"{stepRate:.2f} steps/s, {grav.forceEvaluations():.0f} force sums,"
+          f" run {runTime:.3f} s, wall {wallTime:.3f} s")
+    if endDiag:
+        startE = startDiag["energy"]
+        drift = (endDiag["energy"] - startE) / abs(startE) if startE else 0.0
+        print(f"energy {startE:.9g} -> {endDiag['energy']:.9g},"
+              f" drift {drift:.3e}")
+        for key, name in (("momentum", "momentum"),
+                          ("angularMomentum", "angular momentum")):
+            print(f"{name} |{numpy.linalg.norm(startDiag[key]):.6g}| ->"
+                  f" |{numpy.linalg.norm(endDiag[key]):.6g}|")
+    if args.output:
+        print(f"state written to {args.output}")
+    if args.trajectory:
+        print(f"trajectory written to {args.trajectory}")
+    if args.snapshot:
+        print(f"snapshot written to {args.snapshot}")
+    return 0
+
+
+if __name__ == "__main__":
+    # Force engine worker processes in frozen builds
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,16 +1,20 @@
 import gravity
 import optstore
 
+from PyQt6.QtCore import Qt
 from PyQt6.QtCore import QObject, pyqtSlot
 from PyQt6.QtWidgets import (QMainWindow,
+                             QCheckBox,
                              QComboBox,
                              QDialog,
                              QDoubleSpinBox,
+                             QFileDialog,
                              QGroupBox,
                              QHBoxLayout,
                              QLabel,
                              QLineEdit,
                              QPushButton,
+                             QSlider,
                              QSpinBox,
                              QVBoxLayout,
                              QWidget)
@@ -81,13 +85,95 @@ class OptionsView(QDialog):
         optval = opts.get(optstore.TRAIL_LEN)
         if optval is not None:
             self._trailLenSBX.setValue(optval)
+        optval = opts.get(optstore.SNAKE_FADE)
+        if optval is not None:
+            self._snakeFadeCHK.setChecked(bool(optval))
         optval = opts.get(optstore.COLL_DIST)
         if optval is not None:
             self._collDistSBX.setValue(int(optval))
+        optval = opts.get(optstore.FORCE_ENGINE)
+        if optval is not None:
+            engineIndex = self._forceEngineCOMBO.findText(optval)
+            if engineIndex < 0:
+                engineIndex = 0
+            self._forceEngineCOMBO.setCurrentIndex(engineIndex)
+        optval = opts.get(optstore.OPEN_ANGLE)
+        if optval is not None:
+            self._openAngleSBX.setValue(optval)
+        optval = opts.get(optstore.WORKERS)
+        if optval is not None:
+            self._workersSBX.setValue(int(optval))
+        optval = opts.get(optstore.MESH_SIZE)
+        if optval is not None:
+            self._meshSizeSBX.setValue(int(optval))
+        optval = opts.get(optstore.MESH_PAD)
+        if optval is not None:
+            self._meshPadSBX.setValue(optval)
+        optval = opts.get(optstore.INTEGRATOR)
+        if optval is not None:
+            integIndex = self._integratorCOMBO.findText(optval)
+            if integIndex < 0:
+                integIndex = 0
+            self._integratorCOMBO.setCurrentIndex(integIndex)
+        optval = opts.get(optstore.RECORD)
+        if optval is not None:
+            self._recordCHK.setChecked(bool(optval))
+        optval = opts.get(optstore.TRAJ_PATH)
+        if optval is not None:
+            self._trajPathLE.setText(optval)
+        optval = opts.get(optstore.GENERATOR)
+        if optval is not None:
+            genIndex = self._generatorCOMBO.findText(optval)
+            if genIndex < 0:
+                genIndex = 0
+            self._generatorCOMBO.setCurrentIndex(genIndex)
+        optval = opts.get(optstore.SEED)
+        self._seedLE.setText("" if optval is None else str(optval))
+        optval = opts.get(optstore.CACHE_BODIES)
+        if optval is not None:
+            self._cacheCHK.setChecked(bool(optval))
+        optval = opts.get(optstore.DIAGNOSTICS)
+        if optval is not None:
+            self._diagCHK.setChecked(bool(optval))
+        optval = opts.get(optstore.PROFILE)
+        if optval is not None:
+            self._profileCHK.setChecked(bool(optval))
+        optval = opts.get(optstore.PACING)
+        if optval is not None:
+            paceIndex = self._pacingCOMBO.findText(optval)
+            if paceIndex < 0:
+                paceIndex = 0
+            self._pacingCOMBO.setCurrentIndex(paceIndex)
+        optval = opts.get(optstore.SIM_RATE)
+        if optval is not None:
+            self._simRateSBX.setValue(optval)
+        optval = opts.get(optstore.BACKGROUND)
+        if optval is not None:
+            self._backgroundCHK.setChecked(bool(optval))
 
     def newSimulation(self):
         self._optCtrlr.actionNewSimulation()
     
+    def toggleDiagnostics(self):
+        self._diagCHK.setChecked(not self._diagCHK.isChecked())
+
+    def toggleProfiling(self):
+        self._profileCHK.setChecked(not self._profileCHK.isChecked())
+
+    def setBodyLimit(self, limit):
+        """Most bodies the Bodies option allows in the current frame mode"""
+        self._bodiesSBX.setMaximum(limit)
+
+    def setReplayFrame(self, frameNum):
+        self._replaySLD.blockSignals(True)
+        self._replaySLD.setValue(frameNum)
+        self._replaySLD.blockSignals(False)
+
+    def setReplayRange(self, frameCount):
+        self._replaySLD.blockSignals(True)
+        self._replaySLD.setRange(0, max(frameCount - 1, 0))
+        self._replaySLD.blockSignals(False)
+
     def setRunning(self, running):
         self._newSimBTN.setEnabled(not running)
         self._startStopBTN.setEnabled(True)
@@ -95,6 +181,8 @@ class OptionsView(QDialog):
         self._addBTN.setEnabled(not running)
         self._delBTN.setEnabled(not running)
         self._frameModeCOMBO.setEnabled(not running)
+        self._saveSnapBTN.setEnabled(not running)
+        self._restoreSnapBTN.setEnabled(not running)
         
     def _makeActionsUI(self):
         actslo = self._actsLayout
@@ -139,6 +227,16 @@ class OptionsView(QDialog):
         wgt.clicked.connect(self._optCtrlr.actionSaveOptions)
         self._saveOptionsBTN = wgt
 
+        wgt = QPushButton("Save Snapshot")
+        actslo.addWidget(wgt)
+        wgt.clicked.connect(self._saveSnapshotCB)
+        self._saveSnapBTN = wgt
+
+        wgt = QPushButton("Restore Snapshot")
+        actslo.addWidget(wgt)
+        wgt.clicked.connect(self._restoreSnapshotCB)
+        self._restoreSnapBTN = wgt
+
         quitBTN = QPushButton("Quit")
         actslo.addWidget(quitBTN)
         quitBTN.clicked.connect(self._optCtrlr.actionQuit)
@@ -246,6 +344,43 @@ class OptionsView(QDialog):
         velHbox.addWidget(self._velMaxLE)
         pvbox.addLayout(velHbox)
 
+        # Body Generator Preset Option Menu
+        lbl = QLabel()
+        lbl.setText("Generator: ")
+
+        wgt = QComboBox()
+        wgt.insertItems(0, ["box", "sphere", "bang", "plummer", "disk"])
+        wgt.setCurrentIndex(0)
+        wgt.currentIndexChanged.connect(ctlr.generatorChanged)
+        self._generatorCOMBO = wgt
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        pvbox.addLayout(hbox)
+
+        # Random Seed, blank for new bodies every time, and Body Cache
+        lbl = QLabel()
+        lbl.setText("Seed:")
+
+        wgt = QLineEdit()
+        seed = ctlr.seed()
+        wgt.setText("" if seed is None else str(seed))
+        wgt.setPlaceholderText("random")
+        wgt.textChanged.connect(ctlr.seedChanged)
+        self._seedLE = wgt
+
+        wgt2 = QCheckBox("Cache Bodies")
+        wgt2.setChecked(ctlr.cacheBodies())
+        wgt2.toggled.connect(ctlr.cacheBodiesChanged)
+        self._cacheCHK = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
         # Frame Mode Option Menu
         frameModeLBL = QLabel()
         frameModeLBL.setText("Frame Mode: ")
@@ -253,7 +388,7 @@ class OptionsView(QDialog):
         wgt = QComboBox()
         wgt.insertItems(0, ["Move","Radii","Trails","Tubular",
                             "Snakes","Merge","Cloud", "Spheres",
-                            "SphereTrails"])
+                            "SphereTrails", "Replay"])
         wgt.currentIndexChanged.connect(ctlr.frameModeChanged)
         self._frameModeCOMBO = wgt
 
@@ -273,9 +408,44 @@ class OptionsView(QDialog):
         wgt.currentIndexChanged.connect(ctlr.frameRateChanged)
         self._frameRateCOMBO = wgt
 
+        # Frame physics and visuals times on the simulation canvas
+        wgt2 = QCheckBox("Profile")
+        wgt2.setChecked(ctlr.profiling())
+        wgt2.toggled.connect(ctlr.profilingChanged)
+        self._profileCHK = wgt2
+
         hbox = QHBoxLayout()
         hbox.addWidget(lbl)
         hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
+        # Frame Pacing, steps per frame, and its simulated seconds rate
+        lbl = QLabel()
+        lbl.setText("Pacing:")
+
+        wgt = QComboBox()
+        wgt.insertItems(0, ["fixed", "fps", "rate"])
+        wgt.setCurrentIndex(0)
+        wgt.currentIndexChanged.connect(ctlr.pacingChanged)
+        self._pacingCOMBO = wgt
+
+        lbl2 = QLabel()
+        lbl2.setText("sim s/s")
+
+        wgt2 = QDoubleSpinBox()
+        wgt2.setDecimals(1)
+        wgt2.setRange(0.1, 100000.0)
+        wgt2.setSingleStep(10.0)
+        wgt2.setValue(ctlr.simRate())
+        wgt2.valueChanged.connect(ctlr.simRateChanged)
+        self._simRateSBX = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        hbox.addWidget(lbl2)
         pvbox.addLayout(hbox)
 
         # Spin Mode
@@ -303,10 +473,16 @@ class OptionsView(QDialog):
         wgt.setSingleStep(100)
         wgt.valueChanged.connect(ctlr.trailLengthChanged)
         self._trailLenSBX = wgt
+
+        wgt2 = QCheckBox("Fade Snakes")
+        wgt2.setChecked(ctlr.snakeFade())
+        wgt2.toggled.connect(ctlr.snakeFadeChanged)
+        self._snakeFadeCHK = wgt2
         
         hbox = QHBoxLayout()
         hbox.addWidget(trailLenLBL)
         hbox.addWidget(self._trailLenSBX)
+        hbox.addWidget(self._snakeFadeCHK)
         pvbox.addLayout(hbox)
 
         lbl = QLabel()
@@ -324,6 +500,147 @@ class OptionsView(QDialog):
         hbox.addWidget(wgt)
         pvbox.addLayout(hbox)
 
+        # Force Engine Option Menu
+        lbl = QLabel()
+        lbl.setText("Force Engine: ")
+
+        wgt = QComboBox()
+        wgt.insertItems(0, ["vector", "tiled", "threads", "processes",
+                            "barneshut", "mesh", "loop"])
+        wgt.setCurrentIndex(0)
+        wgt.currentIndexChanged.connect(ctlr.forceEngineChanged)
+        self._forceEngineCOMBO = wgt
+
+        # Physics steps on a thread, the frame timer only shows them
+        wgt2 = QCheckBox("Background")
+        wgt2.setChecked(ctlr.backgroundPhysics())
+        wgt2.toggled.connect(ctlr.backgroundPhysicsChanged)
+        self._backgroundCHK = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
+        # Barnes-Hut Opening Angle
+        lbl = QLabel()
+        lbl.setText("Opening Angle:")
+
+        wgt = QDoubleSpinBox()
+        wgt.setDecimals(2)
+        wgt.setRange(0.0, 2.0)
+        wgt.setSingleStep(0.1)
+        wgt.setValue(ctlr.openingAngle())
+        wgt.valueChanged.connect(ctlr.openingAngleChanged)
+        self._openAngleSBX = wgt
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        pvbox.addLayout(hbox)
+
+        # Thread/Process Engine Workers, 0 for one per core
+        lbl = QLabel()
+        lbl.setText("Workers:")
+
+        wgt = QSpinBox()
+        wgt.setRange(0, 256)
+        wgt.setValue(ctlr.workerCount())
+        wgt.setSpecialValueText("auto")
+        wgt.valueChanged.connect(ctlr.workersChanged)
+        self._workersSBX = wgt
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        pvbox.addLayout(hbox)
+
+        # Particle-Mesh Grid Cells per Side and Padding
+        lbl = QLabel()
+        lbl.setText("Mesh Size:")
+
+        wgt = QSpinBox()
+        wgt.setRange(8, 256)
+        wgt.setSingleStep(8)
+        wgt.setValue(ctlr.meshSize())
+        wgt.valueChanged.connect(ctlr.meshSizeChanged)
+        self._meshSizeSBX = wgt
+
+        lbl2 = QLabel()
+        lbl2.setText("padding ")
+
+        wgt2 = QDoubleSpinBox()
+        wgt2.setDecimals(1)
+        wgt2.setRange(1.0, 4.0)
+        wgt2.setSingleStep(0.5)
+        wgt2.setValue(ctlr.meshPadding())
+        wgt2.valueChanged.connect(ctlr.meshPaddingChanged)
+        self._meshPadSBX = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(lbl2)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
+        # Integrator Option Menu
+        lbl = QLabel()
+        lbl.setText("Integrator: ")
+
+        wgt = QComboBox()
+        wgt.insertItems(0, ["euler", "leapfrog", "rk4", "adaptive", "block"])
+        wgt.setCurrentIndex(0)
+        wgt.currentIndexChanged.connect(ctlr.integratorChanged)
+        self._integratorCOMBO = wgt
+
+        # Energy and momentum in the simulation window title
+        wgt2 = QCheckBox("Diagnostics")
+        wgt2.setChecked(ctlr.diagnostics())
+        wgt2.toggled.connect(ctlr.diagnosticsChanged)
+        self._diagCHK = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
+        # Trajectory File, Recorded by New Simulation, Played in Replay Mode
+        lbl = QLabel()
+        lbl.setText("Trajectory:")
+
+        wgt = QLineEdit()
+        wgt.setText(ctlr.trajectoryPath())
+        wgt.textChanged.connect(ctlr.trajectoryPathChanged)
+        self._trajPathLE = wgt
+
+        wgt2 = QCheckBox("Record")
+        wgt2.setChecked(ctlr.recording())
+        wgt2.toggled.connect(ctlr.recordingChanged)
+        self._recordCHK = wgt2
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        hbox.addWidget(wgt2)
+        pvbox.addLayout(hbox)
+
+        # Replay Frame Seek
+        lbl = QLabel()
+        lbl.setText("Replay Frame:")
+
+        wgt = QSlider(Qt.Orientation.Horizontal)
+        wgt.setRange(0, 0)
+        wgt.valueChanged.connect(ctlr.replaySeek)
+        self._replaySLD = wgt
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(lbl)
+        hbox.addWidget(wgt)
+        pvbox.addLayout(hbox)
+
     def _massMaxChanged(self, text):
         massRange = self._optCtrlr.massRange()
         newMax = _stof(text)
@@ -384,6 +701,19 @@ class OptionsView(QDialog):
                 return
         self._posMinLE.setText(f"{posRange[0]}")
 
+    def _restoreSnapshotCB(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Restore Snapshot", "",
+                                              "GUTS snapshots (*.gsnap)")
+        if path:
+            self._optCtrlr.actionRestoreSnapshot(path)
+
+    def _saveSnapshotCB(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Snapshot",
+                                              "guts.gsnap",
+                                              "GUTS snapshots (*.gsnap)")
+        if path:
+            self._optCtrlr.actionSaveSnapshot(path)
+
     def _startStopCB(self):
         text = self._startStopBTN.text()
         if text == "Start":
@@ -0,0 +1,79 @@
+"""
+Visual drawing every Tubular mode tube from a trails.TubeBuffer.
+
+vispy's Mesh uploads its whole vertex, color and index buffers on every
+set_data, so long tubes cost a full upload each frame.  TubeMesh keeps its
+own GPU buffers and uploads only the ring slots the TubeBuffer reports as
+written, two slots a frame, with a full upload only when the buffer is new
+or resized.
+"""
+
+from vispy import gloo
+from vispy import scene as vispyScene
+from vispy import visuals
+
+
+VERTEX_SHADER = """
+varying vec4 v_color;
+
+void main() {
+    v_color = $color;
+    gl_Position = $transform(vec4($position, 1.0));
+}
+"""
+
+FRAGMENT_SHADER = """
+varying vec4 v_color;
+
+void main() {
+    gl_FragColor = v_color;
+}
+"""
+
+
+class TubeMeshVisual(visuals.Visual):
+
+    def __init__(self, tubeBuf):
+        """Draw the tubes of tubeBuf, call updateTubes after appending"""
+        super().__init__(vcode=VERTEX_SHADER, fcode=FRAGMENT_SHADER)
+
+        self._tubeBuf  = tubeBuf
+        self._vertexVB = gloo.VertexBuffer()
+        self._colorVB  = gloo.VertexBuffer()
+        self._index_buffer = gloo.IndexBuffer()
+        self.shared_program.vert["position"] = self._vertexVB
+        self.shared_program.vert["color"] = self._colorVB
+        self._draw_mode = "triangles"
+        self.set_gl_state("translucent", depth_test=True, cull_face=False)
+        self.updateTubes()
+
+    def updateTubes(self):
+        """Upload the ring slots written since the last update"""
+        tubeBuf = self._tubeBuf
+        vertices = tubeBuf.vertices()
+        colors = tubeBuf.colors()
+        faces = tubeBuf.faces()
+        slots = tubeBuf.changedSlots()
+        if slots is None:
+            self._vertexVB.set_data(vertices)
+            self._colorVB.set_data(colors)
+            self._index_buffer.set_data(faces.ravel())
+        else:
+            vertexCount = tubeBuf.slotVertexCount()
+            faceCount = tubeBuf.slotFaceCount()
+            for slot in slots:
+                first = slot * vertexCount
+                last = first + vertexCount
+                self._vertexVB.set_subdata(vertices[first:last], offset=first)
+                self._colorVB.set_subdata(colors[first:last], offset=first)
+                first = slot * faceCount
+                last = first + faceCount
+                self._index_buffer.set_subdata(faces[first:last].ravel(),
+                                               offset=3 * first)
+        self.update()
+
+    def _prepare_transforms(self, view):
+        view.view_program.vert["transform"] = view.get_transform()
+
+
+TubeMesh = vispyScene.visuals.create_visual_node(TubeMeshVisual)
@@ -0,0 +1,62 @@
+"""
+Disk cache of generated starting bodies.
+
+Seeded generation always makes the same bodies, so they are saved as
+snapshot files named by a hash of the generation parameters, body count,
+ranges, mode and seed.  Opening the same scenario again maps the saved
+positions, velocities, masses, sizes and colors instead of generating them.
+"""
+
+import hashlib
+import json
+import os
+
+import snapshot
+
+
+VERSION = 2    # change when generation changes, so old entries are unused
+
+
+def defaultCacheDir():
+    cacheHome = os.getenv("XDG_CACHE_HOME")
+    if not cacheHome:
+        cacheHome = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cacheHome, "guts", "bodies")
+
+
+class InitialConditionsCache(object):
+
+    def __init__(self, directory=None):
+        super().__init__()
+
+        self.directory = directory or defaultCacheDir()
+
+    def key(self, params):
+        """Hash of a JSON serializable dict of generation parameters"""
+        text = json.dumps(dict(params, version=VERSION), sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+    def load(self, params):
+        """Return the cached dict of body arrays for params, or None"""
+        try:
+            meta, arrays = snapshot.readSnapshot(self.path(params))
+        except (OSError, ValueError):
+            return None
+        if meta.get("params") != json.loads(json.dumps(params)):
+            return None
+        return arrays
+
+    def path(self, params):
+        return os.path.join(self.directory, self.key(params) + ".gsnap")
+
+    def store(self, params, arrays):
+        """Save body arrays for params.  Returns False if the cache can not
+        be written, generation goes on without it."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            snapshot.writeSnapshot(self.path(params), arrays,
+                                   { "params": params })
+        except OSError as osx:
+            print(f"GUTS WARNING: Can't cache bodies: {osx}")
+            return False
+        return True
@@ -0,0 +1,374 @@
+"""
+Time integrators used by gravity.Gravity to move bodies forward in time.
+
+Each integrator updates caller supplied (N x 3) position and velocity arrays
+in place, calling accelerations(positions, out) to fill out with the
+acceleration of every body at the given positions.  The accels array is
+left holding accelerations from the step, and integrators that reuse them
+between steps keep them valid until reset is called.
+"""
+
+import numpy
+
+
+class Integrator(object):
+
+    name = None
+
+    def __init__(self):
+        super().__init__()
+
+    def reset(self):
+        """Forget any state carried between steps, called whenever the
+        bodies or the forces between them change"""
+        pass
+
+    def setState(self, state):
+        """Restore state carried between steps, as returned by state"""
+        pass
+
+    def state(self):
+        """Dict of arrays holding the state carried between steps, so a
+        saved run resumes exactly as it would have continued"""
+        return { }
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        raise NotImplementedError
+
+
+class EulerIntegrator(Integrator):
+    """Original explicit update, one force evaluation per step:
+    P += V*dt + A*dt*dt, V += A*dt"""
+
+    name = "euler"
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        accelerations(positions, accels)
+        positions += velocities * dt
+        positions += accels * (dt * dt)
+        velocities += accels * dt
+
+
+class LeapfrogIntegrator(Integrator):
+    """Kick-drift-kick leapfrog (velocity Verlet).  Symplectic and time
+    reversible, so energy errors stay bounded over long runs.  The end of
+    step accelerations are reused at the start of the next step, so each
+    step costs one force evaluation."""
+
+    name = "leapfrog"
+
+    def __init__(self):
+        super().__init__()
+
+        self._accelsValid = False
+
+    def reset(self):
+        self._accelsValid = False
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        if not self._accelsValid:
+            accelerations(positions, accels)
+        velocities += accels * (0.5 * dt)
+        positions += velocities * dt
+        accelerations(positions, accels)
+        velocities += accels * (0.5 * dt)
+        self._accelsValid = True
+
+
+class _StateIntegrator(Integrator):
+    """Base for Runge-Kutta integrators working on the combined state
+    array [positions, velocities] of shape (2 x N x 3)"""
+
+    def __init__(self):
+        super().__init__()
+
+        self._stageBuf = None
+
+    def _derivative(self, state, accelerations, out):
+        """Fill out with d(state)/dt, [velocities, accelerations]"""
+        out[0] = state[1]
+        accelerations(state[0], out[1])
+
+    def _stages(self, state, count):
+        """Reusable (count x 2 x N x 3) stage buffer"""
+        shape = (count,) + state.shape
+        buf = self._stageBuf
+        if buf is None or buf.shape != shape:
+            buf = self._stageBuf = numpy.empty(shape)
+        return buf
+
+
+class RK4Integrator(_StateIntegrator):
+    """Classic fourth order Runge-Kutta, four force evaluations per step"""
+
+    name = "rk4"
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        state = numpy.stack((positions, velocities))
+        k = self._stages(state, 4)
+
+        self._derivative(state, accelerations, k[0])
+        accels[:] = k[0][1]
+        self._derivative(state + (0.5 * dt) * k[0], accelerations, k[1])
+        self._derivative(state + (0.5 * dt) * k[1], accelerations, k[2])
+        self._derivative(state + dt * k[2], accelerations, k[3])
+
+        state += (dt / 6.0) * (k[0] + 2.0 * (k[1] + k[2]) + k[3])
+        positions[:] = state[0]
+        velocities[:] = state[1]
+
+
+class AdaptiveIntegrator(_StateIntegrator):
+    """Dormand-Prince 5(4) Runge-Kutta with error controlled step size.
+    Each requested step is covered by as many internal steps as needed to
+    keep the estimated error within tolerance, so quiet stretches take few
+    force evaluations and close encounters take many.  The last stage of
+    an accepted step is the first stage of the next, six force evaluations
+    per internal step."""
+
+    name = "adaptive"
+
+    # Butcher tableau, the last row of A is also the fifth order weights
+    A = [ [ ],
+          [ 1.0/5.0 ],
+          [ 3.0/40.0, 9.0/40.0 ],
+          [ 44.0/45.0, -56.0/15.0, 32.0/9.0 ],
+          [ 19372.0/6561.0, -25360.0/2187.0, 64448.0/6561.0, -212.0/729.0 ],
+          [ 9017.0/3168.0, -355.0/33.0, 46732.0/5247.0, 49.0/176.0,
+            -5103.0/18656.0 ],
+          [ 35.0/384.0, 0.0, 500.0/1113.0, 125.0/192.0, -2187.0/6784.0,
+            11.0/84.0 ] ]
+    # Fifth order minus fourth order weights, the error estimate
+    E = [ 71.0/57600.0, 0.0, -71.0/16695.0, 71.0/1920.0, -17253.0/339200.0,
+          22.0/525.0, -1.0/40.0 ]
+
+    MIN_STEP = 1.0e-6    # smallest internal step, as a fraction of dt
+
+    def __init__(self, tolerance=1.0e-6):
+        super().__init__()
+
+        self.tolerance = tolerance
+        self._stepSize = None      # last internal step size
+        self._firstValid = False   # stage 0 holds the derivative at state
+
+    def reset(self):
+        self._stepSize = None
+        self._firstValid = False
+
+    def setState(self, state):
+        self.tolerance = float(state.get("tolerance", self.tolerance))
+        stepSize = state.get("stepSize")
+        self._stepSize = float(stepSize) if stepSize is not None else None
+
+    def state(self):
+        state = { "tolerance": numpy.array(self.tolerance) }
+        if self._stepSize is not None:
+            state["stepSize"] = numpy.array(self._stepSize)
+        return state
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        state = numpy.stack((positions, velocities))
+        k = self._stages(state, 7)
+        if not self._firstValid:
+            self._derivative(state, accelerations, k[0])
+            self._firstValid = True
+
+        tol = self.tolerance
+        minStep = dt * self.MIN_STEP
+        h = dt if self._stepSize is None else self._stepSize
+        done = 0.0
+        while done < dt * (1.0 - 1.0e-12):
+            h = min(h, dt - done)
+            for sdx in range(1, 7):
+                trial = state.copy()
+                for jdx, a in enumerate(self.A[sdx]):
+                    if a != 0.0:
+                        trial += (h * a) * k[jdx]
+                self._derivative(trial, accelerations, k[sdx])
+
+            # trial is the fifth order solution, k[6] its derivative
+            err = self.E[0] * k[0]
+            for jdx in range(2, 7):
+                err += self.E[jdx] * k[jdx]
+            err *= h
+            scale = tol + tol * numpy.maximum(numpy.abs(state),
+                                              numpy.abs(trial))
+            errNorm = float(numpy.sqrt(numpy.mean((err / scale) ** 2)))
+
+            if errNorm <= 1.0 or h <= minStep:
+                state = trial
+                k[0] = k[6]
+                done += h
+            if errNorm > 0.0:
+                h *= min(5.0, max(0.2, 0.9 * errNorm ** -0.2))
+            else:
+                h *= 5.0
+            h = max(h, minStep)
+
+        self._stepSize = h
+        positions[:] = state[0]
+        velocities[:] = state[1]
+        accels[:] = k[0][1]
+
+
+class BlockIntegrator(Integrator):
+    """Leapfrog with hierarchical block time steps.  Each body steps at
+    dt / 2**level, its level chosen from how fast its acceleration changes,
+    so bodies in close encounters take many small steps while quiet bodies
+    take one.  Between events every body drifts, and only the bodies whose
+    step ends have their forces summed, together, and their velocities
+    kicked.  All levels line up again at the end of each requested step.
+
+    New bodies start at a level from their speed over their acceleration,
+    the time to turn them by the tolerance.  Unsoftened close pairs want
+    ever finer levels, so each step the levels are capped to keep its cost
+    within maxCost full force sums.  Every force call, full or not, is
+    counted as the body pairs summed plus EVENT_PAIRS pairs of call
+    overhead, the cap is the finest level that fits."""
+
+    name = "block"
+
+    MAX_LEVEL = 12        # smallest step is dt / 2**MAX_LEVEL
+    EVENT_PAIRS = 4096    # overhead of one event as body pairs summed
+
+    def __init__(self, tolerance=0.02, maxCost=4.0):
+        super().__init__()
+
+        self.tolerance = tolerance   # step over acceleration change time
+        self.maxCost = maxCost       # full force sums per step allowed
+        self._levels = None          # time step level of each body
+        self._wanted = None          # level each body last asked for
+        self._accelsValid = False
+
+    def levelCap(self, wanted):
+        """Finest level that keeps a step of bodies at the wanted levels,
+        capped to it, within maxCost full force sums"""
+        bodyCount = wanted.shape[0]
+        fullSum = float(bodyCount * bodyCount + self.EVENT_PAIRS)
+        for cap in range(self.MAX_LEVEL, 0, -1):
+            capped = numpy.minimum(wanted, cap)
+            pairs = numpy.sum(numpy.left_shift(1, capped)) * bodyCount + \
+                (1 << int(capped.max())) * self.EVENT_PAIRS
+            if pairs <= self.maxCost * fullSum:
+                return cap
+        return 0
+
+    def levels(self):
+        return self._levels
+
+    def reset(self):
+        self._levels = None
+        self._wanted = None
+        self._accelsValid = False
+
+    def setState(self, state):
+        self.tolerance = float(state.get("tolerance", self.tolerance))
+        self.maxCost = float(state.get("maxCost", self.maxCost))
+        self._levels = state.get("levels")
+        self._wanted = state.get("wanted")
+
+    def state(self):
+        state = { "tolerance": numpy.array(self.tolerance),
+                  "maxCost": numpy.array(self.maxCost) }
+        if self._levels is not None:
+            state["levels"] = self._levels
+        if self._wanted is not None:
+            state["wanted"] = self._wanted
+        return state
+
+    def step(self, positions, velocities, accels, accelerations, dt):
+        bodyCount = positions.shape[0]
+        if not self._accelsValid:
+            accelerations(positions, accels)
+            self._accelsValid = True
+        if self._levels is None or self._levels.shape[0] != bodyCount:
+            self._levels = self._startLevels(velocities, accels, dt)
+        if self._wanted is None or self._wanted.shape[0] != bodyCount:
+            self._wanted = self._levels.copy()
+        levels = self._levels
+        wanted = self._wanted
+
+        # All levels line up at the start, so any can be coarsened to the cap
+        cap = self.levelCap(wanted)
+        numpy.minimum(levels, cap, out=levels)
+
+        # Time is counted in ticks of the smallest step
+        ticks = 1 << self.MAX_LEVEL
+        tick = dt / ticks
+        stepTicks = numpy.left_shift(1, self.MAX_LEVEL - levels)
+        startAccels = accels.copy()
+
+        # Every body starts a step, opening half kick
+        velocities += accels * (0.5 * tick * stepTicks)[:, numpy.newaxis]
+
+        now = 0
+        while now < ticks:
+            # Drift every body to the next step end
+            nextTick = int(((now // stepTicks + 1) * stepTicks).min())
+            positions += velocities * ((nextTick - now) * tick)
+            now = nextTick
+
+            active = numpy.nonzero(now % stepTicks == 0)[0]
+            if active.shape[0] == bodyCount:
+                accelerations(positions, accels)
+                newAccels = accels[active]
+            else:
+                newAccels = numpy.empty((active.shape[0], 3))
+                accelerations(positions, newAccels, active)
+                accels[active] = newAccels
+
+            # Closing half kick of the active bodies
+            activeTicks = stepTicks[active]
+            velocities[active] += newAccels * \
+                (0.5 * tick * activeTicks)[:, numpy.newaxis]
+
+            # Next step from the acceleration change over this one.  Finer
+            # levels always line up, coarser only one level at a time when
+            # now is on the coarser step boundary.
+            changes = newAccels - startAccels[active]
+            change2 = numpy.einsum("ij,ij->i", changes, changes)
+            allowed2 = numpy.einsum("ij,ij->i", newAccels, newAccels) * \
+                (self.tolerance * activeTicks / ticks) ** 2
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                wantLevels = numpy.ceil(0.5 * numpy.log2(change2 / allowed2))
+            wantLevels[~numpy.isfinite(wantLevels)] = 0.0
+            wantLevels = numpy.clip(wantLevels, 0,
+                                    self.MAX_LEVEL).astype(numpy.int64)
+            wanted[active] = wantLevels
+            numpy.minimum(wantLevels, cap, out=wantLevels)
+            current = levels[active]
+            coarser = (wantLevels < current) & (now % (2 * activeTicks) == 0)
+            newLevels = numpy.where(wantLevels > current, wantLevels,
+                                    numpy.where(coarser, current - 1, current))
+            levels[active] = newLevels
+            stepTicks[active] = numpy.left_shift(1, self.MAX_LEVEL - newLevels)
+            startAccels[active] = newAccels
+
+            # Opening half kick of the next step
+            if now < ticks:
+                velocities[active] += newAccels * \
+                    (0.5 * tick * stepTicks[active])[:, numpy.newaxis]
+
+    def _startLevels(self, velocities, accels, dt):
+        """Levels whose steps turn each body's velocity by the tolerance"""
+        speed2 = numpy.einsum("ij,ij->i", velocities, velocities)
+        accel2 = numpy.einsum("ij,ij->i", accels, accels)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            levels = numpy.ceil(0.5 * numpy.log2(accel2 * dt * dt / speed2 /
+                                                 self.tolerance ** 2))
+        levels[~numpy.isfinite(levels)] = 0.0
+        return numpy.clip(levels, 0, self.MAX_LEVEL).astype(numpy.int64)
+
+
+INTEGRATORS = { EulerIntegrator.name    : EulerIntegrator,
+                LeapfrogIntegrator.name : LeapfrogIntegrator,
+                RK4Integrator.name      : RK4Integrator,
+                AdaptiveIntegrator.name : AdaptiveIntegrator,
+                BlockIntegrator.name    : BlockIntegrator }
+
+
+def newIntegrator(name):
+    integratorClass = INTEGRATORS.get(name)
+    if integratorClass is None:
+        raise ValueError(f"Unknown integrator: {name}")
+    return integratorClass()
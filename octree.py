@@ -0,0 +1,156 @@
+"""
+Linear octree built over body positions with NumPy array operations.
+
+Bodies are sorted along a Morton (Z order) curve so every tree node owns a
+contiguous run [start, end) of the sorted bodies.  Nodes are stored level by
+level in flat arrays and the children of a node are contiguous in the next
+level, so a tree walk can move a whole frontier of nodes down one level with
+a handful of array operations.
+"""
+
+import numpy
+
+
+MAX_DEPTH = 16     # deepest level, 2**16 cells per side
+
+
+def _spreadBits(cells):
+    """Spread the low 21 bits of each integer so two zero bits separate
+    each of the original bits, ready to be interleaved into a Morton key.
+    """
+    v = cells.astype(numpy.uint64) & numpy.uint64(0x1fffff)
+    v = (v | (v << numpy.uint64(32))) & numpy.uint64(0x1f00000000ffff)
+    v = (v | (v << numpy.uint64(16))) & numpy.uint64(0x1f0000ff0000ff)
+    v = (v | (v << numpy.uint64(8)))  & numpy.uint64(0x100f00f00f00f00f)
+    v = (v | (v << numpy.uint64(4)))  & numpy.uint64(0x10c30c30c30c30c3)
+    v = (v | (v << numpy.uint64(2)))  & numpy.uint64(0x1249249249249249)
+    return v
+
+
+def mortonKeys(positions, origin, size, depth=MAX_DEPTH):
+    """Return the Morton key of each position within the cube of the
+    supplied origin corner and side length, at the supplied depth.
+    """
+    cellCount = 1 << depth
+    cells = numpy.floor((positions - origin) * (cellCount / size))
+    cells = numpy.clip(cells, 0, cellCount - 1).astype(numpy.int64)
+    return ((_spreadBits(cells[:, 0]) << numpy.uint64(2)) |
+            (_spreadBits(cells[:, 1]) << numpy.uint64(1)) |
+             _spreadBits(cells[:, 2]))
+
+
+class Octree(object):
+    """
+    Octree over a set of bodies.  Nodes holding leafSize bodies or fewer, or
+    nodes at the deepest level, are leaves.  Body arrays are kept in sorted
+    order with order mapping them back to the caller's indexes.  Per node
+    arrays:
+        starts, ends    run of owned bodies in sorted order
+        masses, coms    total mass and center of mass
+        sizes           side length of the node cube
+        firstKids       global index of first child node (-1 for leaves)
+        kidCounts       number of child nodes (0 for leaves)
+    """
+
+    def __init__(self, positions, masses, leafSize=8, depth=MAX_DEPTH):
+        super().__init__()
+
+        self.leafSize = leafSize
+        self.depth    = depth
+
+        lo = positions.min(axis=0)
+        hi = positions.max(axis=0)
+        size = float((hi - lo).max()) * (1.0 + 1.0e-9)
+        if size <= 0.0:
+            size = 1.0
+        self.origin = lo
+        self.size   = size
+
+        keys = mortonKeys(positions, lo, size, depth)
+        self.order = numpy.argsort(keys, kind="stable")
+        self.bodyKeys      = keys[self.order]
+        self.bodyPositions = positions[self.order]
+        self.bodyMasses    = masses[self.order]
+
+        self._build()
+
+    def _build(self):
+        bodyCount = self.bodyKeys.shape[0]
+        depth = self.depth
+
+        # Cumulative sums give any run's mass and moment with one subtraction
+        cumMass = numpy.zeros(bodyCount + 1)
+        numpy.cumsum(self.bodyMasses, out=cumMass[1:])
+        cumMoment = numpy.zeros((bodyCount + 1, 3))
+        numpy.cumsum(self.bodyPositions * self.bodyMasses[:, numpy.newaxis],
+                     axis=0, out=cumMoment[1:])
+
+        levelStarts = [ ]
+        levelEnds   = [ ]
+        levelLeaf   = [ ]
+        levelFirst  = [ ]
+        levelKids   = [ ]
+
+        # Bodies not yet owned by a leaf, these continue to deeper levels
+        active = numpy.ones(bodyCount, dtype=bool)
+        for level in range(depth + 1):
+            prefix = self.bodyKeys >> numpy.uint64(3 * (depth - level))
+            edges = numpy.empty(bodyCount, dtype=bool)
+            edges[0] = True
+            numpy.not_equal(prefix[1:], prefix[:-1], out=edges[1:])
+            edges &= active
+            starts = numpy.flatnonzero(edges)
+            if starts.shape[0] == 0:
+                break
+
+            # Each node ends where the next run begins, or at the first
+            # inactive body after it
+            allEdges = numpy.flatnonzero(numpy.concatenate(
+                (edges | ~active, [True])))
+            ends = allEdges[numpy.searchsorted(allEdges, starts, "right")]
+
+            counts = ends - starts
+            isLeaf = counts <= self.leafSize
+            if level == depth:
+                isLeaf[:] = True
+
+            if levelStarts:
+                # Link the previous level's internal nodes to these children
+                parents = numpy.searchsorted(levelStarts[-1], starts,
+                                             "right") - 1
+                offset = sum(s.shape[0] for s in levelStarts)
+                kidCounts = numpy.bincount(parents,
+                                           minlength=levelStarts[-1].shape[0])
+                firstKids = numpy.searchsorted(parents,
+                                               numpy.arange(kidCounts.shape[0]))
+                levelFirst[-1] = numpy.where(kidCounts > 0,
+                                             firstKids + offset, -1)
+                levelKids[-1] = kidCounts
+
+            levelStarts.append(starts)
+            levelEnds.append(ends)
+            levelLeaf.append(isLeaf)
+            levelFirst.append(numpy.full(starts.shape[0], -1))
+            levelKids.append(numpy.zeros(starts.shape[0], dtype=numpy.int64))
+
+            # Bodies owned by leaves stop here
+            leafRuns = (numpy.bincount(starts[isLeaf], minlength=bodyCount+1) -
+                        numpy.bincount(ends[isLeaf], minlength=bodyCount+1))
+            active &= numpy.cumsum(leafRuns[:-1]) == 0
+
+        self.levelCount = len(levelStarts)
+        self.starts    = numpy.concatenate(levelStarts)
+        self.ends      = numpy.concatenate(levelEnds)
+        self.isLeaf    = numpy.concatenate(levelLeaf)
+        self.firstKids = numpy.concatenate(levelFirst)
+        self.kidCounts = numpy.concatenate(levelKids)
+        self.sizes     = numpy.concatenate(
+            [numpy.full(s.shape[0], self.size / (1 << lvl))
+             for lvl, s in enumerate(levelStarts)])
+
+        self.masses = cumMass[self.ends] - cumMass[self.starts]
+        self.coms = ((cumMoment[self.ends] - cumMoment[self.starts]) /
+                     self.masses[:, numpy.newaxis])
+
+    def nodeCount(self):
+        return self.starts.shape[0]
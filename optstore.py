@@ -13,6 +13,23 @@ FRAME_RATE = "FrameRate"
 SPIN_MODE  = "SpinMode"
 TRAIL_LEN  = "TrailLen"
 COLL_DIST  = "CollDist"
+FORCE_ENGINE = "ForceEngine"
+OPEN_ANGLE = "OpenAngle"
+WORKERS    = "Workers"
+MESH_SIZE  = "MeshSize"
+MESH_PAD   = "MeshPadding"
+INTEGRATOR = "Integrator"
+RECORD     = "Record"
+TRAJ_PATH  = "TrajectoryPath"
+SEED       = "Seed"
+GENERATOR  = "Generator"
+CACHE_BODIES = "CacheBodies"
+DIAGNOSTICS = "Diagnostics"
+PROFILE    = "Profile"
+BACKGROUND = "BackgroundPhysics"
+PACING     = "Pacing"
+SIM_RATE   = "SimRate"
+SNAKE_FADE = "SnakeFade"
 
 class OptionsStore(object):
 
@@ -24,7 +41,24 @@ class OptionsStore(object):
                  FRAME_RATE: ("1/4", 0.25),
                  SPIN_MODE:  "X",
                  TRAIL_LEN:  1000,
-                 COLL_DIST:  5
+                 COLL_DIST:  5,
+                 FORCE_ENGINE: "vector",
+                 OPEN_ANGLE: 0.5,
+                 WORKERS:    0,
+                 MESH_SIZE:  64,
+                 MESH_PAD:   2.0,
+                 INTEGRATOR: "euler",
+                 RECORD:     False,
+                 TRAJ_PATH:  "guts.gtr",
+                 SEED:       None,
+                 GENERATOR:  "box",
+                 CACHE_BODIES: False,
+                 DIAGNOSTICS: False,
+                 PROFILE:    False,
+                 BACKGROUND: False,
+                 PACING:     "fixed",
+                 SIM_RATE:   10.0,
+                 SNAKE_FADE: False
                 }
 
     def __init__(self):
@@ -0,0 +1,150 @@
+"""
+Frame pacing for the GUTS animation.
+
+The frame timer asks FramePacer how many one second physics steps to run
+before each redraw.  The pacer keeps smoothed costs of a step and of a
+redraw, and in
+
+   fixed - runs one step per frame, the original behavior.
+   fps   - runs as many steps as fit in the frame interval after the
+           redraw, so the frame rate holds and the rest of the time steps
+           the bodies.  Only the last step of a frame is drawn.
+   rate  - runs the steps due to keep simulated seconds at simRate times
+           wall clock seconds, as many as fit in a frame.
+
+When the target can not be held the pacer is behind: in fps mode a single
+step and redraw take longer than a frame, in rate mode more than a frame of
+simulated time is owed.  Owed time beyond one frame is given up, counted in
+lostSeconds, rather than caught up in a burst.
+
+A background simworker.SimulationWorker and the render timer use the
+same pacer from two threads, so its methods hold the pacer's lock.
+"""
+
+import threading
+import time
+
+
+MODES = ("fixed", "fps", "rate")
+
+
+class FramePacer(object):
+
+    SMOOTHING = 0.2     # weight of the newest cost in the running costs
+
+    def __init__(self, mode="fixed", frameInterval=0.25, simRate=10.0):
+        super().__init__()
+
+        self.mode = mode
+        self.frameInterval = frameInterval   # timer seconds between frames
+        self.simRate = simRate               # rate mode sim secs per sec
+
+        self.stepCost   = None     # smoothed seconds per physics step
+        self.renderCost = 0.0      # smoothed seconds per redraw
+        self.behind = False
+        self.lostSeconds = 0.0     # simulated seconds given up, rate mode
+        self.frameStepCount = 1    # steps chosen for the last frame
+
+        self._start = time.perf_counter()
+        self._stepsDone = 0
+        self._lock = threading.RLock()
+
+    def setMode(self, mode):
+        if mode not in MODES:
+            raise ValueError(f"Unknown pacing mode: {mode}")
+        with self._lock:
+            self.mode = mode
+            self.reset()
+
+    def reset(self):
+        """Pace from now on, as at the start of a run"""
+        with self._lock:
+            self._start = time.perf_counter()
+            self._stepsDone = 0
+            self.behind = False
+            self.lostSeconds = 0.0
+
+    def frameSteps(self):
+        """Number of physics steps to run for the frame starting now"""
+        with self._lock:
+            return self._frameSteps()
+
+    def rendered(self, seconds):
+        """Add the cost of a redraw"""
+        with self._lock:
+            self.renderCost += self.SMOOTHING * (seconds - self.renderCost)
+
+    def status(self):
+        """One line description of the pacing"""
+        with self._lock:
+            return self._status()
+
+    def stepped(self, steps, seconds):
+        """Add the cost of steps physics steps"""
+        if steps <= 0:
+            return
+        cost = seconds / steps
+        with self._lock:
+            if self.stepCost is None:
+                self.stepCost = cost
+            else:
+                self.stepCost += self.SMOOTHING * (cost - self.stepCost)
+            self._stepsDone += steps
+
+    def waitTime(self):
+        """Seconds a background worker, stepping one second at a time,
+        should wait before its next step.  Only rate pacing waits."""
+        with self._lock:
+            if self.mode != "rate":
+                return 0.0
+            owed = self._owedSteps()
+            if owed < 1:
+                return (self._stepsDone + 1) / self.simRate - \
+                    (time.perf_counter() - self._start)
+            self._giveUp(owed - 1)
+            return 0.0
+
+    def _frameSteps(self):
+        if self.mode == "fixed":
+            steps = 1
+        else:
+            fit = self._stepsThatFit()
+            if self.mode == "fps":
+                self.behind = fit < 1.0
+                steps = max(1, int(fit))
+            else:
+                owed = self._owedSteps()
+                steps = min(owed, max(1, int(fit)))
+                self._giveUp(owed - steps)
+        self.frameStepCount = steps
+        return steps
+
+    def _status(self):
+        stepMS = 0.0 if self.stepCost is None else self.stepCost * 1000.0
+        text = f"{self.mode} pacing, {self.frameStepCount} steps/frame," \
+               f" step {stepMS:.1f} ms, redraw {self.renderCost * 1000.0:.1f} ms"
+        if self.mode == "rate":
+            text = f"{text}, {self.lostSeconds:g} s lost"
+        if self.behind:
+            text = f"{text}, BEHIND"
+        return text
+
+    def _giveUp(self, excess):
+        """Forgive owed steps beyond one frame of simulated time"""
+        allowance = self.simRate * self.frameInterval
+        self.behind = excess > allowance
+        if self.behind:
+            lost = excess - allowance
+            self.lostSeconds += lost
+            self._start += lost / self.simRate
+
+    def _owedSteps(self):
+        due = self.simRate * (time.perf_counter() - self._start)
+        return max(int(due) - self._stepsDone, 0)
+
+    def _stepsThatFit(self):
+        """Steps that fit in a frame interval after the redraw"""
+        if self.stepCost is None:
+            return 1.0
+        return (self.frameInterval - self.renderCost) / max(self.stepCost,
+                                                            1.0e-9)
@@ -0,0 +1,98 @@
+"""
+Per-frame timing of the GUTS animation.
+
+FrameStats keeps the most recent frames in a fixed size ring buffer, one
+row per frame of the time since the previous frame started, the time spent
+stepping the gravity model (physics), the time spent updating visuals and
+the frame total, so recording costs no allocations.  The rows can be
+averaged for an on-screen display and written out as CSV.
+"""
+
+import time
+
+import numpy
+
+
+COLUMNS = ("frame", "start", "bodies", "interval", "physics", "visuals",
+           "total")
+
+
+class FrameStats(object):
+
+    def __init__(self, capacity=10000):
+        super().__init__()
+
+        self.capacity = max(int(capacity), 1)
+        self._rows = numpy.zeros((self.capacity, len(COLUMNS)))
+        self._count = 0              # frames recorded, may pass capacity
+        self._origin = time.perf_counter()
+        self._frameStart = None
+        self._lastStart = None
+        self._physics = 0.0
+
+    def beginFrame(self):
+        self._frameStart = time.perf_counter()
+        self._physics = 0.0
+
+    def addPhysics(self, seconds):
+        """Count seconds of the current frame as physics"""
+        self._physics += seconds
+
+    def endFrame(self, bodyCount):
+        """Record the frame started by beginFrame, everything not counted
+        as physics counts as visuals"""
+        end = time.perf_counter()
+        start = self._frameStart
+        total = end - start
+        interval = 0.0 if self._lastStart is None else start - self._lastStart
+        row = self._rows[self._count % self.capacity]
+        row[:] = (self._count, start - self._origin, bodyCount, interval,
+                  self._physics, total - self._physics, total)
+        self._count += 1
+        self._lastStart = start
+
+    def frameCount(self):
+        return self._count
+
+    def means(self, frames=30):
+        """Dict of the mean of each column over the last frames frames, or
+        None before the first frame"""
+        rows = self.samples()[-frames:]
+        if rows.shape[0] == 0:
+            return None
+        means = dict(zip(COLUMNS, rows.mean(axis=0)))
+        # The first frame after a pause has no interval
+        intervals = rows[:, COLUMNS.index("interval")]
+        intervals = intervals[intervals > 0.0]
+        means["interval"] = intervals.mean() if intervals.shape[0] else 0.0
+        return means
+
+    def pause(self):
+        """Forget the last frame start, so a stop does not count as one
+        long frame interval"""
+        self._lastStart = None
+
+    def samples(self):
+        """(K x len(COLUMNS)) copy of the recorded frames, oldest first"""
+        if self._count <= self.capacity:
+            return self._rows[:self._count].copy()
+        split = self._count % self.capacity
+        return numpy.concatenate((self._rows[split:], self._rows[:split]))
+
+    def summary(self, frames=30):
+        """One line of mean frame times in milliseconds"""
+        means = self.means(frames)
+        if means is None:
+            return "no frames"
+        rate = 1.0 / means["interval"] if means["interval"] > 0.0 else 0.0
+        return (f"physics {means['physics'] * 1000.0:.1f} ms"
+                f"  visuals {means['visuals'] * 1000.0:.1f} ms"
+                f"  frame {means['total'] * 1000.0:.1f} ms"
+                f"  {rate:.1f} fps")
+
+    def writeCSV(self, path):
+        """Write the recorded frames, times in seconds"""
+        numpy.savetxt(path, self.samples(), delimiter=",",
+                      header=",".join(COLUMNS), comments="",
+                      fmt=("%d", "%.6f", "%d", "%.6f", "%.6f", "%.6f",
+                           "%.6f"))
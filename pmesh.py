@@ -0,0 +1,146 @@
+"""
+Particle-mesh gravity on a regular 3D grid.
+
+Body masses are deposited onto the grid with cloud-in-cell weights, the
+grid is convolved with the pull of a unit mass using FFTs, and the pull is
+interpolated back to each body with the same weights.  The cost is O(N) for
+the deposit and interpolation plus O(M log M) for the FFTs, M grid cells.
+
+The pull kernel matches the pairwise force law of the exact engines,
+F = G * m1 * m2 / d.  Rather than solving Poisson's equation for a 1/d**2
+law, the kernel's Green's function is sampled on the padded grid.  A
+padding factor of 2 or more gives isolated (non periodic) boundaries.
+"""
+
+import numpy
+
+
+class ParticleMesh(object):
+
+    def __init__(self, meshSize=64, padding=2.0):
+        super().__init__()
+
+        self.meshSize = max(int(meshSize), 2)
+        self.padding  = max(float(padding), 1.0)
+        padSize = int(numpy.ceil(self.meshSize * self.padding))
+        self.padSize  = padSize + (padSize % 2)
+
+        self._kernelFFTs = None    # unit cell pull kernel, one per axis
+        self._potFFT     = None    # unit cell ln(r) potential kernel
+        self._density    = None
+
+    def accelerations(self, positions, masses, accels, targets=None,
+                      potentials=None):
+        """Fill accels with each body's pull per unit mass, the mesh
+        estimate of sum(mj * (Pj - Pi) / Dij / Dij).  With an array of
+        target body indexes, accels holds just those bodies' pulls.  Given
+        a potentials array it is filled with the estimate of
+        sum(mj * ln(Dij)) from the same mass grid."""
+        meshSize = self.meshSize
+        lo = positions.min(axis=0)
+        extent = float((positions.max(axis=0) - lo).max())
+        if extent <= 0.0:
+            accels[:] = 0.0
+            if potentials is not None:
+                potentials[:] = 0.0
+            return
+        cellSize = extent * (1.0 + 1.0e-9) / (meshSize - 1)
+
+        base, axisWeights = self._cicWeights(positions, lo, cellSize)
+        density = self._deposit(base, axisWeights, masses)
+
+        if self._kernelFFTs is None:
+            self._kernelFFTs = self._makeKernelFFTs()
+        padShape = (self.padSize,) * 3
+        densityFFT = numpy.fft.rfftn(density, s=padShape)
+
+        field = numpy.empty((meshSize, meshSize, meshSize, 3))
+        for axis in range(3):
+            axisField = numpy.fft.irfftn(densityFFT * self._kernelFFTs[axis],
+                                         s=padShape)
+            field[..., axis] = axisField[:meshSize, :meshSize, :meshSize]
+        field /= cellSize
+
+        if targets is not None:
+            base, axisWeights = self._cicWeights(positions[targets], lo,
+                                                 cellSize)
+        self._interpolate(field.reshape(-1, 3), base, axisWeights, accels)
+
+        if potentials is not None:
+            # ln(D) is ln(D in cells) + ln(cellSize), the kernel has no
+            # self term so neither has the ln(cellSize) mass
+            if self._potFFT is None:
+                self._potFFT = self._makePotentialFFT()
+            potField = numpy.fft.irfftn(densityFFT * self._potFFT, s=padShape)
+            potField = potField[:meshSize, :meshSize, :meshSize]
+            self._interpolate(potField.reshape(-1, 1), base, axisWeights,
+                              potentials[:, numpy.newaxis])
+            total = masses.sum()
+            if targets is not None:
+                masses = masses[targets]
+            potentials += (total - masses) * numpy.log(cellSize)
+
+    def _cicWeights(self, positions, lo, cellSize):
+        """Flat grid index of each body's lower corner cell, and the cloud
+        in cell weights of the lower and upper cell along each axis"""
+        meshSize = self.meshSize
+        grid = (positions - lo) / cellSize
+        cells = numpy.floor(grid).astype(numpy.int64)
+        numpy.clip(cells, 0, meshSize - 2, out=cells)
+        upper = grid - cells
+        base = (cells[:, 0] * meshSize + cells[:, 1]) * meshSize + cells[:, 2]
+        axisWeights = [ (1.0 - upper[:, axis], upper[:, axis])
+                        for axis in range(3) ]
+        return base, axisWeights
+
+    def _corners(self, axisWeights):
+        """Yield flat index offset and body weights of the 8 cell corners"""
+        meshSize = self.meshSize
+        for dx in (0, 1):
+            for dy in (0, 1):
+                wxy = axisWeights[0][dx] * axisWeights[1][dy]
+                for dz in (0, 1):
+                    offset = (dx * meshSize + dy) * meshSize + dz
+                    yield offset, wxy * axisWeights[2][dz]
+
+    def _deposit(self, base, axisWeights, masses):
+        meshSize = self.meshSize
+        cellCount = meshSize ** 3
+        if self._density is None:
+            self._density = numpy.empty(cellCount)
+        density = self._density
+        density[:] = 0.0
+        for offset, wgt in self._corners(axisWeights):
+            density += numpy.bincount(base + offset, weights=masses * wgt,
+                                      minlength=cellCount)
+        return density.reshape((meshSize,) * 3)
+
+    def _interpolate(self, field, base, axisWeights, accels):
+        accels[:] = 0.0
+        for offset, wgt in self._corners(axisWeights):
+            accels += numpy.take(field, base + offset, axis=0) * \
+                wgt[:, numpy.newaxis]
+
+    def _makeKernelFFTs(self):
+        """FFT of the pull on a unit mass at each grid offset from a unit
+        mass, -r / |r|**2 in cell units, with no self pull"""
+        padSize = self.padSize
+        offsets = numpy.arange(padSize)
+        offsets = numpy.where(offsets <= padSize // 2, offsets,
+                              offsets - padSize).astype(float)
+        rx, ry, rz = numpy.meshgrid(offsets, offsets, offsets, indexing="ij")
+        r2 = rx * rx + ry * ry + rz * rz
+        r2[0, 0, 0] = numpy.inf
+        return [ numpy.fft.rfftn(-r / r2) for r in (rx, ry, rz) ]
+
+    def _makePotentialFFT(self):
+        """FFT of ln(|r|) in cell units at each grid offset, 0 at the
+        origin"""
+        padSize = self.padSize
+        offsets = numpy.arange(padSize)
+        offsets = numpy.where(offsets <= padSize // 2, offsets,
+                              offsets - padSize).astype(float)
+        rx, ry, rz = numpy.meshgrid(offsets, offsets, offsets, indexing="ij")
+        r2 = rx * rx + ry * ry + rz * rz
+        r2[0, 0, 0] = 1.0
+        return numpy.fft.rfftn(0.5 * numpy.log(r2))
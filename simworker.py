@@ -0,0 +1,184 @@
+"""
+Background stepping of a gravity.Gravity model.
+
+SimulationWorker steps the model one simulated second at a time on a
+thread, so a slow step no longer holds up the render timer, the camera or
+the options panel.  Completed seconds are published through a triple
+buffer of Frames: the worker fills the back frame then swaps it with the
+middle frame, and the renderer swaps the middle frame with its front frame
+when a newer one is there.  Neither side waits for the other, the renderer
+always gets the latest complete second and seconds it had no time to show
+are skipped.  NumPy releases the GIL in its array work, so stepping mostly
+runs alongside the render thread.
+
+With a pacing.FramePacer in fixed or fps pacing the worker steps one
+frame's worth of seconds, the pacer's frameSteps(), publishes them as one
+frame and waits for the renderer to take it before stepping on, so the
+simulation keeps to the frame rate and the next frame is stepped while the
+current one is drawn.  In rate pacing it steps a second at a time when the
+pacer's waitTime() says one is due.
+"""
+
+import threading
+import time
+
+import numpy
+
+
+class Frame(object):
+    """Bodies after one simulated second, and what happened in it"""
+
+    def __init__(self):
+        super().__init__()
+
+        self.positions = None
+        self.sizes     = None
+        self.colors    = None
+        self.time      = 0
+        self.bodyCount = 0
+        self.steps     = 0        # seconds stepped for this frame
+        self.collision = None     # first colliding pair, None if none
+        self.pairCount = 0        # colliding pairs merged
+        self.merged    = 0        # bodies merged away
+        self.diagnostics = None   # Gravity.diagnostics() if enabled
+
+    def capture(self, grav, copy):
+        """Take the model's body arrays, as copies kept in this frame's
+        own buffers if copy, otherwise as views of the live bodies"""
+        for name, array in (("positions", grav.bodyPositions()),
+                            ("sizes", grav.bodySizes()),
+                            ("colors", grav.bodyColors())):
+            buf = getattr(self, name)
+            if not copy:
+                setattr(self, name, array)
+            elif buf is None or buf.shape != array.shape:
+                setattr(self, name, numpy.array(array))
+            else:
+                buf[:] = array
+        self.time = grav.simulationTime()
+        self.bodyCount = grav.bodyCount()
+
+
+def stepFrame(grav, frame, merge=False, copy=False, steps=1, recorder=None):
+    """Step grav steps seconds into frame.  With merge, colliding bodies
+    are merged, otherwise collisions only stop the bodies for the second.
+    Every second is written to the recorder, a trajectory.TrajectoryWriter,
+    if given."""
+    frame.steps = steps
+    frame.collision = None
+    frame.pairCount = 0
+    frame.merged = 0
+    for step in range(steps):
+        coll = grav.jumpOneSecond()
+        if coll and frame.collision is None:
+            frame.collision = coll
+        if merge and coll:
+            frame.pairCount += grav.collisionPairs().shape[0]
+            frame.merged += grav.mergeCollisions()
+        if recorder is not None:
+            recorder.writeFrame(grav.simulationTime(), grav.bodyPositions(),
+                                grav.bodySizes(), grav.bodyColors())
+    frame.diagnostics = None
+    if grav.diagnosticsEnabled():
+        frame.diagnostics = grav.diagnostics()
+    frame.capture(grav, copy)
+
+
+class SimulationWorker(object):
+
+    def __init__(self, grav, modelLock, merge=False, recorder=None,
+                 pacer=None):
+        """Step grav while holding modelLock, so the model can be changed
+        between steps by holding it too.  Every second is written to the
+        recorder, a trajectory.TrajectoryWriter, if given.  A
+        pacing.FramePacer is told the step costs and can hold the steps
+        back to its simulated seconds rate."""
+        super().__init__()
+
+        self._gravity   = grav
+        self._modelLock = modelLock
+        self._merge     = merge
+        self._recorder  = recorder
+        self._pacer     = pacer
+
+        self._back   = Frame()
+        self._middle = Frame()
+        self._front  = Frame()
+        self._fresh  = False          # middle frame not taken yet
+        self._swapLock = threading.Lock()
+        self._taken  = threading.Event()   # renderer took the last frame
+        self._taken.set()
+
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self.error = None             # exception that stopped the worker
+        self.steps = 0                # seconds stepped
+
+    def latestFrame(self):
+        """The newest frame, or None if none was published since the last
+        call.  The frame is the caller's until the next call."""
+        with self._swapLock:
+            if not self._fresh:
+                return None
+            self._front, self._middle = self._middle, self._front
+            self._fresh = False
+        self._taken.set()
+        return self._front
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stopEvent.clear()
+        self._taken.set()
+        self._thread = threading.Thread(target=self._run,
+                                        name="GUTS physics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the step in progress, the model is then only used by
+        the caller"""
+        self._stopEvent.set()
+        self._taken.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        grav = self._gravity
+        pacer = self._pacer
+        try:
+            while not self._stopEvent.is_set():
+                steps = 1
+                if pacer is not None and pacer.mode == "rate":
+                    delay = pacer.waitTime()
+                    if delay > 0.0:
+                        self._stopEvent.wait(delay)
+                        continue
+                elif pacer is not None:
+                    # A frame of steps for each frame the renderer takes
+                    self._taken.wait()
+                    if self._stopEvent.is_set():
+                        break
+                    self._taken.clear()
+                    steps = pacer.frameSteps()
+                start = time.perf_counter()
+                with self._modelLock:
+                    stepFrame(grav, self._back, self._merge, copy=True,
+                              steps=steps, recorder=self._recorder)
+                self.steps += steps
+                if pacer is not None:
+                    pacer.stepped(steps, time.perf_counter() - start)
+                with self._swapLock:
+                    if self._fresh:
+                        # Keep the merges of the unseen middle frame
+                        back, middle = self._back, self._middle
+                        back.steps += middle.steps
+                        back.pairCount += middle.pairCount
+                        back.merged += middle.merged
+                        if back.collision is None:
+                            back.collision = middle.collision
+                    self._back, self._middle = self._middle, self._back
+                    self._fresh = True
+        except Exception as exc:
+            self.error = exc
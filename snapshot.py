@@ -0,0 +1,90 @@
+"""
+Snapshot files holding named NumPy arrays and a JSON header.
+
+A snapshot starts with an 8 byte magic and the int64 length of a JSON
+header, which describes each array's dtype, shape, offset and size along
+with any caller metadata.  The raw array data follows, each array starting
+on a 64 byte boundary.  Arrays may be zlib compressed.  Uncompressed arrays
+are restored as copy-on-write memory maps, so nothing is read until it is
+used and changes never reach the file.
+"""
+
+import json
+import os
+import zlib
+
+import numpy
+
+
+MAGIC = b"GUTSSNP\0"
+ALIGN = 64
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def writeSnapshot(path, arrays, meta=None, compress=False):
+    """Write a dict of arrays and a JSON serializable meta dict to path.
+    The file is written beside path and renamed over it, so a snapshot that
+    is still mapped by an earlier restore is never truncated."""
+    entries = [ ]
+    blobs = [ ]
+    offset = 0
+    for name, array in arrays.items():
+        array = numpy.require(array, requirements="C")
+        data = memoryview(array).cast("B")
+        if compress:
+            data = zlib.compress(data, 1)
+        entries.append({ "name"       : name,
+                         "dtype"      : array.dtype.str,
+                         "shape"      : list(array.shape),
+                         "offset"     : offset,
+                         "nbytes"     : len(data),
+                         "compressed" : bool(compress) })
+        blobs.append((offset, data))
+        offset = _aligned(offset + len(data))
+
+    header = json.dumps({ "arrays": entries, "meta": meta or { } }).encode()
+    dataStart = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as snapFP:
+        snapFP.write(MAGIC)
+        snapFP.write(numpy.int64(len(header)).tobytes())
+        snapFP.write(header)
+        for blobOffset, data in blobs:
+            snapFP.seek(dataStart + blobOffset)
+            snapFP.write(data)
+        snapFP.truncate(dataStart + offset)
+    os.replace(tmpPath, path)
+
+
+def readSnapshot(path):
+    """Return the meta dict and a dict of arrays from a snapshot file"""
+    with open(path, "rb") as snapFP:
+        if snapFP.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a GUTS snapshot file: {path}")
+        headerLen = int(numpy.frombuffer(snapFP.read(8), dtype=numpy.int64)[0])
+        header = json.loads(snapFP.read(headerLen))
+        dataStart = _aligned(len(MAGIC) + 8 + headerLen)
+
+        arrays = { }
+        for entry in header["arrays"]:
+            dtype = numpy.dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            offset = dataStart + entry["offset"]
+            if entry["compressed"]:
+                snapFP.seek(offset)
+                data = bytearray(zlib.decompress(snapFP.read(entry["nbytes"])))
+                array = numpy.frombuffer(data, dtype=dtype).reshape(shape)
+            elif entry["nbytes"] == 0:
+                array = numpy.empty(shape, dtype=dtype)
+            else:
+                # memmap takes an empty shape as the rest of the file
+                array = numpy.memmap(path, dtype=dtype, mode="c",
+                                     offset=offset,
+                                     shape=(int(numpy.prod(shape)),))
+                array = array.reshape(shape)
+            arrays[entry["name"]] = array
+    return header["meta"], arrays
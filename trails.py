@@ -0,0 +1,349 @@
+"""
+Body trail storage for the Trails, SphereTrails, Replay, Tubular and Snakes
+frame modes.
+
+TrailBuffer keeps the last length positions of every body in one
+preallocated (N x length x 3) ring, so adding a frame writes N points
+instead of copying the whole history.  All the trails are drawn by a
+single vispy Line from the ring's points() and segments(), the index pairs
+of the line segments.  Each ring slot has one segment, from its point to
+the next slot's point.  The segment of the newest point, which would join
+it to the oldest, and those of empty slots join a point to itself and draw
+nothing, so adding a frame also changes only N segments.
+
+TubeBuffer does the same for the Tubular mode's tubes, with a ring of
+vertices around each trail point and the triangles joining it to the next
+point's ring, drawn by a single guts_tubes.TubeMesh.  Rings are only built
+for new points, their shading is baked into the vertex colors with a fixed
+light so no normals are computed.  The buffers are slot major and the
+slots written since the last draw are reported, so only those are uploaded
+to the GPU.
+
+SnakeBuffer keeps the Snakes mode's body markers of the last length
+frames, positions, sizes and colors, for a single vispy Markers.
+"""
+
+import numpy
+
+
+class TrailBuffer(object):
+
+    def __init__(self, bodyCount, length):
+        super().__init__()
+
+        self.length = max(int(length), 2)
+        self._points = numpy.zeros((bodyCount, self.length, 3),
+                                   dtype=numpy.float32)
+        self._segments = self._emptySegments(bodyCount, self.length)
+        self._head  = 0     # slot of the next point
+        self._count = 0     # points in each trail
+
+    def append(self, positions):
+        """Add the newest position of every body, dropping the oldest once
+        the trails are full"""
+        slot = self._head
+        self._points[:, slot] = positions
+        if self._count > 0:
+            prev = (slot - 1) % self.length
+            self._segments[:, prev, 1] = self._segments[:, slot, 0]
+        self._segments[:, slot, 1] = self._segments[:, slot, 0]
+        self._head = (slot + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+
+    def bodyCount(self):
+        return self._points.shape[0]
+
+    def count(self):
+        """Points in each trail"""
+        return self._count
+
+    def ordered(self):
+        """(N x count x 3) copy of the trails, oldest point first"""
+        return self._points[:, self._slots()]
+
+    def points(self):
+        """(N * length x 3) view of every trail point in ring order"""
+        return self._points.reshape(-1, 3)
+
+    def resize(self, length):
+        """Change the trail length, keeping the newest points"""
+        length = max(int(length), 2)
+        if length == self.length:
+            return
+        keep = self._slots()[-length:]
+        bodyCount = self._points.shape[0]
+        points = numpy.zeros((bodyCount, length, 3), dtype=numpy.float32)
+        points[:, :keep.shape[0]] = self._points[:, keep]
+        self._points = points
+        self._segments = self._emptySegments(bodyCount, length)
+        if keep.shape[0] > 1:
+            self._segments[:, :keep.shape[0] - 1, 1] += 1
+        self.length = length
+        self._count = keep.shape[0]
+        self._head = self._count % length
+
+    def segments(self):
+        """(N * length x 2) view of the indexes into points() of every line
+        segment, unused segments are zero length"""
+        return self._segments.reshape(-1, 2)
+
+    def _emptySegments(self, bodyCount, length):
+        """Segments of every slot joining its point to itself"""
+        segs = numpy.empty((bodyCount, length, 2), dtype=numpy.uint32)
+        segs[..., 0] = numpy.arange(bodyCount * length,
+                                    dtype=numpy.uint32).reshape(bodyCount,
+                                                                length)
+        segs[..., 1] = segs[..., 0]
+        return segs
+
+    def _slots(self):
+        """Ring slots of the trail points, oldest first"""
+        first = (self._head - self._count) % self.length
+        return (first + numpy.arange(self._count, dtype=numpy.uint32)) % \
+            self.length
+
+
+class SnakeBuffer(object):
+
+    def __init__(self, bodyCount, length):
+        super().__init__()
+
+        self.length = max(int(length), 1)
+        self._points = numpy.zeros((self.length, bodyCount, 3),
+                                   dtype=numpy.float32)
+        self._sizes  = numpy.zeros((self.length, bodyCount),
+                                   dtype=numpy.float32)
+        self._colors = numpy.ones((self.length, bodyCount, 4),
+                                  dtype=numpy.float32)
+        self._head  = 0     # slot of the next frame
+        self._count = 0     # frames kept
+
+    def append(self, positions, sizes, colors):
+        """Add the newest frame of body markers, dropping the oldest once
+        the buffer is full"""
+        slot = self._head
+        self._points[slot] = positions
+        self._sizes[slot] = numpy.reshape(sizes, -1)
+        self._colors[slot, :, :colors.shape[1]] = colors
+        if colors.shape[1] == 3:
+            self._colors[slot, :, 3] = 1.0
+        self._head = (slot + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+
+    def bodyCount(self):
+        return self._points.shape[1]
+
+    def colors(self, fade=False):
+        """(count * N x 4) marker colors in ring order, a copy with the
+        alpha falling with the marker's age if fade"""
+        colors = self._colors[:self._count]
+        if fade:
+            ages = (self._head - 1 - numpy.arange(self._count)) % self.length
+            colors = colors.copy()
+            colors[..., 3] *= (1.0 - ages / self.length)[:, numpy.newaxis]
+        return colors.reshape(-1, 4)
+
+    def count(self):
+        """Frames kept"""
+        return self._count
+
+    def points(self):
+        """(count * N x 3) view of the marker positions in ring order"""
+        return self._points[:self._count].reshape(-1, 3)
+
+    def resize(self, length):
+        """Change the number of frames kept, keeping the newest"""
+        length = max(int(length), 1)
+        if length == self.length:
+            return
+        first = (self._head - self._count) % self.length
+        keep = ((first + numpy.arange(self._count)) % self.length)[-length:]
+        for name in ("_points", "_sizes", "_colors"):
+            old = getattr(self, name)
+            new = numpy.ones((length,) + old.shape[1:], dtype=numpy.float32)
+            new[:keep.shape[0]] = old[keep]
+            setattr(self, name, new)
+        self.length = length
+        self._count = keep.shape[0]
+        self._head = self._count % length
+
+    def sizes(self):
+        """(count * N) view of the marker sizes in ring order"""
+        return self._sizes[:self._count].reshape(-1)
+
+
+class TubeBuffer(object):
+
+    LIGHT = numpy.array([0.3, 0.5, 0.8]) / numpy.linalg.norm([0.3, 0.5, 0.8])
+
+    def __init__(self, bodyCount, length, radii, colors, sides=8):
+        """Tubes of up to length rings for bodyCount bodies, each with a
+        radius and an RGBA color"""
+        super().__init__()
+
+        self.length = max(int(length), 2)
+        self.sides  = max(int(sides), 3)
+        self._bodyCount = bodyCount
+        self._radii  = numpy.asarray(radii, dtype=numpy.float32)
+        self._colors = numpy.asarray(colors, dtype=numpy.float32)
+        angles = numpy.linspace(0.0, 2.0 * numpy.pi, self.sides,
+                                endpoint=False)
+        self._cos = numpy.cos(angles)[:, numpy.newaxis]
+        self._sin = numpy.sin(angles)[:, numpy.newaxis]
+
+        # Slot major, so each slot's rings and triangles are one range
+        ringShape = (self.length, bodyCount, self.sides)
+        self._vertices = numpy.zeros(ringShape + (3,), dtype=numpy.float32)
+        self._vertColors = numpy.zeros(ringShape + (4,), dtype=numpy.float32)
+        self._faces = self._emptyFaces(self.length)
+        self._changed = None     # slots written since changedSlots, or all
+
+        # Newest point and ring frame of each body, frames follow the
+        # trails by parallel transport so the tubes do not twist
+        self._last      = numpy.zeros((bodyCount, 3))
+        self._normals   = numpy.zeros((bodyCount, 3))
+        self._binormals = numpy.zeros((bodyCount, 3))
+        self._head  = 0     # slot of the next ring
+        self._count = 0     # rings in each tube
+
+    def append(self, positions):
+        """Add a ring at the newest position of every body, dropping the
+        oldest once the tubes are full.  The first point's ring is made
+        with the second, once the tube has a direction."""
+        slot = self._head
+        self._faces[slot] = self._faces[slot, :, :1, :1]
+        self._markChanged(slot)
+        if self._count > 0:
+            prev = (slot - 1) % self.length
+            self._turnFrames(positions - self._last)
+            if self._count == 1:
+                self._setRing(prev, self._last)
+            self._setRing(slot, positions)
+            self._joinRings(prev, slot)
+            self._markChanged(prev)
+        self._last[:] = positions
+        self._head = (slot + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+
+    def changedSlots(self):
+        """Slots whose vertices, colors or triangles changed since the last
+        call, None when everything did"""
+        changed = self._changed
+        self._changed = set()
+        return None if changed is None else sorted(changed)
+
+    def colors(self):
+        """(V x 4) view of the shaded vertex colors"""
+        return self._vertColors.reshape(-1, 4)
+
+    def count(self):
+        """Rings in each tube"""
+        return self._count
+
+    def faces(self):
+        """(F x 3) view of the vertex indexes of every triangle, unused
+        triangles are a single vertex"""
+        return self._faces.reshape(-1, 3)
+
+    def resize(self, length):
+        """Change the tube length, keeping the newest rings"""
+        length = max(int(length), 2)
+        if length == self.length:
+            return
+        first = (self._head - self._count) % self.length
+        keep = (first + numpy.arange(self._count)) % self.length
+        keep = keep[-length:]
+        vertices = numpy.zeros((length,) + self._vertices.shape[1:],
+                               dtype=numpy.float32)
+        vertices[:keep.shape[0]] = self._vertices[keep]
+        vertColors = numpy.zeros((length,) + self._vertColors.shape[1:],
+                                 dtype=numpy.float32)
+        vertColors[:keep.shape[0]] = self._vertColors[keep]
+        self._vertices = vertices
+        self._vertColors = vertColors
+        self._faces = self._emptyFaces(length)
+        self.length = length
+        for ring in range(keep.shape[0] - 1):
+            self._joinRings(ring, ring + 1)
+        self._count = keep.shape[0]
+        self._head = self._count % length
+        self._changed = None
+
+    def slotFaceCount(self):
+        """Triangles of each slot in faces()"""
+        return self._bodyCount * 2 * self.sides
+
+    def slotVertexCount(self):
+        """Vertices of each slot in vertices() and colors()"""
+        return self._bodyCount * self.sides
+
+    def vertices(self):
+        """(V x 3) view of every tube vertex, slot by slot"""
+        return self._vertices.reshape(-1, 3)
+
+    def _emptyFaces(self, length):
+        """Triangles of every slot made of its ring's first vertex"""
+        bodyCount = self._bodyCount
+        firsts = numpy.arange(length * bodyCount, dtype=numpy.uint32)
+        firsts *= self.sides
+        faces = numpy.empty((length, bodyCount, 2 * self.sides, 3),
+                            dtype=numpy.uint32)
+        faces[:] = firsts.reshape(length, bodyCount, 1, 1)
+        return faces
+
+    def _joinRings(self, fromSlot, toSlot):
+        """Triangles of the tube wall from one slot's ring to the next"""
+        sides = self.sides
+        side = numpy.arange(sides, dtype=numpy.uint32)
+        nextSide = (side + 1) % sides
+        bodies = numpy.arange(self._bodyCount, dtype=numpy.uint32)
+        bodies = bodies[:, numpy.newaxis]
+        a0 = (fromSlot * self._bodyCount + bodies) * sides
+        b0 = (toSlot * self._bodyCount + bodies) * sides
+        faces = self._faces[fromSlot]
+        faces[:, :sides, 0] = a0 + side
+        faces[:, :sides, 1] = a0 + nextSide
+        faces[:, :sides, 2] = b0 + side
+        faces[:, sides:, 0] = a0 + nextSide
+        faces[:, sides:, 1] = b0 + nextSide
+        faces[:, sides:, 2] = b0 + side
+
+    def _markChanged(self, slot):
+        if self._changed is not None:
+            self._changed.add(slot)
+
+    def _setRing(self, slot, centers):
+        """Vertices and shaded colors of each body's ring at slot"""
+        radial = self._cos * self._normals[:, numpy.newaxis] + \
+            self._sin * self._binormals[:, numpy.newaxis]
+        self._vertices[slot] = centers[:, numpy.newaxis] + \
+            radial * self._radii[:, numpy.newaxis, numpy.newaxis]
+        shade = 0.55 + 0.45 * numpy.clip(radial @ self.LIGHT, 0.0, 1.0)
+        colors = self._vertColors[slot]
+        colors[:] = self._colors[:, numpy.newaxis]
+        colors[..., :3] *= shade[..., numpy.newaxis]
+
+    def _turnFrames(self, moves):
+        """Turn each body's ring frame to face along its move, bodies that
+        did not move keep their frame"""
+        lengths = numpy.linalg.norm(moves, axis=1)
+        moving = lengths > 0.0
+        if not moving.any():
+            return
+        tangents = moves[moving] / lengths[moving, numpy.newaxis]
+        normals = self._normals[moving]
+        normals -= numpy.sum(normals * tangents, axis=1)[:, numpy.newaxis] * \
+            tangents
+        normLens = numpy.linalg.norm(normals, axis=1)
+        lost = normLens < 1.0e-6     # new tubes, or turned straight back
+        if lost.any():
+            across = numpy.cross(tangents[lost], [0.0, 0.0, 1.0])
+            acrossLens = numpy.linalg.norm(across, axis=1)
+            alongZ = acrossLens < 1.0e-6
+            across[alongZ] = numpy.cross(tangents[lost][alongZ],
+                                         [1.0, 0.0, 0.0])
+            normals[lost] = across
+            normLens[lost] = numpy.linalg.norm(across, axis=1)
+        normals /= normLens[:, numpy.newaxis]
+        self._normals[moving] = normals
+        self._binormals[moving] = numpy.cross(tangents, normals)
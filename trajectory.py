@@ -0,0 +1,228 @@
+"""
+Append only trajectory files of body positions, one frame per step.
+
+A trajectory file starts with a 32 byte header, magic, version and two
+reserved words.  Each frame follows as a 32 byte frame header, time, body
+count, flags and a reserved word, then the (N x 3) float64 positions.  Body
+sizes (N) and colors (N x 3) follow the positions only in frames flagged
+FRAME_ATTRS, written on the first frame and whenever they change, as bodies
+merge.  Every field is 8 byte aligned, so frames are read straight out of a
+memory map with no copying.
+
+A sidecar index file, the trajectory path plus ".idx", holds two int64 per
+frame, the frame's byte offset and the number of the frame holding its sizes
+and colors.  The index can be rebuilt by scanning the trajectory file.
+
+The writer buffers frames and flushes them at most once every
+FLUSH_SECONDS and on close, so recording does not stall on every frame
+while a file being recorded can still be followed by a reader.  Index
+entries are held until the frames they point to are flushed, so the index
+never gets ahead of the trajectory file, even after a crash.
+"""
+
+import mmap
+import os
+from time import perf_counter
+
+import numpy
+
+
+MAGIC        = b"GUTSTRJ\0"
+VERSION      = 1
+HEADER_BYTES = 32
+FRAME_BYTES  = 32     # frame header size
+FRAME_ATTRS  = 1      # frame holds sizes and colors
+
+INDEX_SUFFIX = ".idx"
+
+
+def indexPath(path):
+    return path + INDEX_SUFFIX
+
+
+class TrajectoryWriter(object):
+
+    BUFFER_BYTES  = 1024 * 1024
+    FLUSH_SECONDS = 1.0     # longest time written frames stay unflushed
+
+    def __init__(self, path):
+        super().__init__()
+
+        self.path = path
+        self._file = open(path, "wb", buffering=self.BUFFER_BYTES)
+        self._indexFile = open(indexPath(path), "wb")
+        header = numpy.zeros(3, dtype=numpy.int64)
+        header[0] = VERSION
+        self._file.write(MAGIC + header.tobytes())
+        self._file.flush()
+
+        self._offset = HEADER_BYTES
+        self._frameCount = 0
+        self._attrsFrame = -1
+        self._lastSizes = None
+        self._lastColors = None
+        self._indexRows = [ ]     # index entries of the unflushed frames
+        self._lastFlush = perf_counter()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._indexFile.close()
+            self._file = None
+            self._indexFile = None
+
+    def flush(self):
+        """Write out buffered frames, data before the index so the index
+        never holds a frame that is not in the file"""
+        self._file.flush()
+        if self._indexRows:
+            self._indexFile.write(b"".join(self._indexRows))
+            self._indexRows.clear()
+        self._indexFile.flush()
+        self._lastFlush = perf_counter()
+
+    def frameCount(self):
+        return self._frameCount
+
+    def writeFrame(self, time, positions, sizes, colors):
+        """Append one frame.  Sizes and colors are only written when they
+        differ from the last written ones."""
+        bodyCount = positions.shape[0]
+        writeAttrs = self._lastSizes is None or \
+            self._lastSizes.shape[0] != bodyCount or \
+            not numpy.array_equal(self._lastSizes, sizes) or \
+            not numpy.array_equal(self._lastColors, colors)
+
+        header = numpy.zeros(4, dtype=numpy.int64)
+        header[1] = bodyCount
+        header[2] = FRAME_ATTRS if writeAttrs else 0
+        header[:1].view(numpy.float64)[0] = time
+        chunks = [ header, numpy.ascontiguousarray(positions, numpy.float64) ]
+        if writeAttrs:
+            self._lastSizes = numpy.array(sizes, dtype=numpy.float64)
+            self._lastColors = numpy.array(colors, dtype=numpy.float64)
+            chunks.append(self._lastSizes)
+            chunks.append(self._lastColors)
+            self._attrsFrame = self._frameCount
+
+        self._indexRows.append(numpy.array([self._offset, self._attrsFrame],
+                                           dtype=numpy.int64).tobytes())
+        for chunk in chunks:
+            self._file.write(memoryview(chunk).cast("B"))
+            self._offset += chunk.nbytes
+        self._frameCount += 1
+        if perf_counter() - self._lastFlush >= self.FLUSH_SECONDS:
+            self.flush()
+
+
+class TrajectoryReader(object):
+    """Random access to the frames of a trajectory file through a read only
+    memory map.  Arrays returned by frame are read only views of the map,
+    the map is released once the reader and all views are gone."""
+
+    def __init__(self, path):
+        super().__init__()
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = None
+        self._index = numpy.empty((0, 2), dtype=numpy.int64)
+        self.refresh()
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a GUTS trajectory file: {path}")
+
+    def close(self):
+        # Frame views may still use the map, it unmaps when they are freed
+        self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def frame(self, frameNum):
+        """Return time, positions, sizes and colors of a frame"""
+        offset, attrsFrame = self._index[frameNum]
+        time, bodyCount, flags = self._frameHeader(offset)
+        positions = numpy.ndarray((bodyCount, 3), dtype=numpy.float64,
+                                  buffer=self._map,
+                                  offset=int(offset) + FRAME_BYTES)
+
+        attrsOffset = int(self._index[attrsFrame][0])
+        attrsCount = self._frameHeader(attrsOffset)[1]
+        attrsOffset += FRAME_BYTES + attrsCount * 3 * 8
+        sizes = numpy.ndarray((attrsCount,), dtype=numpy.float64,
+                              buffer=self._map, offset=attrsOffset)
+        colors = numpy.ndarray((attrsCount, 3), dtype=numpy.float64,
+                               buffer=self._map,
+                               offset=attrsOffset + attrsCount * 8)
+        return time, positions, sizes, colors
+
+    def frameCount(self):
+        return self._index.shape[0]
+
+    def refresh(self):
+        """Map frames appended since the reader was opened, so a file that
+        is still being recorded can be followed"""
+        fileSize = os.fstat(self._file.fileno()).st_size
+        if self._map is not None and len(self._map) == fileSize:
+            return
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._loadIndex(fileSize)
+
+    def _frameHeader(self, offset):
+        header = numpy.ndarray((4,), dtype=numpy.int64, buffer=self._map,
+                               offset=int(offset))
+        return header[:1].view(numpy.float64)[0], int(header[1]), \
+            int(header[2])
+
+    def _frameSize(self, bodyCount, flags):
+        size = FRAME_BYTES + bodyCount * 3 * 8
+        if flags & FRAME_ATTRS:
+            size += bodyCount * 4 * 8
+        return size
+
+    def _loadIndex(self, fileSize):
+        """Read the sidecar index, then scan for any frames it is missing"""
+        index = self._index
+        try:
+            sidecar = numpy.fromfile(indexPath(self.path), dtype=numpy.int64)
+            sidecar = sidecar[:sidecar.shape[0] // 2 * 2].reshape(-1, 2)
+            if sidecar.shape[0] > index.shape[0]:
+                index = sidecar
+        except OSError:
+            pass
+
+        # Drop entries past the end of the mapped data, then scan on
+        while index.shape[0] > 0:
+            offset = int(index[-1][0])
+            if offset + FRAME_BYTES <= fileSize:
+                bodyCount, flags = self._frameHeader(offset)[1:]
+                if offset + self._frameSize(bodyCount, flags) <= fileSize:
+                    break
+            index = index[:-1]
+
+        rows = [ ]
+        if index.shape[0] > 0:
+            offset = int(index[-1][0])
+            bodyCount, flags = self._frameHeader(offset)[1:]
+            offset += self._frameSize(bodyCount, flags)
+            attrsFrame = int(index[-1][1])
+        else:
+            offset = HEADER_BYTES
+            attrsFrame = -1
+        frameNum = index.shape[0]
+        while offset + FRAME_BYTES <= fileSize:
+            bodyCount, flags = self._frameHeader(offset)[1:]
+            size = self._frameSize(bodyCount, flags)
+            if offset + size > fileSize:
+                break
+            if flags & FRAME_ATTRS:
+                attrsFrame = frameNum
+            rows.append((offset, attrsFrame))
+            offset += size
+            frameNum += 1
+
+        if rows:
+            index = numpy.vstack([index, numpy.array(rows, dtype=numpy.int64)])
+        self._index = index